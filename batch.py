@@ -0,0 +1,161 @@
+"""Steps many independent headless matches in lockstep, with NumPy actions and observations.
+
+Every match keeps its own pymunk space, which is stepped in a Python loop over the matches: what is batched is
+the bookkeeping around the physics. Actions are converted to target velocities for every robot at once, and
+observations are written in place into arrays allocated once (one assignment per match and array, reading
+the bodies straight from chipmunk), so the cost per step is the physics plus a small Python cost per robot,
+not the program machinery of a Match.
+
+Example:
+    sim = BatchSim(64)
+    obs = sim.reset(seeds=range(64))
+    actions = np.zeros((64, sim.robotCount, 3))
+    actions[:, :, 0] = 500  # speed
+    for _ in range(1000):
+        actions[:, :, 1] = policy(obs)  # direction
+        obs = sim.step(actions)
+"""
+
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+from pymunk._chipmunk_cffi import lib
+
+from scenario import ScenarioTemplate, resolve_scenario
+from simulation import Match
+
+
+class BatchSim:
+    """K independent matches whose robots are driven by an action array instead of programs.
+
+    Observations are written into arrays that are allocated once, in `__init__`, and reused for every step
+    (the arrays returned by `reset` and `step` are always the same objects, copy them to keep a history).
+
+    Attributes:
+        robotCount: Number of robots (R) in every match, both teams together.
+        robotTeams: (R,) array of the team of every robot, 0 for own robots, 1 for opponents.
+        ballPosition: (K, 2) array of ball positions.
+        ballVelocity: (K, 2) array of ball velocities.
+        robotPositions: (K, R, 2) array of robot positions, robots in Match order.
+        robotAngles: (K, R) array of robot body angles (in radians).
+        TOFReadings: (K, R, 4) array of TOF sensor readings, see Robot.
+        dribbleState: (K, R) array of dribbler states, see Robot.
+        score: (K, 2) array of goals scored, as [own, opponent].
+    """
+
+    def __init__(
+        self,
+        size: int,
+        auto_dribble: bool = True,
+        scenario: Union[str, ScenarioTemplate, None] = None,
+    ):
+        """
+        Args:
+            size: Number of matches (K) to step in lockstep.
+            auto_dribble: Whether every robot dribbles the ball whenever it is in a catchment area,
+                as there is no dribble action.
+            scenario: The scenario every match is played in (see Match), the default scenario if not given.
+        """
+
+        self.size = size
+        self.autoDribble = auto_dribble
+        self.scenario = resolve_scenario(scenario)
+        self.matches: List[Match] = []
+
+        # the arrays are sized from a match of the scenario, as its teams can have any number of robots
+        match = self._new_match(None)
+        self.robotCount = len(match.robots)
+        self.robotTeams = np.array(
+            [0 if robot in match.teams[0] else 1 for robot in match.robots],
+            dtype=np.int8,
+        )
+
+        # observations, the bodies as views of a single array written once per match (see Match.read_bodies)
+        self._bodies = np.zeros((size, 1 + self.robotCount, 6))
+        self.ballPosition = self._bodies[:, 0, 0:2]
+        self.ballVelocity = self._bodies[:, 0, 2:4]
+        self.robotPositions = self._bodies[:, 1:, 0:2]
+        self.robotAngles = self._bodies[:, 1:, 4]
+        self.TOFReadings = np.zeros((size, self.robotCount, 4))
+        self.dribbleState = np.zeros((size, self.robotCount), dtype=np.int8)
+        self.score = np.zeros((size, 2), dtype=np.int32)
+        self.observations: Dict[str, np.ndarray] = {
+            "ballPosition": self.ballPosition,
+            "ballVelocity": self.ballVelocity,
+            "robotPositions": self.robotPositions,
+            "robotAngles": self.robotAngles,
+            "TOFReadings": self.TOFReadings,
+            "dribbleState": self.dribbleState,
+            "score": self.score,
+        }
+
+        # scratch buffers for the actions
+        self._sin = np.zeros((size, self.robotCount))
+        self._cos = np.zeros((size, self.robotCount))
+        self._targets = np.zeros((size, self.robotCount, 3))
+
+    def reset(
+        self, seeds: Optional[Iterable[Optional[int]]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Starts K new matches.
+
+        Args:
+            seeds: One seed per match (see Match), defaults to no seeds.
+
+        Returns: The observation arrays, keyed by attribute name.
+        """
+
+        seeds = [None] * self.size if seeds is None else list(seeds)
+        if len(seeds) != self.size:
+            raise ValueError(f"expected {self.size} seeds, got {len(seeds)}")
+        self.matches = [self._new_match(seed) for seed in seeds]
+        self._observe()
+        return self.observations
+
+    def _new_match(self, seed: Optional[int]) -> Match:
+        """Returns a new match of the scenario, without programs."""
+
+        return Match({}, None, None, None, None, seed, scenario=self.scenario)
+
+    def step(self, actions: np.ndarray) -> Dict[str, np.ndarray]:
+        """Applies one action per robot and advances every match by one physics step.
+
+        Args:
+            actions: A (K, R, 3) array of [speed, direction, turn angle] per robot,
+                as passed to Robot.move and Robot.turn.
+
+        Returns: The observation arrays, keyed by attribute name.
+        """
+
+        if actions.shape != (self.size, self.robotCount, 3):
+            raise ValueError(
+                f"expected actions of shape {(self.size, self.robotCount, 3)}, got {actions.shape}"
+            )
+
+        # (vx, vy, angle) of the target body of every robot, vx and vy as from make_vec_from_polar
+        np.sin(actions[:, :, 1], out=self._sin)
+        np.cos(actions[:, :, 1], out=self._cos)
+        np.multiply(self._sin, actions[:, :, 0], out=self._targets[:, :, 0])
+        np.multiply(self._cos, actions[:, :, 0], out=self._targets[:, :, 1])
+        self._targets[:, :, 2] = actions[:, :, 2]
+
+        for match, targets in zip(self.matches, self._targets.tolist()):
+            for robot, (vx, vy, angle) in zip(match.robots, targets):
+                body = robot.targetPointBody._body
+                lib.cpBodySetVelocity(body, (vx, vy))
+                lib.cpBodySetAngle(body, angle)
+                if self.autoDribble:
+                    match.dribble(robot)
+            match.physics_step()
+
+        self._observe()
+        return self.observations
+
+    def _observe(self) -> None:
+        """Writes the state of every match into the observation arrays."""
+
+        for k, match in enumerate(self.matches):
+            self._bodies[k] = match.read_bodies()
+            self.dribbleState[k] = [robot.dribbleState for robot in match.robots]
+            self.score[k] = match.score
+            self.TOFReadings[k] = match.tofSensors.update(match.steps)
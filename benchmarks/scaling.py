@@ -0,0 +1,170 @@
+"""Measures how the cost of a step grows with the number of robots, with either broadphase of the space.
+
+For every team size, both teams are spread over their half of the default field, scaled so that every robot has
+as much room as in a 2v2 match (or the standard field with --fixed-field), and every robot chases the ball while
+keeping clear of the nearest robot (found with Observation.neighbours). Each team size is played with pymunk's
+bounding box tree and with a spatial hash of each --dims cell size, and the best mean time of a step is reported,
+along with the time of space.step alone (the part the broadphase changes, from Timings).
+
+Run from the root of the repository:
+    python -m benchmarks.scaling
+    python -m benchmarks.scaling --robots 2 5 11 20 --dims 30 60 120
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import timeit
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import program
+from scenario import SCENARIO_DIR, ScenarioTemplate, compile_scenario
+from simulation import SPATIAL_HASH_CELLS, SPATIAL_HASH_DIM, Match
+from timings import Timings
+from tools import *
+
+# where the robots of the own team spawn on the standard field, as (left, bottom, right, top)
+SPAWN_AREA = (110, 100, 436, 330)
+# distance from another robot below which a robot steers away from it, and its speed
+SPACING = 90
+CHASE_SPEED = 400
+
+
+@uses_observation
+def chase(observation: Observation) -> None:
+    """Every robot runs at the ball and dribbles, steering away from the nearest robot within SPACING."""
+
+    for robot, idx in zip(observation.robots, observation.indices):
+        x, y = observation.ballVectors[idx] / max(observation.ballDistances[idx], 1)
+        near = observation.neighbours(robot, SPACING)
+        if near:
+            other, distance = near[0]
+            away = observation.positions[idx] - observation.positions[other]
+            x, y = (x, y) + away / max(distance, 1) * (1 - distance / SPACING)
+        robot.move(CHASE_SPEED, (math.pi / 2 - math.atan2(y, x)) % (2 * math.pi))
+        observation.dribble(robot)
+
+
+def spawns(count: int) -> List[List[float]]:
+    """Returns the spawns of a team of count robots on a grid over SPAWN_AREA (for the own team)."""
+
+    left, bottom, right, top = SPAWN_AREA
+    columns = math.ceil(math.sqrt(count * (right - left) / (top - bottom)))
+    rows = math.ceil(count / columns)
+    points = [
+        [
+            left + (right - left) * (column + 0.5) / columns,
+            bottom + (top - bottom) * (row + 0.5) / rows,
+        ]
+        for row in range(rows)
+        for column in range(columns)
+    ]
+    return points[:count]
+
+
+def team_scenario(perTeam: int, fixed_field: bool = False) -> ScenarioTemplate:
+    """Returns the default scenario with perTeam robots a side.
+
+    Args:
+        perTeam: Number of robots of each team.
+        fixed_field: Whether to keep the standard field, instead of scaling it with the number of robots.
+    """
+
+    with open(os.path.join(SCENARIO_DIR, "default.json")) as file:
+        spec = json.load(file)
+    own = spawns(perTeam)
+    spec["teams"][0]["spawns"] = own
+    # the opponents mirror the own team across the halfway line
+    spec["teams"][1]["spawns"] = [[x, spec["field"]["height"] - y] for x, y in own]
+    spec["scale"] = 1 if fixed_field else max(1, math.sqrt(perTeam / 2))
+    return compile_scenario(spec, f"{perTeam}v{perTeam}")
+
+
+def time_step(
+    scenario: ScenarioTemplate, dim: Optional[float], steps: int, repeats: int
+) -> Tuple[float, float]:
+    """Returns the best mean time of a step and of its physics (in seconds) over a number of seeded matches.
+
+    Args:
+        scenario: The scenario to play.
+        dim: Cell size of the spatial hash, None for the bounding box tree.
+        steps: Number of physics steps per match.
+        repeats: Number of seeded matches.
+    """
+
+    best = physics = float("inf")
+    for seed in range(repeats):
+        match = Match(
+            program.CONFIG,
+            chase,
+            program.defend,
+            chase,
+            program.o_defend,
+            seed=seed,
+            scenario=scenario,
+            spatial_hash=False,
+        )
+        if dim is not None:
+            match.space.use_spatial_hash(
+                dim, SPATIAL_HASH_CELLS * len(match.space.shapes)
+            )
+        match.timings = Timings(window=steps)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start_time = timeit.default_timer()
+            match.run(steps)
+            best = min(best, (timeit.default_timer() - start_time) / steps)
+        physics = min(physics, match.timings.stats()["physics"]["mean"])
+    return best, physics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--robots",
+        nargs="+",
+        type=int,
+        default=[1, 2, 3, 5, 8, 11, 16],
+        help="robots per team",
+    )
+    parser.add_argument(
+        "--dims",
+        nargs="+",
+        type=float,
+        default=[SPATIAL_HASH_DIM],
+        help="cell sizes of the spatial hash to try",
+    )
+    parser.add_argument("--steps", type=int, default=60 * 10)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--fixed-field",
+        action="store_true",
+        help="play every team size on the standard field",
+    )
+    args = parser.parse_args()
+
+    columns = ["bb tree"] + [f"hash {dim:g}" for dim in args.dims]
+    print("step (physics) in us, per broadphase")
+    print(f"{'robots':>6} {'field':>9} " + " ".join(f"{name:>17}" for name in columns))
+    for perTeam in args.robots:
+        scenario = team_scenario(perTeam, args.fixed_field)
+        times = [
+            time_step(scenario, dim, args.steps, args.repeats)
+            for dim in [None] + args.dims
+        ]
+        field = f"{scenario.width:.0f}x{scenario.height:.0f}"
+        fastest = columns[int(np.argmin([physics for _, physics in times]))]
+        print(
+            f"{2 * perTeam:>6} {field:>9} "
+            + " ".join(
+                f"{step * 1e6:>8.1f} ({physics * 1e6:>6.1f})" for step, physics in times
+            )
+            + f"  (fastest physics: {fastest})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Headless benchmark suite: runs fixed, seeded scenarios and compares them against a JSON baseline.
+
+Every scenario is a scenario file (see scenario.py) played by either the empty programs of program.py or the
+example line-up. For every scenario, reports physics steps per second and program time per step (all four
+programs, timed with Timings), each the best of a number of seeded runs, peak memory (from tracemalloc, building
+the Match included) and the time taken to build a Match.
+
+Run from the root of the repository:
+    python -m benchmarks.suite --save baseline.json
+    (make changes)
+    python -m benchmarks.suite --baseline baseline.json
+
+With --baseline, results worse than the baseline by more than --threshold are flagged as regressions and the
+exit status is 1. Baselines are only comparable on the same machine, with the same --steps.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pymunk
+
+import example
+import examples.opponent
+import examples.own
+import program
+from simulation import Match
+from timings import Timings
+
+EMPTY_PROGRAMS = (
+    program.CONFIG,
+    program.attack,
+    program.defend,
+    program.o_attack,
+    program.o_defend,
+)
+EXAMPLE_PROGRAMS = (
+    example.CONFIG,
+    examples.own.attack,
+    examples.own.defend,
+    examples.opponent.o_attack,
+    examples.opponent.o_defend,
+)
+PROGRAM_PHASES = ("attack", "defend", "o_attack", "o_defend")
+# result fields, and whether a higher value is better
+METRICS = {
+    "stepsPerSecond": True,
+    "programTime": False,
+    "peakMemory": False,
+    "buildTime": False,
+}
+
+
+def scenario_match(
+    scenario: str, programs: Tuple, description: str
+) -> Callable[[int], Match]:
+    """Returns a function building a Match of a scenario file (see scenario.py) with the given programs."""
+
+    def build(seed: int) -> Match:
+        return Match(*programs, seed=seed, scenario=scenario)
+
+    build.__doc__ = description
+    return build
+
+
+# empty programs (from program.py) measure only the physics and sensors
+SCENARIOS: Dict[str, Callable[[int], Match]] = {
+    "empty": scenario_match("default", EMPTY_PROGRAMS, "Empty programs."),
+    "examples": scenario_match(
+        "default", EXAMPLE_PROGRAMS, "The full example.py line-up."
+    ),
+    "ball in corner": scenario_match(
+        "ball_in_corner", EMPTY_PROGRAMS, "The ball rolling into a corner."
+    ),
+    "ball on slope": scenario_match(
+        "ball_on_slope", EMPTY_PROGRAMS, "The ball rolling along a slope."
+    ),
+    "crowded goalmouth": scenario_match(
+        "crowded_goal", EXAMPLE_PROGRAMS, "The example line-up in front of a goal."
+    ),
+    "corner kick": scenario_match(
+        "corner_kick", EXAMPLE_PROGRAMS, "The example line-up at a corner kick."
+    ),
+    "penalty": scenario_match(
+        "penalty", EXAMPLE_PROGRAMS, "The example line-up at a penalty."
+    ),
+}
+
+
+def run_scenario(
+    scenario: Callable[[int], Match], steps: int, repeats: int
+) -> Dict[str, float]:
+    """Benchmarks a scenario.
+
+    Args:
+        scenario: Function building the Match of the scenario for a seed.
+        steps: Number of physics steps per run.
+        repeats: Number of seeded runs to take the best throughput of.
+
+    Returns: A dict of stepsPerSecond, programTime (seconds per step), peakMemory (bytes) and buildTime
+        (seconds to build the Match, from its cached ScenarioTemplate).
+    """
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        buildTime = float("inf")
+        for seed in range(max(repeats, 10)):
+            start_time = timeit.default_timer()
+            scenario(seed)
+            buildTime = min(buildTime, timeit.default_timer() - start_time)
+
+        best = float("inf")
+        for seed in range(repeats):
+            match = scenario(seed)
+            start_time = timeit.default_timer()
+            match.run(steps)
+            best = min(best, timeit.default_timer() - start_time)
+
+        # timing and tracing slow the simulation down, so they get runs of their own
+        programTime = float("inf")
+        for seed in range(repeats):
+            match = scenario(seed)
+            match.timings = Timings(window=steps)
+            match.run(steps)
+            stats = match.timings.stats()
+            programTime = min(
+                programTime,
+                sum(stats[phase]["mean"] for phase in PROGRAM_PHASES if phase in stats),
+            )
+
+        tracemalloc.start()
+        scenario(0).run(steps)
+        _, peakMemory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "stepsPerSecond": steps / best,
+        "programTime": programTime,
+        "peakMemory": peakMemory,
+        "buildTime": buildTime,
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Returns a description of every result worse than the baseline by more than a threshold.
+
+    Args:
+        results: Results of this run, by scenario.
+        baseline: Results of the baseline, by scenario (scenarios missing from either are skipped).
+        threshold: Allowed relative change, e.g. 0.1 for 10%.
+    """
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, higherIsBetter in METRICS.items():
+            if metric not in baseline[name]:
+                continue
+            old, new = baseline[name][metric], result[metric]
+            if old == 0:
+                continue
+            change = new / old - 1
+            if (-change if higherIsBetter else change) > threshold:
+                regressions.append(
+                    f"{name}: {metric} {old:.6g} -> {new:.6g} ({change:+.1%})"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=60 * 30)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS))
+    parser.add_argument(
+        "--save", metavar="FILE", help="write the results as a baseline"
+    )
+    parser.add_argument(
+        "--baseline", metavar="FILE", help="baseline to compare against"
+    )
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["steps"] != args.steps:
+            print(
+                f"warning: baseline was run with --steps {baseline['steps']}",
+                file=sys.stderr,
+            )
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        result = results[name] = run_scenario(SCENARIOS[name], args.steps, args.repeats)
+        print(
+            f"{name}: {result['stepsPerSecond']:.0f} steps/s, "
+            f"programs {result['programTime'] * 1e6:.1f}us/step, "
+            f"peak memory {result['peakMemory'] / 2 ** 20:.2f}MiB, "
+            f"built in {result['buildTime'] * 1e3:.2f}ms"
+        )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {
+                    "steps": args.steps,
+                    "python": platform.python_version(),
+                    "pymunk": pymunk.version,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if baseline is not None:
+        regressions = compare(results, baseline["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
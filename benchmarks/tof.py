@@ -0,0 +1,102 @@
+"""Measures what raycast TOF sensors cost per step, against the original coordinate-based readings.
+
+A match of the example line-up is played once to record the trajectory of every body, along with the mean time
+of a step. The trajectory is then replayed (bodies placed where they were, without simulating anything) into a
+match with each kind of sensors, and every sensor of every robot is read at every step, so both kinds read the
+same positions and the raycasts are counted for every robot, even those whose readings programs skip. The
+overhead is the extra time of the raycasts, relative to a whole step of the match.
+
+Run from the root of the repository (or as python benchmarks/tof.py):
+    python -m benchmarks.tof
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import timeit
+from typing import List, Tuple
+
+if __name__ == "__main__" and __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import example
+import examples.opponent
+import examples.own
+from simulation import Match
+
+PROGRAMS = (
+    example.CONFIG,
+    examples.own.attack,
+    examples.own.defend,
+    examples.opponent.o_attack,
+    examples.opponent.o_defend,
+)
+
+Trajectory = List[List[Tuple[float, float, float, float, float, float]]]
+
+
+def record(steps: int, seed: int) -> Tuple[Trajectory, float]:
+    """Plays a match of the example line-up.
+
+    Returns: A tuple of (the state of every body (see Match.read_bodies) before every step,
+        mean time of a step in seconds).
+    """
+
+    match = Match(*PROGRAMS, seed=seed)
+    trajectory = []
+    elapsed = 0.0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(steps):
+            trajectory.append(match.read_bodies())
+            start_time = timeit.default_timer()
+            match.step()
+            elapsed += timeit.default_timer() - start_time
+    return trajectory, elapsed / steps
+
+
+def time_readings(trajectory: Trajectory, raycast_tof: bool, seed: int) -> float:
+    """Returns the mean time (in seconds) of reading every sensor of every robot, along a trajectory."""
+
+    match = Match(*PROGRAMS, seed=seed, raycast_tof=raycast_tof)
+    bodies = [match.ball.body] + [robot.sprite.body for robot in match.robots]
+    elapsed = 0.0
+    for step, states in enumerate(trajectory):
+        for body, (x, y, vx, vy, angle, _) in zip(bodies, states):
+            body.position = x, y
+            body.velocity = vx, vy
+            body.angle = angle
+            match.space.reindex_shapes_for_body(body)
+        match.steps = step
+        match.sensors.clear()
+        start_time = timeit.default_timer()
+        match.sensors.tof()
+        elapsed += timeit.default_timer() - start_time
+    return elapsed / len(trajectory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=60 * 60)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    step = coordinates = raycast = float("inf")
+    for seed in range(args.repeats):
+        trajectory, stepTime = record(args.steps, seed)
+        step = min(step, stepTime)
+        coordinates = min(coordinates, time_readings(trajectory, False, seed))
+        raycast = min(raycast, time_readings(trajectory, True, seed))
+    print(f"step of the example programs: {step * 1e6:.1f}us")
+    print(
+        f"reading every sensor: coordinates {coordinates * 1e6:.1f}us, "
+        f"raycast {raycast * 1e6:.1f}us"
+    )
+    print(
+        f"overhead of raycasts: {(raycast - coordinates) * 1e6:.1f}us/step "
+        f"({(raycast - coordinates) / step * 100:+.1f}% of a step)"
+    )
+
+
+if __name__ == "__main__":
+    main()
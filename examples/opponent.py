@@ -6,6 +6,23 @@ import pymunk
 import example
 from tools import *
 
+# tuning constants, read by the programs on every run (see sweep.py to tune them)
+PARAMS = {
+    # factor of the curve offsetting the approach to the ball, by distance
+    "approachScale": 0.002,
+    "approachCurve": 6.7,
+    "approachRange": 850,
+    "attackSpeed": 500,
+    "goalieSpeed": 300,
+}
+# (low, high) of every parameter worth sweeping, integers for integer parameters
+PARAM_RANGES = {
+    "approachScale": (0.0005, 0.01),
+    "approachCurve": (4.0, 10.0),
+    "attackSpeed": (300, 700),
+    "goalieSpeed": (200, 500),
+}
+
 
 def o_attack(
     robots: List[Robot],
@@ -32,8 +49,15 @@ def o_attack(
         robots[0].sprite.body, ballPosition, robots[0].orientation
     )
     robots[0].direction = vec_to_world(relVec)
-    robots[0].speed = 500
-    factor = min(0.002 * (math.e ** (6.7 * (1 - relVec.length / 850))), 1)
+    robots[0].speed = PARAMS["attackSpeed"]
+    factor = min(
+        PARAMS["approachScale"]
+        * (
+            math.e
+            ** (PARAMS["approachCurve"] * (1 - relVec.length / PARAMS["approachRange"]))
+        ),
+        1,
+    )
     robots[0].chaseState = 1
     robots[0].direction -= math.pi
     if robots[0].direction >= 0:
@@ -85,7 +109,7 @@ def o_defend(
         robots[1].orientation,
     )
     robots[1].direction = vec_to_world(relVec)
-    robots[1].speed = 300
+    robots[1].speed = PARAMS["goalieSpeed"]
     robots[1].move(robots[1].speed, robots[1].direction + robots[1].orientation)
 
     robots[1].turn(0)
@@ -9,6 +9,39 @@ from tools import *
 attackRobot = 0
 defenseRobot = 1
 
+# tuning constants, read by the programs on every run (see sweep.py to tune them)
+PARAMS = {
+    # factor of the curve offsetting the approach to the ball, by distance
+    "approachScale": 0.002,
+    "approachCurve": 7.1,
+    "approachRange": 850,
+    "approachCap": 1.4,
+    # same curve, when aiming at the goal with the ball in the front dribbler
+    "aimScale": 0.007,
+    "aimCurve": 5.6,
+    "aimRange": 900,
+    "chaseSpeed": 600,
+    "dribbleSpeed": 500,
+    "backDribbleSpeed": 600,
+    # distance to the goal within which to kick
+    "kickMin": 80,
+    "kickMax": 250,
+    "goalieSpeed": 300,
+}
+# (low, high) of every parameter worth sweeping, integers for integer parameters
+PARAM_RANGES = {
+    "approachScale": (0.0005, 0.01),
+    "approachCurve": (4.0, 10.0),
+    "approachCap": (0.8, 2.0),
+    "aimScale": (0.001, 0.02),
+    "aimCurve": (3.0, 8.0),
+    "chaseSpeed": (400, 800),
+    "dribbleSpeed": (300, 700),
+    "kickMin": (40, 150),
+    "kickMax": (150, 400),
+    "goalieSpeed": (200, 500),
+}
+
 
 def attack(
     robots: List[Robot],
@@ -52,8 +85,18 @@ def attack(
             robots[attackRobot].orientation,
         )
         robots[attackRobot].direction = vec_to_world(relVec)
-        robots[attackRobot].speed = 600
-        factor = min(0.002 * (math.e ** (7.1 * (1 - relVec.length / 850))), 1.4)
+        robots[attackRobot].speed = PARAMS["chaseSpeed"]
+        factor = min(
+            PARAMS["approachScale"]
+            * (
+                math.e
+                ** (
+                    PARAMS["approachCurve"]
+                    * (1 - relVec.length / PARAMS["approachRange"])
+                )
+            ),
+            PARAMS["approachCap"],
+        )
         # factor = min(0.01*(1-relVec.length/850)*(math.e**(5*(1-relVec.length/850))),1)
 
         # obstacle avoidance
@@ -152,8 +195,15 @@ def attack(
                 robots[attackRobot].orientation,
             )
         robots[attackRobot].direction = vec_to_world(relVec)
-        robots[attackRobot].speed = 500
-        factor = min(0.007 * (math.e ** (5.6 * (1 - relVec.length / 900))), 1)
+        robots[attackRobot].speed = PARAMS["dribbleSpeed"]
+        factor = min(
+            PARAMS["aimScale"]
+            * (
+                math.e
+                ** (PARAMS["aimCurve"] * (1 - relVec.length / PARAMS["aimRange"]))
+            ),
+            1,
+        )
         robots[attackRobot].chaseState = 0
         # face goal
         if (
@@ -170,7 +220,7 @@ def attack(
                 - robots[attackRobot].angle
             )
             # shoot ball if close to goal
-            if (250 > relVec.length > 80) and robots[
+            if (PARAMS["kickMax"] > relVec.length > PARAMS["kickMin"]) and robots[
                 attackRobot
             ].sprite.body.position.y < SCREEN_HEIGHT - 140:
                 kick(robots[attackRobot])
@@ -204,7 +254,7 @@ def attack(
             )  # go for bigger gap
         robots[attackRobot].chaseState = 0
         robots[attackRobot].direction = vec_to_world(relVec)
-        robots[attackRobot].speed = 600
+        robots[attackRobot].speed = PARAMS["backDribbleSpeed"]
         if 350 > relVec.length > 50:
             if robots[attackRobot].sprite.body.position.x < SCREEN_WIDTH * 0.5:
                 robots[attackRobot].flick(0)
@@ -297,7 +347,7 @@ def defend(
         robots[defenseRobot].orientation,
     )
     robots[defenseRobot].direction = vec_to_world(relVec)
-    robots[defenseRobot].speed = 300
+    robots[defenseRobot].speed = PARAMS["goalieSpeed"]
     robots[defenseRobot].move(
         robots[defenseRobot].speed,
         robots[defenseRobot].direction + robots[defenseRobot].orientation,
@@ -0,0 +1,290 @@
+"""A single, array-backed view of everything a program can read in a step, shared by every program.
+
+Programs written for the original signature (see ProgramType) keep working: Match runs them through
+legacy_adapter, which unpacks an Observation into the six original arguments.
+
+Nothing is computed for programs that do not read the arrays: the state of the bodies is only copied in
+the first time an array is read in a step, and the values derived from it the first time one of those is read.
+
+Example:
+    @uses_observation
+    def attack(observation: Observation) -> None:
+        # pick the robot closest to the ball, without computing any distance
+        closest = int(observation.ballDistances[observation.indices].argmin())
+        robot = observation.robots[closest]
+        robot.move(500, observation.ballBearings[observation.indices[closest]])
+        observation.dribble(robot)
+"""
+
+import math
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pymunk
+
+__all__ = [
+    "Observation",
+    "ObservationState",
+    "ObservationProgramType",
+    "uses_observation",
+    "legacy_adapter",
+    "nearest_robots",
+]
+
+BODY_FIELDS = ("x", "y", "vx", "vy", "angle", "angularVelocity")
+
+
+class ObservationState:
+    """The arrays behind the Observations of a match, filled in place at most once per step.
+
+    Values derived from the bodies (vectors, distances and bearings to the ball, orientations) are computed
+    for every robot at once.
+    """
+
+    def __init__(self, robotCount: int, fetch: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            robotCount: Number of robots in the match.
+            fetch: Function returning the values of the bodies (see update), called when they are first
+                read in a step if they were not given to update.
+        """
+
+        self.fetch = fetch
+        self.step = 0
+        self.fresh = False
+        # ball first, then every robot, with BODY_FIELDS as columns
+        self.bodies = np.zeros((robotCount + 1, len(BODY_FIELDS)))
+        self.ballVectors = np.zeros((robotCount, 2))
+        self.ballDistances = np.zeros(robotCount)
+        self.ballBearings = np.zeros(robotCount)
+        self.orientations = np.zeros(robotCount)
+        self.derived = False
+
+        # read-only views handed to programs
+        self.views = {
+            "ballPosition": self.bodies[0, :2],
+            "ballVelocity": self.bodies[0, 2:4],
+            "positions": self.bodies[1:, :2],
+            "velocities": self.bodies[1:, 2:4],
+            "angles": self.bodies[1:, 4],
+            "angularVelocities": self.bodies[1:, 5],
+            "ballVectors": self.ballVectors,
+            "ballDistances": self.ballDistances,
+            "ballBearings": self.ballBearings,
+            "orientations": self.orientations,
+        }
+        for name, array in self.views.items():
+            view = array.view()
+            view.flags.writeable = False
+            self.views[name] = view
+
+    def update(self, step: int, bodies: Any = None) -> None:
+        """Starts a new step.
+
+        Args:
+            step: Step of the match.
+            bodies: (robots + 1, len(BODY_FIELDS)) values (array or nested sequence) of the ball, then
+                of every robot. If not given, they are fetched when first read.
+        """
+
+        self.step = step
+        self.fresh = bodies is not None
+        if self.fresh:
+            self.bodies[...] = bodies
+        self.derived = False
+
+    def read(self) -> None:
+        """Fetches the values of the bodies, if not done yet in this step."""
+
+        if not self.fresh:
+            self.bodies[...] = self.fetch()
+            self.fresh = True
+
+    def derive(self) -> None:
+        """Computes the derived values of every robot, if not done yet in this step."""
+
+        if self.derived:
+            return
+        self.read()
+        np.subtract(self.bodies[0, :2], self.bodies[1:, :2], out=self.ballVectors)
+        np.hypot(self.ballVectors[:, 0], self.ballVectors[:, 1], out=self.ballDistances)
+        # clockwise bearing from north, like vec_to_world
+        np.arctan2(
+            self.ballVectors[:, 1], self.ballVectors[:, 0], out=self.ballBearings
+        )
+        np.subtract(math.pi / 2, self.ballBearings, out=self.ballBearings)
+        np.mod(self.ballBearings, 2 * math.pi, out=self.ballBearings)
+        # clockwise orientation, converted like Match.physics_step does for the first robot
+        angles = self.bodies[1:, 4]
+        np.fmod(angles, 2 * math.pi, out=self.orientations)
+        np.negative(self.orientations, out=self.orientations)
+        self.orientations[angles >= 0] += 2 * math.pi
+        self.derived = True
+
+
+class Observation:
+    """Everything a program can read in a step, see the module docstring.
+
+    Arrays are indexed like Match.robots (the own team then the opponents, e.g. [own attack robot, own defense
+    robot, opponent attack robot, opponent defense robot]), are read-only, and are overwritten in the next step
+    (copy them to keep them).
+
+    Attributes:
+        robots: The Robots controlled by the program (the robots argument of the original signature).
+        indices: Index of each of those robots in the arrays.
+        line: Function returning the direction of lines detected by a robot, see Match.line.
+        dribble: Function running the dribbler of a robot, see Match.dribble.
+        kick: Function kicking the ball from the front catchment area of a robot, see Match.kick.
+        neighbours: Function returning the (index, distance) of the robots within a distance of a robot, nearest
+            first, see Match.neighbours. Cheaper than going through positions with many robots.
+        step: Step of the match.
+        ballPosition: (2,) position of the ball.
+        ballVelocity: (2,) velocity of the ball.
+        positions: (R, 2) positions of the robots.
+        velocities: (R, 2) velocities of the robots.
+        angles: (R,) angles of the robot bodies (counterclockwise, in radians).
+        angularVelocities: (R,) angular velocities of the robot bodies.
+        orientations: (R,) orientations of the robots (clockwise, in radians), computed from the body angles
+            at every step. Robot.orientation is only kept up to date by Match.physics_step for the first robot
+            (programs update it for the others), so it can lag behind these.
+        ballVectors: (R, 2) vectors from each robot to the ball.
+        ballDistances: (R,) distances from each robot to the ball.
+        ballBearings: (R,) bearings of the ball from each robot (as from vec_to_world, in radians).
+    """
+
+    __slots__ = ("robots", "indices", "line", "dribble", "kick", "neighbours", "state")
+
+    def __init__(
+        self,
+        state: ObservationState,
+        robots: List[Any],
+        indices: List[int],
+        line: Callable[[Any], pymunk.Vec2d],
+        dribble: Callable[[Any], None],
+        kick: Callable[[Any], None],
+        neighbours: Callable[[Any, float], List[Tuple[int, float]]],
+    ):
+        self.state = state
+        self.robots = robots
+        self.indices = indices
+        self.line = line
+        self.dribble = dribble
+        self.kick = kick
+        self.neighbours = neighbours
+
+    @property
+    def step(self) -> int:
+        return self.state.step
+
+    @property
+    def ballPosition(self) -> np.ndarray:
+        self.state.read()
+        return self.state.views["ballPosition"]
+
+    @property
+    def ballVelocity(self) -> np.ndarray:
+        self.state.read()
+        return self.state.views["ballVelocity"]
+
+    @property
+    def positions(self) -> np.ndarray:
+        self.state.read()
+        return self.state.views["positions"]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        self.state.read()
+        return self.state.views["velocities"]
+
+    @property
+    def angles(self) -> np.ndarray:
+        self.state.read()
+        return self.state.views["angles"]
+
+    @property
+    def angularVelocities(self) -> np.ndarray:
+        self.state.read()
+        return self.state.views["angularVelocities"]
+
+    @property
+    def orientations(self) -> np.ndarray:
+        self.state.derive()
+        return self.state.views["orientations"]
+
+    @property
+    def ballVectors(self) -> np.ndarray:
+        self.state.derive()
+        return self.state.views["ballVectors"]
+
+    @property
+    def ballDistances(self) -> np.ndarray:
+        self.state.derive()
+        return self.state.views["ballDistances"]
+
+    @property
+    def ballBearings(self) -> np.ndarray:
+        self.state.derive()
+        return self.state.views["ballBearings"]
+
+
+# types
+ObservationProgramType = Callable[[Observation], None]
+
+
+def uses_observation(program: ObservationProgramType) -> ObservationProgramType:
+    """Decorator declaring that a program takes a single Observation instead of the original arguments."""
+
+    program.usesObservation = True
+    return program
+
+
+def legacy_adapter(
+    program: Optional[Callable[..., None]],
+    positions: Callable[[], Tuple[pymunk.Vec2d, Sequence[pymunk.Vec2d]]],
+) -> Optional[ObservationProgramType]:
+    """Returns a program taking an Observation, calling the program with the original arguments if needed.
+
+    Args:
+        program: A program with the original signature (see ProgramType), or one decorated with
+            uses_observation (returned as is).
+        positions: Function returning the position of the ball and the positions of the robots
+            in the current step, as pymunk.Vec2d.
+    """
+
+    if program is None or getattr(program, "usesObservation", False):
+        return program
+
+    def adapted(observation: Observation) -> None:
+        ballPosition, robotPositions = positions()
+        program(
+            observation.robots,
+            observation.line,
+            ballPosition,
+            robotPositions,
+            observation.dribble,
+            observation.kick,
+        )
+
+    adapted.usesObservation = True
+    adapted.__wrapped__ = program
+    return adapted
+
+
+def nearest_robots(
+    positions: np.ndarray, index: int, radius: float
+) -> List[Tuple[int, float]]:
+    """Returns the robots within a distance of a robot from their positions, like Match.neighbours.
+
+    Args:
+        positions: (R, 2) positions of every robot.
+        index: Index of the robot in positions.
+        radius: Largest distance between the centres of the robots.
+
+    Returns: (index, distance) of every other robot whose centre is within radius, nearest first.
+    """
+
+    distances = np.hypot(*(positions - positions[index]).T)
+    distances[index] = np.inf
+    (found,) = np.nonzero(distances <= radius)
+    found = found[np.argsort(distances[found], kind="stable")]
+    return [(int(idx), float(distances[idx])) for idx in found]
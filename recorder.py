@@ -0,0 +1,211 @@
+"""Records the state of a match after every step into a binary file, through a memory map.
+
+File layout: RECORDING_MAGIC, then little-endian uint32s giving the length of a JSON header and the offset of
+the frames, then the header, padded with spaces up to that offset (a whole number of HEADER_SIZE pages, enough
+for the header of the match, so teams of any size fit), then one row of float64 values per recorded frame.
+The header describes the columns of a row (see Recorder.columns), the bodies and the number of frames.
+Recordings of version 1 have no offset, their frames always start at HEADER_SIZE.
+"""
+
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymunk._chipmunk_cffi import lib
+
+from simulation import Match
+
+RECORDING_MAGIC = b"BZSIMREC"
+RECORDING_VERSION = 2
+# the header takes a whole number of pages of this size
+HEADER_SIZE = 4096
+# room left in the header for the frame count to grow
+HEADER_SLACK = 32
+BODY_COLUMNS = ("x", "y", "vx", "vy", "angle")
+ROBOT_COLUMNS = ("direction", "speed", "dribbleState", "chaseState")
+
+
+class Recorder:
+    """Appends the state of a match to a file after every step.
+
+    Frames are written into a numpy.memmap of the file, which grows by a chunk of frames at a time,
+    so a recording never has to fit in memory. Call close() once the match is over.
+
+    Attributes:
+        frames: Number of frames recorded so far.
+        columns: Names of the values in a frame, in order.
+        offset: Offset of the first frame in the file, after the header.
+    """
+
+    def __init__(self, path: str, match: Match, chunk: int = 3600):
+        """Starts recording a match, including its current state as the first frame.
+
+        Args:
+            path: Path of the file to write (overwritten if it exists).
+            match: The Match to record, its recorder attribute is set to this Recorder.
+            chunk: Number of frames to grow the file by when it is full.
+        """
+
+        self.path = path
+        self.match = match
+        self.chunk = chunk
+        self.frames = 0
+        self.capacity = 0
+
+        self.columns: List[str] = ["step"]
+        for name in ["ball"] + [f"robot{idx}" for idx in range(len(match.robots))]:
+            self.columns += [f"{name}.{column}" for column in BODY_COLUMNS]
+        for idx in range(len(match.robots)):
+            self.columns += [f"robot{idx}.{column}" for column in ROBOT_COLUMNS]
+        self.bodies: List[Dict[str, Any]] = [
+            {
+                "name": "ball",
+                "filename": match.ball.filename,
+                "scale": match.ball.scale,
+            }
+        ] + [
+            {"name": f"robot{idx}", "filename": robot.filename, "scale": robot.scale}
+            for idx, robot in enumerate(match.robots)
+        ]
+
+        # chipmunk bodies are read directly (skipping pymunk's Vec2d wrappers), and frames are packed
+        # straight into the mapped file, which keeps recording a frame to a few microseconds
+        self._bodies = [match.ball.body._body] + [
+            robot.sprite.body._body for robot in match.robots
+        ]
+        self._row = struct.Struct(f"<{len(self.columns)}d")
+        # the header only changes by its frame count from now on
+        size = len(RECORDING_MAGIC) + 8 + len(json.dumps(self.header())) + HEADER_SLACK
+        self.offset = -(-size // HEADER_SIZE) * HEADER_SIZE
+
+        self.file = open(path, "w+b")
+        self.data: Optional[np.memmap] = None
+        self._buffer: Optional[memoryview] = None
+        self._write_header()
+        self._grow()
+        match.recorder = self
+        self.record()
+
+    def header(self) -> Dict[str, Any]:
+        """Returns the header describing the recording."""
+
+        return {
+            "version": RECORDING_VERSION,
+            "dtype": "<f8",
+            "columns": self.columns,
+            "frames": self.frames,
+            "timeStep": self.match.timeStep,
+            "seed": self.match.seed,
+            "bodies": self.bodies,
+        }
+
+    def record(self) -> None:
+        """Appends the current state of the match as a frame."""
+
+        if self.frames == self.capacity:
+            self._grow()
+
+        values = [self.match.steps]
+        for body in self._bodies:
+            position = lib.cpBodyGetPosition(body)
+            velocity = lib.cpBodyGetVelocity(body)
+            values += (
+                position.x,
+                position.y,
+                velocity.x,
+                velocity.y,
+                lib.cpBodyGetAngle(body),
+            )
+        for robot in self.match.robots:
+            values += (
+                robot.direction,
+                robot.speed,
+                robot.dribbleState,
+                robot.chaseState,
+            )
+        self._row.pack_into(self._buffer, self.frames * self._row.size, *values)
+        self.frames += 1
+
+    def close(self) -> None:
+        """Stops recording, trimming the file to the recorded frames and writing the final header."""
+
+        if self.match.recorder is self:
+            self.match.recorder = None
+        self._buffer.release()
+        self.data.flush()
+        self._buffer = self.data = None
+        self.file.truncate(self.offset + self.frames * self._row.size)
+        self._write_header()
+        self.file.close()
+
+    def _grow(self) -> None:
+        """Makes room for another chunk of frames and maps the file again."""
+
+        if self.data is not None:
+            self._buffer.release()
+            self.data.flush()
+            # keep the frame count on disk up to date, in case the recording is never closed
+            self._write_header()
+        self.capacity += self.chunk
+        self.file.truncate(self.offset + self.capacity * self._row.size)
+        self.data = np.memmap(
+            self.file,
+            dtype="<f8",
+            mode="r+",
+            offset=self.offset,
+            shape=(self.capacity, len(self.columns)),
+        )
+        self._buffer = memoryview(self.data).cast("B")
+
+    def _write_header(self) -> None:
+        header = json.dumps(self.header()).encode()
+        if len(RECORDING_MAGIC) + 8 + len(header) > self.offset:
+            raise ValueError("recording header is too large")
+        self.file.seek(0)
+        self.file.write(RECORDING_MAGIC + struct.pack("<II", len(header), self.offset))
+        self.file.write(header.ljust(self.offset - len(RECORDING_MAGIC) - 8))
+        self.file.flush()
+
+
+def load(path: str) -> Tuple[Dict[str, Any], np.memmap]:
+    """Opens a recording without reading it into memory.
+
+    Args:
+        path: Path of a file written by a Recorder.
+
+    Returns: A tuple of (header, read-only memmap of shape (frames, columns)).
+    """
+
+    with open(path, "rb") as file:
+        if file.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        (length,) = struct.unpack("<I", file.read(4))
+        prefix = file.read(4)
+        if prefix[:1] == b"{":
+            # version 1, the header follows the length
+            offset = HEADER_SIZE
+            header = json.loads(prefix + file.read(length - 4))
+        else:
+            (offset,) = struct.unpack("<I", prefix)
+            header = json.loads(file.read(length))
+    if header["version"] not in (1, RECORDING_VERSION):
+        raise ValueError(f"unsupported recording version {header['version']}")
+    frames = header["frames"]
+    if frames == 0:
+        data = np.zeros((0, len(header["columns"])))
+    else:
+        data = np.memmap(
+            path,
+            dtype=header["dtype"],
+            mode="r",
+            offset=offset,
+            shape=(frames, len(header["columns"])),
+        )
+    return header, data
+
+
+def column(header: Dict[str, Any], name: str) -> int:
+    """Returns the index of a named column (like "ball.x" or "robot0.dribbleState") in a recording."""
+
+    return header["columns"].index(name)
@@ -0,0 +1,350 @@
+"""Automatic referee for headless matches, judging the rules a human watching the window otherwise would.
+
+A few times per second (see CHECK_RATE), the referee checks:
+    out of bounds: a robot entirely outside the white field lines (its centre outside them and its shape
+        not touching them, from a bb_query against Match.fieldLines) is removed from play.
+    lack of progress: if the ball stays within PROGRESS_DISTANCE of the same point for PROGRESS_TIME
+        (e.g. pinned against a wall by the slopes), it is placed on the nearest unoccupied neutral spot.
+    multiple defense: if more than one robot of a team stay in their own penalty area (the bounding box of the
+        penalty lines in front of the goal they defend) for PENALTY_AREA_TIME, the one furthest from the goal
+        is removed from play. A single goalkeeper may stay there.
+    pushing: if a robot keeps driving into an opponent it is touching for PUSHING_TIME, the robot
+        driving into the other the hardest is removed from play. Only the opponents near each robot are
+        checked (see Match.neighbours), so the check stays cheap with large teams.
+
+The field margins, neutral spots and goals are those of the standard field, scaled to the size of the field of
+the match (see scale in scenario.py).
+
+Removed robots are taken out of the space and parked off the field, so they cannot touch anything while their
+programs keep running. After the removal time, they come back on the unoccupied neutral spot furthest from the
+ball, facing the way they started. Every decision is kept in Referee.calls.
+
+Example:
+    match = Match(config, attack, defend, o_attack, o_defend)
+    referee = Referee(match)
+    match.run(3600)
+    print(referee.counts())
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pymunk
+from pymunk._chipmunk_cffi import lib
+
+from simulation import Match
+from tools import *
+
+# checks per second, timers advance by the time between checks
+CHECK_RATE = 10
+# seconds the ball may stay within PROGRESS_DISTANCE of the same point
+PROGRESS_TIME = 5.0
+PROGRESS_DISTANCE = 15.0
+# seconds more than one robot of a team may stay in their own penalty area
+PENALTY_AREA_TIME = 3.0
+# seconds a robot may keep driving into an opponent, and the speed towards it that counts as driving into it
+PUSHING_TIME = 3.0
+PUSHING_SPEED = 10.0
+# seconds a removed robot stays out (a minute in RoboCup Junior, shortened for short headless matches)
+REMOVAL_TIME = 20.0
+# distance from a neutral spot within which a robot or the ball occupies it
+SPOT_CLEARANCE = 25.0
+
+# neutral spots on the standard field, the centre spot first
+NEUTRAL_SPOTS = [
+    pymunk.Vec2d(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2),
+    pymunk.Vec2d(SCREEN_WIDTH / 2 - 90, SCREEN_HEIGHT / 2 - 150),
+    pymunk.Vec2d(SCREEN_WIDTH / 2 + 90, SCREEN_HEIGHT / 2 - 150),
+    pymunk.Vec2d(SCREEN_WIDTH / 2 - 90, SCREEN_HEIGHT / 2 + 150),
+    pymunk.Vec2d(SCREEN_WIDTH / 2 + 90, SCREEN_HEIGHT / 2 + 150),
+]
+
+# shape categories, see Match
+LINES = pymunk.ShapeFilter(mask=0b100)
+ROBOTS = pymunk.ShapeFilter(mask=0b1000)
+ROBOTS_AND_BALL = pymunk.ShapeFilter(mask=0b11000)
+
+
+@dataclass
+class Call:
+    """A decision of the referee.
+
+    Attributes:
+        step: Step of the match the decision was made in.
+        rule: "out of bounds", "lack of progress", "multiple defense", "pushing" or "return".
+        robot: Index (in Match.robots) of the robot removed or returned, None for the ball.
+        position: Where the robot was removed from, or where the robot or ball was placed.
+    """
+
+    step: int
+    rule: str
+    robot: Optional[int]
+    position: Tuple[float, float]
+
+
+class Referee:
+    """Judges the rules of a Match every few steps, see the module docstring.
+
+    Attributes:
+        calls: Every Call made so far.
+        removed: Step at which each removed robot comes back, by index in Match.robots.
+    """
+
+    def __init__(
+        self,
+        match: Match,
+        check_rate: float = CHECK_RATE,
+        removal_time: float = REMOVAL_TIME,
+    ):
+        """Starts refereeing a match.
+
+        Args:
+            match: The Match to referee, its referee attribute is set to this Referee.
+            check_rate: Number of checks per second.
+            removal_time: Seconds a removed robot stays out.
+        """
+
+        self.match = match
+        match.referee = self
+        self.interval = max(1, round(1 / (check_rate * match.timeStep)))
+        self.removalSteps = round(removal_time / match.timeStep)
+        self.calls: List[Call] = []
+        self.removed: Dict[int, int] = {}
+
+        # the geometry is static, so every bounding box is computed once
+        scaleX = match.width / SCREEN_WIDTH
+        scaleY = match.height / SCREEN_HEIGHT
+        self.fieldBB = pymunk.BB(
+            77 * scaleX,
+            77 * scaleY,
+            (SCREEN_WIDTH - 77) * scaleX,
+            (SCREEN_HEIGHT - 77) * scaleY,
+        )
+        self.spots = [
+            pymunk.Vec2d(spot.x * scaleX, spot.y * scaleY) for spot in NEUTRAL_SPOTS
+        ]
+        self.fieldLines = set(match.fieldLines)
+        bottom = [
+            line.bb for line in match.penaltyLines if line.bb.top < match.height / 2
+        ]
+        top = [line.bb for line in match.penaltyLines if line.bb.top > match.height / 2]
+        # own robots (the first team of Match.robots) defend the yellow goal at the bottom
+        self.penaltyAreas = [_merge(bottom), _merge(top)]
+        self.goals = [
+            pymunk.Vec2d(SCREEN_WIDTH / 2 * scaleX, 60 * scaleY),
+            pymunk.Vec2d(SCREEN_WIDTH / 2 * scaleX, (SCREEN_HEIGHT - 60) * scaleY),
+        ]
+
+        # distance between the centres of two robots beyond which they cannot touch
+        self.reach = 2 * max(
+            max(vertex.length for vertex in robot.sprite.shape.get_vertices())
+            for robot in match.robots
+        )
+
+        # timers, in steps
+        self.progressPoint = match.ball.body.position
+        self.progressSteps = 0
+        self.penaltyAreaSteps = [0, 0]
+        self.pushingSteps: Dict[Tuple[int, int], int] = {}
+
+    def check(self) -> None:
+        """Called by Match after every physics step, judges the rules every interval steps."""
+
+        match = self.match
+        if match.steps % self.interval:
+            return
+
+        for idx, returnStep in list(self.removed.items()):
+            if match.steps >= returnStep:
+                self.return_robot(idx)
+
+        self.check_progress()
+        # read through chipmunk directly, skipping pymunk's Vec2d wrappers
+        positions = [
+            lib.cpBodyGetPosition(robot.sprite.body._body) for robot in match.robots
+        ]
+        left, bottom, right, top = self.fieldBB
+        defending: List[List[int]] = [[], []]
+        for idx, position in enumerate(positions):
+            x, y = position.x, position.y
+            if idx in self.removed:
+                continue
+            # plain comparisons first, as almost every robot is inside the field at almost every check
+            if not (left <= x <= right and bottom <= y <= top) and not any(
+                shape in self.fieldLines
+                for shape in match.space.bb_query(
+                    match.robots[idx].sprite.shape.bb, LINES
+                )
+            ):
+                self.remove_robot(idx, "out of bounds")
+                continue
+            team = match.robotTeams[idx]
+            area = self.penaltyAreas[team]
+            if area.left <= x <= area.right and area.bottom <= y <= area.top:
+                defending[team].append(idx)
+        for team, robots in enumerate(defending):
+            if len(robots) < 2:
+                self.penaltyAreaSteps[team] = 0
+                continue
+            self.penaltyAreaSteps[team] += self.interval
+            if self.penaltyAreaSteps[team] >= PENALTY_AREA_TIME / match.timeStep:
+                goal = self.goals[team]
+                self.remove_robot(
+                    max(
+                        robots,
+                        key=lambda idx: goal.get_distance(
+                            (positions[idx].x, positions[idx].y)
+                        ),
+                    ),
+                    "multiple defense",
+                )
+                self.penaltyAreaSteps[team] = 0
+        self.check_pushing()
+
+    def check_progress(self) -> None:
+        """Places the ball on the nearest unoccupied neutral spot if it has not moved for PROGRESS_TIME."""
+
+        match = self.match
+        position = match.ball.body.position
+        if position.get_distance(self.progressPoint) > PROGRESS_DISTANCE:
+            self.progressPoint = position
+            self.progressSteps = 0
+            return
+        self.progressSteps += self.interval
+        if self.progressSteps < PROGRESS_TIME / match.timeStep:
+            return
+
+        spot = self.free_spot(position, ROBOTS, nearest=True)
+        body = match.ball.body
+        body.position = spot
+        body.velocity = (0, 0)
+        body.angular_velocity = 0
+        match.space.reindex_shapes_for_body(body)
+        match.sensors.clear()
+        self.calls.append(Call(match.steps, "lack of progress", None, tuple(spot)))
+        self.progressPoint = spot
+        self.progressSteps = 0
+
+    def check_pushing(self) -> None:
+        """Removes a robot that kept driving into an opponent it is touching for PUSHING_TIME."""
+
+        match = self.match
+        robots = match.robots
+        teams = match.robotTeams
+        touching = set()
+        for idx in range(len(robots)):
+            if teams[idx] != 0 or idx in self.removed:
+                continue
+            # robots further apart than reach cannot touch, which rules out almost every pair
+            opponents = sorted(
+                other
+                for other, _ in match.neighbours(robots[idx], self.reach)
+                if teams[other] == 1
+            )
+            for opponent in opponents:
+                if (
+                    opponent in self.removed
+                    or not robots[idx]
+                    .sprite.shape.shapes_collide(robots[opponent].sprite.shape)
+                    .points
+                ):
+                    continue
+                pair = (idx, opponent)
+                touching.add(pair)
+                pusher = self.pusher(idx, opponent)
+                if pusher is None:
+                    continue
+                self.pushingSteps[pair] = self.pushingSteps.get(pair, 0) + self.interval
+                if self.pushingSteps[pair] >= PUSHING_TIME / match.timeStep:
+                    self.remove_robot(pusher, "pushing")
+        for pair in list(self.pushingSteps):
+            if pair not in touching:
+                del self.pushingSteps[pair]
+
+    def pusher(self, first: int, second: int) -> Optional[int]:
+        """Returns which of two touching robots is told to drive into the other the hardest, if any is."""
+
+        robots = [self.match.robots[idx] for idx in (first, second)]
+        direction = robots[1].sprite.body.position - robots[0].sprite.body.position
+        if direction.length == 0:
+            return None
+        direction = direction.normalized()
+        # commanded velocities, as robots pushing each other to a standstill still drive into each other
+        speeds = [
+            robots[0].targetPointBody.velocity.dot(direction),
+            -robots[1].targetPointBody.velocity.dot(direction),
+        ]
+        if max(speeds) < PUSHING_SPEED:
+            return None
+        return first if speeds[0] >= speeds[1] else second
+
+    def free_spot(
+        self, position: pymunk.Vec2d, mask: pymunk.ShapeFilter, nearest: bool
+    ) -> pymunk.Vec2d:
+        """Returns the neutral spot nearest to (or furthest from) a position that nothing in mask occupies.
+
+        Falls back to every spot if they are all occupied.
+        """
+
+        space = self.match.space
+        spots = [
+            spot
+            for spot in self.spots
+            if not space.point_query(spot, SPOT_CLEARANCE, mask)
+        ] or self.spots
+        distance = position.get_distance
+        return min(spots, key=distance) if nearest else max(spots, key=distance)
+
+    def remove_robot(self, idx: int, rule: str) -> None:
+        """Takes a robot out of play for the removal time, parking it off the field."""
+
+        match = self.match
+        robot = match.robots[idx]
+        body = robot.sprite.body
+        self.calls.append(Call(match.steps, rule, idx, tuple(body.position)))
+        self.removed[idx] = match.steps + self.removalSteps
+        match.space.remove(body, robot.sprite.shape, *match.joints[idx])
+        body.position = pymunk.Vec2d(-100 * (idx + 1), -100)
+        body.velocity = (0, 0)
+        body.angular_velocity = 0
+        robot.dribbleState = 0
+        for scheduled in match.programList:
+            if robot in scheduled.dribbling:
+                scheduled.dribbling.remove(robot)
+        match.sensors.clear()
+
+    def return_robot(self, idx: int) -> None:
+        """Puts a removed robot back on the unoccupied neutral spot furthest from the ball."""
+
+        match = self.match
+        robot = match.robots[idx]
+        body = robot.sprite.body
+        spot = self.free_spot(match.ball.body.position, ROBOTS_AND_BALL, nearest=False)
+        angle = match.kickoffPositions[idx][1]
+        body.position = spot
+        body.angle = angle
+        body.velocity = (0, 0)
+        body.angular_velocity = 0
+        robot.targetPointBody.velocity = (0, 0)
+        robot.targetPointBody.angle = angle
+        match.space.add(body, robot.sprite.shape, *match.joints[idx])
+        del self.removed[idx]
+        match.sensors.clear()
+        self.calls.append(Call(match.steps, "return", idx, tuple(spot)))
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of calls made for each rule."""
+
+        counts: Dict[str, int] = {}
+        for call in self.calls:
+            counts[call.rule] = counts.get(call.rule, 0) + 1
+        return counts
+
+
+def _merge(bbs: List[pymunk.BB]) -> pymunk.BB:
+    """Returns the bounding box of a number of bounding boxes."""
+
+    merged = bbs[0]
+    for bb in bbs[1:]:
+        merged = merged.merge(bb)
+    return merged
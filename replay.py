@@ -0,0 +1,160 @@
+"""Plays back a recording (see recorder.py) in the simulation window, without simulating anything.
+
+Usage:
+    python replay.py FILE [--speed SPEED]
+
+Controls:
+    P: pause/resume
+    LEFT/RIGHT: step one frame back/forward (and pause)
+    [ and ]: jump 5 seconds back/forward
+    HOME/END: jump to the start/end
+    UP/DOWN: double/halve the playback speed
+    1-9, 0: play at 1x-9x, 10x speed
+"""
+
+import argparse
+import math
+import timeit
+from typing import Dict, List, Optional, Tuple
+
+import arcade
+import numpy as np
+
+from recorder import load
+from window import SimWin, cached_texture
+from tools import *
+
+
+class ReplayWin(SimWin):
+    """Simulation window driving its sprites from a recording instead of a Match.
+
+    No pymunk space is built and no physics is stepped, so playback speed is only limited by drawing.
+    """
+
+    def __init__(self, width, height, title):
+        """create variables"""
+
+        super().__init__(width, height, title)
+
+        # recording
+        self.header: Optional[Dict] = None
+        self.data: Optional[np.ndarray] = None
+        self.bodyColumns: List[Tuple[int, int, int]] = []
+        self.timeStep: float = 1 / 60.0
+
+        # playback
+        self.frame: float = 0
+        self.speed: float = 1
+
+    def setup(self, path: str, speed: float = 1):
+        """set up everything
+
+        Args:
+            path: Path of the recording to play.
+            speed: Initial playback speed multiplier.
+        """
+
+        # background
+        self.background: arcade.Texture = cached_texture("images/field.jpg")
+
+        # recording
+        self.header, self.data = load(path)
+        if len(self.data) == 0:
+            raise ValueError(f"{path} has no frames")
+        self.timeStep = self.header["timeStep"]
+        columns = self.header["columns"]
+
+        # lists
+        self.dynamicSpriteList = arcade.SpriteList()
+        self.arrowsList = arcade.ShapeElementList()
+        self.bodyColumns = []
+        for body in self.header["bodies"]:
+            sprite = arcade.Sprite(scale=body["scale"])
+            sprite.texture = cached_texture(body["filename"])
+            self.dynamicSpriteList.append(sprite)
+            self.bodyColumns.append(
+                (
+                    columns.index(f"{body['name']}.x"),
+                    columns.index(f"{body['name']}.y"),
+                    columns.index(f"{body['name']}.angle"),
+                )
+            )
+
+        # playback
+        self.frame = 0
+        self.speed = speed
+        self.show_frame()
+
+    def show_frame(self):
+        """moves the sprites to the current frame"""
+
+        row = self.data[int(self.frame)]
+        for sprite, (x, y, angle) in zip(self.dynamicSpriteList, self.bodyColumns):
+            sprite.center_x = row[x]
+            sprite.center_y = row[y]
+            sprite.angle = math.degrees(row[angle])
+
+    def seek(self, frame: float):
+        """jumps to a frame, clamped to the recording"""
+
+        self.frame = min(max(frame, 0), len(self.data) - 1)
+        self.show_frame()
+
+    def on_draw(self):
+        super().on_draw()
+        output = (
+            f"Frame {int(self.frame)}/{len(self.data) - 1} "
+            f"({self.frame * self.timeStep:.1f}s), "
+            f"speed {self.speed:g}x{' (paused)' if self.pause else ''}"
+        )
+        arcade.draw_text(output, 20, 20, arcade.color.WHITE)
+
+    def on_update(self, delta_time: float):
+        self.refreshRate = 1 / delta_time
+        start_time = timeit.default_timer()
+
+        if not self.pause:
+            self.seek(self.frame + self.speed * delta_time / self.timeStep)
+
+        self.processingTime = timeit.default_timer() - start_time
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        pass
+
+    def on_key_press(self, key, modifiers):
+        if key == arcade.key.P:
+            self.pause = not self.pause
+        elif key == arcade.key.LEFT or key == arcade.key.RIGHT:
+            self.pause = True
+            self.seek(int(self.frame) + (1 if key == arcade.key.RIGHT else -1))
+        elif key == arcade.key.BRACKETLEFT or key == arcade.key.BRACKETRIGHT:
+            self.seek(
+                self.frame
+                + (5 if key == arcade.key.BRACKETRIGHT else -5) / self.timeStep
+            )
+        elif key == arcade.key.HOME:
+            self.seek(0)
+        elif key == arcade.key.END:
+            self.seek(len(self.data) - 1)
+        elif key == arcade.key.UP:
+            self.speed *= 2
+        elif key == arcade.key.DOWN:
+            self.speed /= 2
+        elif key == arcade.key.KEY_0:
+            self.speed = 10
+        elif arcade.key.KEY_1 <= key <= arcade.key.KEY_9:
+            self.speed = key - arcade.key.KEY_0
+
+
+def replay(path: str, speed: float = 1):
+    window = ReplayWin(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
+    window.setup(path, speed)
+    arcade.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file")
+    parser.add_argument("--speed", type=float, default=1)
+    args = parser.parse_args()
+    replay(args.file, args.speed)
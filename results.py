@@ -0,0 +1,375 @@
+"""A persistent cache of match outcomes, so that matches whose inputs did not change are not played again.
+
+A match is identified by a hash of everything its outcome depends on (see match_key): the source of the program
+modules (and of the modules of the repository they import), their CONFIG, the field and physics settings (the
+source of the simulation modules and its constants), the seed, and the options of the match. Changing a single
+program only replays the matches it plays in.
+
+Outcomes are only reusable if a headless match plays out bit for bit the same every time it is played with the
+same inputs. check_determinism plays a match twice and compares the state of every body after every step;
+run it after changing the simulation or a program that keeps state between matches:
+
+    python results.py --own examples.own --opponent examples.opponent --seeds 0 1
+
+Entries are JSON files in a directory, one per match; once the files take more than a given size, the least
+recently used ones are deleted.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import struct
+import sys
+import tempfile
+import types
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pymunk
+
+import simulation
+from referee import Referee
+from scenario import resolve_scenario
+from simulation import Match
+
+__all__ = [
+    "ResultCache",
+    "match_key",
+    "physics_settings",
+    "check_determinism",
+    "open_cache",
+]
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# modules the outcome of every match depends on, whatever the programs
+SIMULATION_MODULES = ("simulation", "tools", "observation", "referee", "scenario")
+# cached hashes of the source of modules, by name
+_sources: Dict[str, str] = {}
+
+
+def _local_modules(module: types.ModuleType) -> List[str]:
+    """Returns the names of a module and of the modules of the repository it uses (one level deep)."""
+
+    names = {module.__name__}
+    for value in vars(module).values():
+        name = (
+            value.__name__
+            if isinstance(value, types.ModuleType)
+            else getattr(value, "__module__", None)
+        )
+        other = sys.modules.get(name) if isinstance(name, str) else None
+        path = getattr(other, "__file__", None)
+        if path is not None and os.path.abspath(path).startswith(ROOT + os.sep):
+            names.add(name)
+    return sorted(names)
+
+
+def source_hash(name: str) -> str:
+    """Returns the hash of the source of an imported module (cached, modules are not expected to change)."""
+
+    if name not in _sources:
+        source = inspect.getsource(sys.modules[name])
+        _sources[name] = hashlib.sha256(source.encode()).hexdigest()
+    return _sources[name]
+
+
+def physics_settings() -> Dict[str, Any]:
+    """Returns the field and physics settings every match depends on."""
+
+    return {
+        "pymunk": pymunk.version,
+        "screen": [simulation.SCREEN_WIDTH, simulation.SCREEN_HEIGHT],
+        "timeStep": simulation.TIME_STEP,
+        "controlRate": simulation.CONTROL_RATE,
+        "tof": [
+            simulation.TOF_RANGE,
+            simulation.TOF_NOISE,
+            simulation.TOF_NOISE_BLOCK,
+            simulation.TOF_MASK,
+        ],
+        "sources": {name: source_hash(name) for name in SIMULATION_MODULES},
+    }
+
+
+def match_key(
+    own: str,
+    opponent: str,
+    seed: int,
+    steps: int,
+    scenario: Optional[str] = None,
+    **options: Any,
+) -> str:
+    """Returns the key of a match between program modules in a ResultCache.
+
+    Args:
+        own: Name of the module providing the own programs.
+        opponent: Name of the module providing the opponent programs.
+        seed: Seed of the match.
+        steps: Number of physics steps played.
+        scenario: Name of the scenario played (see scenario.py), the default one if not given.
+        **options: Anything else the outcome depends on (referee, parameters of the programs...),
+            JSON-serializable.
+    """
+
+    modules = [importlib.import_module(own), importlib.import_module(opponent)]
+    config = getattr(modules[0], "CONFIG", getattr(modules[1], "CONFIG", {}))
+    description = {
+        "own": own,
+        "opponent": opponent,
+        "programs": {
+            name: source_hash(name)
+            for module in modules
+            for name in _local_modules(module)
+        },
+        "config": config,
+        "physics": physics_settings(),
+        "scenario": resolve_scenario(scenario).digest,
+        "seed": seed,
+        "steps": steps,
+        "options": options,
+    }
+    encoded = json.dumps(description, sort_keys=True, default=repr)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ResultCache:
+    """Outcomes of matches on disk, by key (see match_key), evicting the least recently used ones.
+
+    Attributes:
+        hits: Number of outcomes found in the cache.
+        misses: Number of outcomes looked for and not found.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            directory: Directory holding the entries, created if needed.
+            max_bytes: Size the entries may take in total, the least recently used ones are deleted beyond it.
+        """
+
+        self.directory = directory
+        self.maxBytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # (last use, size) of every entry, by key
+        self.entries: Dict[str, Tuple[float, int]] = {}
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                self.entries[entry.name[:-5]] = (stat.st_mtime, stat.st_size)
+        self.size = sum(size for _, size in self.entries.values())
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the outcome of a match, or None if it is not in the cache."""
+
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self.path(key)) as file:
+                outcome = json.load(file)
+        except (OSError, ValueError):
+            # deleted or half written by another process
+            self.size -= self.entries.pop(key)[1]
+            self.misses += 1
+            return None
+        # the modification time of an entry is its last use
+        os.utime(self.path(key))
+        self.entries[key] = (os.path.getmtime(self.path(key)), self.entries[key][1])
+        self.hits += 1
+        return outcome
+
+    def put(self, key: str, outcome: Dict[str, Any]) -> None:
+        """Stores the outcome of a match, then evicts entries if the cache is too big.
+
+        Args:
+            key: Key of the match, see match_key.
+            outcome: The outcome, JSON-serializable.
+        """
+
+        # written to a temporary file first, so that readers never see a half written entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(outcome, file)
+        os.replace(temporary, self.path(key))
+        if key in self.entries:
+            self.size -= self.entries[key][1]
+        size = os.path.getsize(self.path(key))
+        self.entries[key] = (os.path.getmtime(self.path(key)), size)
+        self.size += size
+        self.evict()
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_bytes."""
+
+        if self.size <= self.maxBytes:
+            return
+        for key, (_, size) in sorted(self.entries.items(), key=lambda item: item[1]):
+            if self.size <= self.maxBytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path(key))
+            del self.entries[key]
+            self.size -= size
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def _trace(
+    programs: Tuple, seed: int, steps: int, referee: bool, scenario: Optional[str]
+) -> List[bytes]:
+    """Plays a match, returning a digest of the state of every body after every step."""
+
+    match = Match(*programs, seed=seed, scenario=scenario)
+    if referee:
+        Referee(match)
+    digests = []
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(steps):
+                match.step()
+                values = [value for body in match.read_bodies() for value in body]
+                values += match.score
+                digests.append(
+                    hashlib.sha256(struct.pack(f"{len(values)}d", *values)).digest()
+                )
+    finally:
+        match.close()
+    return digests
+
+
+def check_determinism(
+    own: str,
+    opponent: str,
+    seeds: Iterable[int] = (0,),
+    steps: int = 60 * 60,
+    referee: bool = True,
+    scenario: Optional[str] = None,
+) -> Optional[Tuple[int, int]]:
+    """Plays every match twice, checking that both play out bit for bit the same.
+
+    The programs are imported once, so programs keeping state between matches (in their module) fail the
+    check, like anything else making a match depend on more than its inputs.
+
+    Args:
+        own: Name of the module providing the own programs.
+        opponent: Name of the module providing the opponent programs.
+        seeds: Seeds to check.
+        steps: Number of physics steps per match.
+        referee: Whether a Referee judges the rules.
+        scenario: Name of the scenario to play (see scenario.py), the default one if not given.
+
+    Returns: None if every match played out the same, otherwise the (seed, step) at which one first diverged.
+    """
+
+    from tournament import load_programs
+
+    programs = load_programs(own, opponent)
+    for seed in seeds:
+        first = _trace(programs, seed, steps, referee, scenario)
+        second = _trace(programs, seed, steps, referee, scenario)
+        for step, (a, b) in enumerate(zip(first, second)):
+            if a != b:
+                return seed, step
+    return None
+
+
+def open_cache(
+    directory: Optional[str],
+    pairings: Iterable[Tuple[str, str]],
+    max_bytes: int = 64 * 1024 * 1024,
+    check_steps: int = 600,
+    referee: bool = True,
+    scenario: Optional[str] = None,
+) -> Optional[ResultCache]:
+    """Opens a ResultCache after checking that the matches of every pairing to cache are deterministic.
+
+    The check is played with the settings of the matches to cache, and the success of each pairing is stored
+    in the cache under the key of the checked match (see match_key), so it is only played again once the
+    programs, the simulation or these settings change.
+
+    Args:
+        directory: Directory of the cache, None for no cache.
+        pairings: (own, opponent) names of the program modules of every pairing whose results are cached.
+        max_bytes: Size the entries may take in total, see ResultCache.
+        check_steps: Number of physics steps of the match played twice by check_determinism.
+        referee: Whether a Referee judges the rules of the matches.
+        scenario: Name of the scenario of the matches (see scenario.py), the default one if not given.
+
+    Returns: The cache, or None (with a warning) if no directory was given or the check failed for any
+        pairing.
+    """
+
+    if directory is None:
+        return None
+    cache = ResultCache(directory, max_bytes)
+    for own, opponent in pairings:
+        key = match_key(
+            own,
+            opponent,
+            0,
+            check_steps,
+            scenario,
+            referee=referee,
+            check="determinism",
+        )
+        if key in cache:
+            continue
+        divergence = check_determinism(
+            own, opponent, (0,), check_steps, referee, scenario
+        )
+        if divergence is not None:
+            print(
+                f"warning: {own} vs {opponent} is not deterministic (diverged at step {divergence[1]}), "
+                "not using the result cache",
+                file=sys.stderr,
+            )
+            return None
+        cache.put(key, {"deterministic": True})
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks that headless matches are deterministic, so that their outcomes can be cached."
+    )
+    parser.add_argument("--own", default="examples.own")
+    parser.add_argument("--opponent", default="examples.opponent")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0])
+    parser.add_argument("--steps", type=int, default=60 * 60)
+    parser.add_argument(
+        "--no-referee", action="store_true", help="do not judge the rules"
+    )
+    parser.add_argument(
+        "--scenario", default=None, help="scenario to play (see scenario.py)"
+    )
+    args = parser.parse_args()
+
+    divergence = check_determinism(
+        args.own,
+        args.opponent,
+        args.seeds,
+        args.steps,
+        not args.no_referee,
+        args.scenario,
+    )
+    if divergence is None:
+        print(f"deterministic over {len(args.seeds)} seeds of {args.steps} steps")
+    else:
+        print("not deterministic: seed {}, diverged at step {}".format(*divergence))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
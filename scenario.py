@@ -0,0 +1,428 @@
+"""Scenarios: the field, robots and ball of a match, described in JSON files and compiled once into templates.
+
+A scenario file (see scenarios/default.json, the field every match is played on unless told otherwise) has:
+    field: width and height. The window only draws fields of SCREEN_WIDTH by SCREEN_HEIGHT, bigger fields
+        (see scale) can only be played headless.
+    scale: optional factor every position and length of the field is multiplied by (the field, the static
+        shapes except their radius, the goals, the spawns and the position of the ball), to play larger teams
+        on a larger field. Robots, the ball and the thickness of walls and lines keep their size.
+    materials: friction and elasticity, by name.
+    filters: shape filters, by name, as categories and either a mask or the categories not collided with
+        (exclude). The robots use the filter named robot (each in a group of its own), the ball the one named
+        ball, and the goal sensors the one named goal.
+    static: groups of static shapes, added to the space in this order. Each has a name, a radius, segments
+        ([x1, y1, x2, y2]) and/or circles ([x, y, radius], added first), and optionally a material, a filter,
+        and "line": true for the white lines seen by the line sensors of the robots. The groups named
+        fieldLines and penaltyLines are required.
+    goals: sensor boxes in the mouth of each goal, as a bb ([left, bottom, right, top]), the side of the box
+        facing the field ("top" or "bottom", moved in by half the ball so that a goal is scored as the centre
+        of the ball crosses the line) and the team scoring in it (0 for own robots, 1 for the opponents).
+    robots: kinds of robots, by name, as the image, scale and mass of a robot.
+    teams: the own then the opponent team, each with the kind of its robots, their orientation (in radians,
+        Robot's default if not given) and the position of every robot (any number of them, at least one),
+        attack robot first.
+    ball: image, scale, mass, position, velocity (optional), and jitter: how far a seeded match moves the ball
+        off its position at kickoff, at most, along each axis.
+
+A scenario can start from another one with "extends": the name of the scenario it is merged into (objects are
+merged key by key, anything else replaces what the other scenario has). Names are looked up in scenarios/ (paths
+ending in .json are read as they are).
+
+Loading a scenario parses, validates and resolves it once into a ScenarioTemplate (cached by name), from which
+every Match builds its shapes and bodies without going through the file again.
+
+Example:
+    match = Match(config, attack, defend, o_attack, o_defend, scenario="penalty")
+"""
+
+import functools
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pymunk
+
+from tools import *
+
+__all__ = ["ScenarioTemplate", "load_scenario", "compile_scenario", "resolve_scenario"]
+
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+DEFAULT_SCENARIO = "default"
+# collision type of the static shapes seen by the line sensors, see Match.line
+LINE_COLLISION_TYPE = 3
+
+Point = Tuple[float, float]
+
+
+@dataclass(frozen=True)
+class StaticGroup:
+    """A group of static shapes sharing a material and a filter."""
+
+    name: str
+    segments: Tuple[Tuple[Point, Point], ...]
+    circles: Tuple[Tuple[Point, float], ...]
+    radius: float
+    friction: Optional[float]
+    elasticity: Optional[float]
+    filter: Optional[pymunk.ShapeFilter]
+    line: bool
+
+
+@dataclass(frozen=True)
+class GoalSpec:
+    """The sensor in the mouth of a goal."""
+
+    bb: Tuple[float, float, float, float]
+    mouth: str
+    scoredBy: int
+
+
+@dataclass(frozen=True)
+class TeamSpec:
+    """The robots of a team."""
+
+    image: str
+    scale: float
+    mass: float
+    orientation: Optional[float]
+    spawns: Tuple[Point, ...]
+
+
+@dataclass(frozen=True)
+class BallSpec:
+    """The ball, where it starts and how fast."""
+
+    image: str
+    scale: float
+    mass: float
+    position: Point
+    velocity: Point
+    jitter: float
+
+
+class ScenarioTemplate:
+    """A compiled scenario, building the shapes and bodies of a Match (see the module docstring).
+
+    Attributes:
+        name: Name of the scenario.
+        width: Width of the field.
+        height: Height of the field.
+        digest: Hash of the scenario (once extended), identifying it in a ResultCache.
+        groups: Static shape groups, in the order they are added to the space.
+        goals: Goal sensors.
+        teams: Own then opponent team.
+        ball: The ball.
+        robotFilter: Filter of the robots, without their group.
+        ballFilter: Filter of the ball.
+        goalFilter: Filter of the goal sensors.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        digest: str,
+        field: Point,
+        groups: List[StaticGroup],
+        goals: List[GoalSpec],
+        teams: List[TeamSpec],
+        ball: BallSpec,
+        filters: Dict[str, pymunk.ShapeFilter],
+    ):
+        self.name = name
+        self.digest = digest
+        self.width, self.height = field
+        self.groups = groups
+        self.goals = goals
+        self.teams = teams
+        self.ball = ball
+        self.robotFilter = filters["robot"]
+        self.ballFilter = filters["ball"]
+        self.goalFilter = filters["goal"]
+
+    def __repr__(self) -> str:
+        return f"ScenarioTemplate({self.name!r})"
+
+    def build_static(self, space: pymunk.Space) -> Dict[str, List[pymunk.Shape]]:
+        """Adds the static shapes to a space, on a static body of their own.
+
+        Returns: The shapes of every group, by name.
+        """
+
+        body = pymunk.Body(body_type=pymunk.Body.STATIC)
+        space.add(body)
+        shapes: Dict[str, List[pymunk.Shape]] = {}
+        for group in self.groups:
+            built = [
+                pymunk.Circle(body, radius, offset) for offset, radius in group.circles
+            ] + [pymunk.Segment(body, a, b, group.radius) for a, b in group.segments]
+            for shape in built:
+                if group.friction is not None:
+                    shape.friction = group.friction
+                if group.elasticity is not None:
+                    shape.elasticity = group.elasticity
+                if group.filter is not None:
+                    shape.filter = group.filter
+                if group.line:
+                    shape.collision_type = LINE_COLLISION_TYPE
+            space.add(*built)
+            shapes[group.name] = built
+        return shapes
+
+    @property
+    def teamSizes(self) -> List[int]:
+        """Number of robots of each team."""
+
+        return [len(team.spawns) for team in self.teams]
+
+    def build_robots(self) -> List[Robot]:
+        """Returns the robots of both teams, own team first (not added to any space)."""
+
+        robots = []
+        for team in self.teams:
+            for x, y in team.spawns:
+                if team.orientation is None:
+                    robots.append(Robot(team.image, team.scale, team.mass, x, y))
+                else:
+                    robots.append(
+                        Robot(
+                            team.image,
+                            team.scale,
+                            team.mass,
+                            x,
+                            y,
+                            orientation=team.orientation,
+                        )
+                    )
+        return robots
+
+    def build_ball(self) -> PymunkSprite:
+        """Returns the ball at its position, moving at its velocity (not added to any space)."""
+
+        ball = PymunkSprite(
+            self.ball.image, self.ball.scale, self.ball.mass, *self.ball.position
+        )
+        if self.ball.velocity != (0, 0):
+            ball.body.velocity = self.ball.velocity
+        return ball
+
+    def build_goals(self, space: pymunk.Space, inset: float) -> List[pymunk.Poly]:
+        """Adds the goal sensors to a space, on its static body.
+
+        Args:
+            space: The space.
+            inset: Distance to move the side of every sensor facing the field by, into the goal.
+
+        Returns: The sensors, in the order of the goals.
+        """
+
+        sensors = []
+        for goal in self.goals:
+            left, bottom, right, top = goal.bb
+            if goal.mouth == "top":
+                top -= inset
+            else:
+                bottom += inset
+            sensor = pymunk.Poly.create_box_bb(
+                space.static_body, pymunk.BB(left, bottom, right, top)
+            )
+            sensor.sensor = True
+            sensor.filter = self.goalFilter
+            sensors.append(sensor)
+        space.add(*sensors)
+        return sensors
+
+
+def _read(name: str) -> Dict[str, Any]:
+    """Reads a scenario file, merged into the scenario it extends if any."""
+
+    path = (
+        name if name.endswith(".json") else os.path.join(SCENARIO_DIR, name + ".json")
+    )
+    with open(path) as file:
+        spec = json.load(file)
+    if "extends" in spec:
+        spec = _merge(_read(spec.pop("extends")), spec)
+    return spec
+
+
+def _merge(base: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Merges a scenario into the scenario it extends."""
+
+    merged = dict(base)
+    for key, value in spec.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = _merge(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+def _point(value: Any, where: str) -> Point:
+    if not (
+        isinstance(value, list)
+        and len(value) == 2
+        and all(isinstance(x, (int, float)) for x in value)
+    ):
+        raise ValueError(f"{where}: expected [x, y], got {value!r}")
+    return value[0], value[1]
+
+
+def _numbers(value: Any, count: int, where: str) -> List[float]:
+    if not (
+        isinstance(value, list)
+        and len(value) == count
+        and all(isinstance(x, (int, float)) for x in value)
+    ):
+        raise ValueError(f"{where}: expected {count} numbers, got {value!r}")
+    return value
+
+
+def _scaled(values: Any, scale: float) -> tuple:
+    return tuple(value * scale for value in values)
+
+
+def _lookup(table: Dict[str, Any], name: Optional[str], kind: str, where: str) -> Any:
+    if name is None:
+        return None
+    if name not in table:
+        raise ValueError(f"{where}: unknown {kind} {name!r}")
+    return table[name]
+
+
+def compile_scenario(spec: Dict[str, Any], name: str = "scenario") -> ScenarioTemplate:
+    """Validates and resolves a scenario (already extended) into a ScenarioTemplate.
+
+    Args:
+        spec: The scenario, as read from its file.
+        name: Name of the scenario, for error messages.
+
+    Raises:
+        ValueError: If the scenario is invalid.
+    """
+
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    try:
+        scale = spec.get("scale", 1)
+        if not isinstance(scale, (int, float)) or scale <= 0:
+            raise ValueError(f"{name}: scale must be a positive number")
+        field = (spec["field"]["width"] * scale, spec["field"]["height"] * scale)
+
+        filters: Dict[str, pymunk.ShapeFilter] = {}
+        for key, value in spec.get("filters", {}).items():
+            mask = value.get("mask", pymunk.ShapeFilter.ALL_MASKS())
+            if "exclude" in value:
+                mask = pymunk.ShapeFilter.ALL_MASKS() ^ value["exclude"]
+            filters[key] = pymunk.ShapeFilter(
+                categories=value.get("categories", pymunk.ShapeFilter.ALL_CATEGORIES()),
+                mask=mask,
+            )
+        for key in ("robot", "ball", "goal"):
+            _lookup(filters, key, "filter", f"{name}: filters")
+        materials = spec.get("materials", {})
+
+        groups = []
+        for idx, group in enumerate(spec["static"]):
+            where = f"{name}: static[{idx}]"
+            material = _lookup(materials, group.get("material"), "material", where)
+            groups.append(
+                StaticGroup(
+                    group["name"],
+                    tuple(
+                        (
+                            _scaled(_numbers(segment, 4, where)[:2], scale),
+                            _scaled(segment[2:], scale),
+                        )
+                        for segment in group.get("segments", [])
+                    ),
+                    tuple(
+                        (
+                            _scaled(_numbers(circle, 3, where)[:2], scale),
+                            circle[2] * scale,
+                        )
+                        for circle in group.get("circles", [])
+                    ),
+                    group.get("radius", 0),
+                    None if material is None else material.get("friction"),
+                    None if material is None else material.get("elasticity"),
+                    _lookup(filters, group.get("filter"), "filter", where),
+                    bool(group.get("line", False)),
+                )
+            )
+        names = [group.name for group in groups]
+        for required in ("fieldLines", "penaltyLines"):
+            if required not in names:
+                raise ValueError(f"{name}: no static group named {required}")
+
+        goals = []
+        for idx, goal in enumerate(spec["goals"]):
+            where = f"{name}: goals[{idx}]"
+            if goal["mouth"] not in ("top", "bottom"):
+                raise ValueError(f"{where}: mouth must be top or bottom")
+            if goal["scoredBy"] not in (0, 1):
+                raise ValueError(f"{where}: scoredBy must be 0 or 1")
+            goals.append(
+                GoalSpec(
+                    _scaled(_numbers(goal["bb"], 4, where), scale),
+                    goal["mouth"],
+                    goal["scoredBy"],
+                )
+            )
+
+        teams = []
+        if len(spec["teams"]) != 2:
+            raise ValueError(f"{name}: expected 2 teams")
+        for idx, team in enumerate(spec["teams"]):
+            where = f"{name}: teams[{idx}]"
+            robot = _lookup(spec["robots"], team["robot"], "robot", where)
+            if not team["spawns"]:
+                raise ValueError(f"{where}: a team needs at least one robot")
+            teams.append(
+                TeamSpec(
+                    robot["image"],
+                    robot["scale"],
+                    robot["mass"],
+                    team.get("orientation"),
+                    tuple(
+                        _scaled(_point(spawn, where), scale) for spawn in team["spawns"]
+                    ),
+                )
+            )
+
+        ball = spec["ball"]
+        ballSpec = BallSpec(
+            ball["image"],
+            ball["scale"],
+            ball["mass"],
+            _scaled(_point(ball["position"], f"{name}: ball"), scale),
+            _point(ball.get("velocity", [0, 0]), f"{name}: ball"),
+            ball.get("jitter", 0),
+        )
+    except KeyError as error:
+        raise ValueError(f"{name}: missing {error.args[0]!r}") from None
+
+    return ScenarioTemplate(
+        name, digest, field, groups, goals, teams, ballSpec, filters
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_scenario(name: str = DEFAULT_SCENARIO) -> ScenarioTemplate:
+    """Returns the template of a scenario, read and compiled the first time it is asked for.
+
+    Args:
+        name: Name of a file in scenarios/ (without .json), or the path of a scenario file.
+
+    Raises:
+        ValueError: If the scenario is invalid.
+    """
+
+    return compile_scenario(_read(name), name)
+
+
+def resolve_scenario(scenario: Union[str, ScenarioTemplate, None]) -> ScenarioTemplate:
+    """Returns the template of a scenario given by name or template, the default scenario for None."""
+
+    if isinstance(scenario, ScenarioTemplate):
+        return scenario
+    return load_scenario(DEFAULT_SCENARIO if scenario is None else scenario)
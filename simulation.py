@@ -1,422 +1,878 @@
+import heapq
 import math
+import random
 import timeit
-from typing import Dict, List, Optional, Tuple, Union
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
-import arcade
+import numpy as np
 import pymunk
+from pymunk._chipmunk_cffi import ffi, lib
 
+from observation import Observation, ObservationState, legacy_adapter
+from scenario import ScenarioTemplate, resolve_scenario
+from timings import Timings
 from tools import *
 
+# physics
+# duration of a frame at normal speed (and of a physics step without substeps)
+TIME_STEP = 1 / 60.0
+# default number of times per second a program runs, see tools.control_rate
+CONTROL_RATE = 60
+WORST_CALLS = 5  # number of slowest runs of a program kept in its stats
 
-class SimWin(arcade.Window):
-    """Main Simulation Window"""
+# TOF sensors
+TOF_RANGE = 1000  # longest distance a TOF sensor can measure
+TOF_NOISE = 3.0  # standard deviation of the noise added to TOF readings
+TOF_NOISE_BLOCK = 600  # number of steps of noise generated at once
+TOF_MASK = 0b1011  # TOF sensors see walls, goals and robots, not lines or the ball
 
-    def __init__(self, width, height, title):
-        """create variables"""
+# goals (their collision categories come from the filters of the scenario)
+GOAL_COLLISION_TYPE = 4  # robots are 1, the ball 2 and lines 3
 
-        # init parent class
-        super().__init__(width, height, title)
+# spatial hash broadphase (see Match), tuned with benchmarks/scaling.py
+# size of the cells, about the size of a robot
+SPATIAL_HASH_DIM = 60
+# number of cells per shape in the space
+SPATIAL_HASH_CELLS = 10
 
-        # set up background
-        self.drawTimeText = None
-        arcade.set_background_color(arcade.color.AMAZON)
-        self.background: Optional[arcade.texture.Texture] = None
+# grids of candidate lines, shared by every LineIndex built over the same geometry
+_lineGrids: Dict[tuple, Tuple[List[int], List[tuple], int, int]] = {}
 
-        # pymunk space
-        self.space: Optional[pymunk.Space] = None
-
-        # lists/elements
-        self.dynamicSpriteList: Optional[arcade.SpriteList] = None
-        self.robots: Optional[List[Robot]] = None
-        self.arrowsList: Optional[arcade.ShapeElementList] = None
-        self.fieldLines: Optional[List[pymunk.Segment]] = None
-        self.penaltyLines: Optional[List[Union[pymunk.Segment, pymunk.Circle]]] = None
-        self.ball: Optional[PymunkSprite] = None
-        self.ballAngle: float = 0  # ball info
-
-        # debug info
-        self.drawTime: float = 0
-        self.processingTime: float = 0
-        self.refreshRate: float = 0
-
-        # controls
-        self.mousePos: Tuple[float, float] = (0, 0)
-        self.key: int = 0
-        self.pause: bool = False
-
-        # some arrow stuff
-        self.arrowState: int = 0
-        self.arrowStart: Tuple[float, float] = (0, 0)
-        self.arrowEnd: Tuple[float, float] = (0, 0)
-
-        # joints
-        self.j1: Optional[pymunk.constraints.PivotJoint] = None
-        self.j2: Optional[pymunk.constraints.GearJoint] = None
 
-        # programs
-        self.pconfig: Dict[str, bool] = {}
-        self.attack: Optional[ProgramType] = None
-        self.defend: Optional[ProgramType] = None
-        self.o_attack: Optional[ProgramType] = None
-        self.o_defend: Optional[ProgramType] = None
+class LineIndex:
+    """A precomputed grid over the field, for finding the lines a robot touches without checking every line.
+
+    Every cell lists the lines that a robot centred anywhere in the cell could touch, so a lookup only
+    has to run pymunk's exact collision check against those (usually none) instead of against every line.
+    The grid only depends on the line geometry, so it is built once and shared between matches.
+    """
+
+    def __init__(
+        self,
+        lines: List[Union[pymunk.Segment, pymunk.Circle]],
+        reach: float,
+        cell_size: float = 8,
+        size: Tuple[float, float] = (SCREEN_WIDTH, SCREEN_HEIGHT),
+    ):
+        """
+        Args:
+            lines: The static line shapes (Segments and Circles).
+            reach: Largest distance from the centre of a robot to any point of its shape.
+            cell_size: Size of the (square) grid cells.
+            size: (width, height) of the field covered by the grid, robots outside it check every line.
+        """
+
+        self.lines = lines
+        self.cellSize = cell_size
+        key = (
+            tuple(
+                (
+                    (line.a, line.b, line.radius)
+                    if isinstance(line, pymunk.Segment)
+                    else (line.offset, line.radius)
+                )
+                for line in lines
+            ),
+            reach,
+            cell_size,
+            size,
+        )
+        if key not in _lineGrids:
+            _lineGrids[key] = self._build(reach, size)
+        cellIds, candidates, self.columns, self.rows = _lineGrids[key]
+        # few cells have distinct candidates, so each distinct tuple of shapes is only built once
+        shapes = [tuple(lines[idx] for idx in cell) for cell in candidates]
+        self.cells: List[Tuple[Union[pymunk.Segment, pymunk.Circle], ...]] = list(
+            map(shapes.__getitem__, cellIds)
+        )
+
+    def _build(
+        self, reach: float, size: Tuple[float, float]
+    ) -> Tuple[List[int], List[tuple], int, int]:
+        """Finds the candidate lines of every cell.
+
+        Returns: A tuple of (index of the candidates of every cell, distinct candidates as tuples of indices into
+            the lines, columns, rows).
+        """
+
+        columns = int(size[0] // self.cellSize) + 1
+        rows = int(size[1] // self.cellSize) + 1
+        ys, xs = np.mgrid[0:rows, 0:columns]
+        points = (np.stack([xs.ravel(), ys.ravel()], axis=1) + 0.5) * self.cellSize
 
-    def setup(
+        # anything within reach of any point of the cell
+        margin = reach + self.cellSize * math.sqrt(2) / 2
+        candidates = np.zeros((len(points), len(self.lines)), dtype=bool)
+        for idx, line in enumerate(self.lines):
+            if isinstance(line, pymunk.Segment):
+                a = np.array(line.a)
+                ab = np.array(line.b) - a
+                t = np.clip((points - a) @ ab / ab.dot(ab), 0, 1)
+                closest = a + t[:, None] * ab
+            else:
+                closest = np.array(line.offset)
+            distance = np.linalg.norm(points - closest, axis=1) - line.radius
+            candidates[:, idx] = distance <= margin
+
+        distinct: Dict[tuple, int] = {}
+        cellIds = [
+            distinct.setdefault(tuple(np.flatnonzero(cell)), len(distinct))
+            for cell in candidates
+        ]
+        return cellIds, list(distinct), columns, rows
+
+    def query(self, shape: pymunk.Shape) -> pymunk.Vec2d:
+        """Sums the normals of every line touching a shape, see Match.line.
+
+        Args:
+            shape: The shape of a robot.
+        """
+
+        x, y = shape.body.position
+        column = int(x // self.cellSize)
+        row = int(y // self.cellSize)
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            lines = self.cells[row * self.columns + column]
+        else:
+            lines = self.lines
+
+        resultant = pymunk.Vec2d(0, 0)
+        for line in lines:
+            contacts = line.shapes_collide(shape)
+            if contacts.points:
+                resultant += contacts.normal
+        return resultant
+
+
+class TOFSensors:
+    """Time-of-flight distance sensors of every robot.
+
+    Each robot has four sensors along its own axes, clockwise starting from the front, which measure the
+    distance from the centre of the robot to the first wall, goal or robot (any shape in TOF_MASK) using
+    pymunk segment queries, issued in one batch for every robot to read (see measure). SensorCache.tof reads
+    every robot due at once, and no robot whose readings are not read in a step, so those cost no queries. Noise is drawn from blocks of pre-generated normal samples, indexed
+    by step and robot, so the readings of a robot do not depend on which other sensors are read, in that step
+    or any earlier one.
+    """
+
+    def __init__(
+        self,
+        space: pymunk.Space,
+        robots: List[Robot],
+        raycast: bool = True,
+        noise: float = TOF_NOISE,
+        seed: Optional[int] = None,
+        size: Tuple[float, float] = (SCREEN_WIDTH, SCREEN_HEIGHT),
+    ):
+        """
+        Args:
+            space: The pymunk.Space to query.
+            robots: Every robot, each robot's shape must be in its own ShapeFilter group (so that its
+                sensors do not see itself).
+            raycast: Whether to measure along each robot's axes. If False, readings are the distances to the
+                edges of the field along the world axes, without noise (the original fake readings).
+            noise: Standard deviation of the noise added to raycast readings.
+            seed: Seed of the noise, random if not given.
+            size: (width, height) of the field, for the readings without raycasts.
+        """
+
+        self.space = space
+        self.width, self.height = size
+        self.robots = robots
+        self.raycast = raycast
+        self.noise = noise
+        self.readings = np.zeros((len(robots), 4))
+        self.filters = [
+            pymunk.ShapeFilter(group=robot.sprite.shape.filter.group, mask=TOF_MASK)
+            for robot in robots
+        ]
+        # the noise of a step only depends on this and the step, see next_step
+        self.entropy: int = np.random.SeedSequence(seed).entropy
+        self.noiseBlock: Optional[np.ndarray] = None
+        self.blockNumber = -1
+        # noise of the current step, by robot
+        self._noise: Optional[List[List[float]]] = None
+        self._info = ffi.new("cpSegmentQueryInfo *")
+        # the filters as chipmunk structs, so they are not converted for every query
+        self._filters = [
+            ffi.new("cpShapeFilter *", shape_filter)[0] for shape_filter in self.filters
+        ]
+
+    def update(self, step: int) -> np.ndarray:
+        """Reads every sensor of every robot.
+
+        Args:
+            step: Step of the match, which picks the noise.
+
+        Returns: A (robots, 4) array of readings, also kept as the readings attribute.
+        """
+
+        self.next_step(step)
+        self.measure(range(len(self.robots)))
+        return self.readings
+
+    def next_step(self, step: int) -> None:
+        """Picks the noise of a step, to be called before measure in every step in which sensors are read.
+
+        Noise is generated TOF_NOISE_BLOCK steps at a time, each block from the entropy and its number.
+
+        Args:
+            step: Step of the match.
+        """
+
+        if self.raycast and self.noise:
+            number, row = divmod(step, TOF_NOISE_BLOCK)
+            if number != self.blockNumber:
+                rng = np.random.default_rng([self.entropy, number])
+                self.noiseBlock = rng.normal(
+                    0, self.noise, (TOF_NOISE_BLOCK, len(self.robots), 4)
+                )
+                self.blockNumber = number
+            self._noise = self.noiseBlock[row].tolist()
+
+    def measure(self, indices: Iterable[int]) -> None:
+        """Reads the sensors of some robots, in one batch of queries, into their rows of the readings attribute.
+
+        Args:
+            indices: Indices of the robots in robots.
+        """
+
+        readings = self.readings
+        robots = self.robots
+        if not self.raycast:
+            for idx in indices:
+                x, y = robots[idx].sprite.body.position
+                readings[idx] = (self.height - y, self.width - x, y, x)
+            return
+
+        # same as space.segment_query_first, calling chipmunk directly with a reused result struct
+        # (skips building a SegmentQueryInfo per query, which is most of its cost); the noise is added and
+        # clipped on Python floats, which costs less than numpy operations on a row of four
+        query = lib.cpSpaceSegmentQueryFirst
+        space = self.space._space
+        info = self._info
+        null = ffi.NULL
+        noise = self._noise if self.noise else None
+        for idx in indices:
+            body = robots[idx].sprite.body._body
+            position = lib.cpBodyGetPosition(body)
+            x, y = position.x, position.y
+            angle = lib.cpBodyGetAngle(body)
+            c = math.cos(angle) * TOF_RANGE
+            s = math.sin(angle) * TOF_RANGE
+            shape_filter = self._filters[idx]
+            values = []
+            # front, right, back and left, rotated by the angle of the robot
+            for end in ((x - s, y + c), (x + c, y + s), (x + s, y - c), (x - c, y - s)):
+                if query(space, (x, y), end, 0, shape_filter, info) == null:
+                    values.append(TOF_RANGE)
+                else:
+                    values.append(info.alpha * TOF_RANGE)
+            if noise is not None:
+                values = [
+                    min(max(value + offset, 0.0), TOF_RANGE)
+                    for value, offset in zip(values, noise[idx])
+                ]
+            readings[idx] = values
+
+
+class SensorCache:
+    """Sensor values of every robot, computed at most once per physics step.
+
+    Values are computed the first time they are asked for and kept until clear() is called,
+    which Match does after every space.step (and whenever bodies are moved by hand).
+    Bodies only move during space.step, so every program in a step is served the same values.
+    """
+
+    def __init__(self, match: "Match"):
+        self.match = match
+        self._lines: Dict[int, pymunk.Vec2d] = {}
+        self._ball: Dict[int, Tuple[pymunk.Vec2d, float, float]] = {}
+        # robots whose TOF sensors were read in this step
+        self._tof: Set[int] = set()
+        self._positions: Optional[Tuple[pymunk.Vec2d, Sequence]] = None
+
+    def clear(self) -> None:
+        """Throws away every value, to be called whenever a body moves."""
+
+        self._positions = None
+        self._lines.clear()
+        self._ball.clear()
+        self._tof.clear()
+
+    def positions(self) -> Tuple[pymunk.Vec2d, Sequence]:
+        """Returns the position of the ball and the positions of every robot (see LazyPositions)."""
+
+        if self._positions is None:
+            self._positions = (
+                self.match.ball.body.position,
+                LazyPositions(self.match.robots),
+            )
+        return self._positions
+
+    def line(self, robot: Robot) -> pymunk.Vec2d:
+        """Returns the direction of lines detected by a robot, see Match.line."""
+
+        key = id(robot)
+        if key not in self._lines:
+            self._lines[key] = self.match.detect_line(robot)
+        return self._lines[key]
+
+    def ball(self, robot: Robot) -> Tuple[pymunk.Vec2d, float, float]:
+        """Returns the position of the ball relative to a robot.
+
+        Returns: A tuple of (vector from the robot to the ball, bearing of that vector
+            (as from vec_to_world, in radians), distance to the ball).
+        """
+
+        key = id(robot)
+        if key not in self._ball:
+            robot_to_ball = rel_vec_to_point(
+                robot.sprite.body, self.match.ball.body.position, robot.orientation
+            )
+            self._ball[key] = (
+                robot_to_ball,
+                vec_to_world(robot_to_ball),
+                robot_to_ball.length,
+            )
+        return self._ball[key]
+
+    def tof(self, index: Optional[int] = None) -> np.ndarray:
+        """Returns the TOF sensor readings of a robot, or the (robots, 4) readings of every robot, see Robot.
+
+        The sensors of a robot are read in place the first time its readings are asked for in a step,
+        so robots whose readings no program reads cost no raycasts.
+
+        Args:
+            index: Index of the robot in Match.robots, None for every robot.
+        """
+
+        sensors = self.match.tofSensors
+        if index is None:
+            due = [idx for idx in range(len(sensors.robots)) if idx not in self._tof]
+        elif index not in self._tof:
+            due = [index]
+        else:
+            return sensors.readings[index]
+        if due:
+            timings = self.match.timings
+            if timings is not None:
+                start_time = timeit.default_timer()
+            if not self._tof:
+                sensors.next_step(self.match.steps)
+            sensors.measure(due)
+            self._tof.update(due)
+            if timings is not None:
+                timings.add_nested("tof", timeit.default_timer() - start_time)
+        return sensors.readings if index is None else sensors.readings[index]
+
+
+class LazyTOFReadings(Sequence):
+    """TOF readings of a robot, only measured when they are first read in a step (see SensorCache.tof).
+
+    Behaves like the list of readings, so programs can keep indexing robot.TOFReadings, but reads them
+    straight from the array the sensors write to, so no list is built per step.
+    """
+
+    __slots__ = ("sensors", "index")
+
+    def __init__(self, sensors: SensorCache, index: int):
+        """
+        Args:
+            sensors: The SensorCache of the match.
+            index: Index of the robot in Match.robots.
+        """
+
+        self.sensors = sensors
+        self.index = index
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.sensors.tof(self.index)[idx].tolist()
+        return self.sensors.tof(self.index).item(idx)
+
+    def __len__(self) -> int:
+        return 4
+
+    def __repr__(self) -> str:
+        return repr(self.sensors.tof(self.index).tolist())
+
+
+class LazyPositions(Sequence):
+    """Positions of every robot in a step, each only read when it is first asked for.
+
+    Behaves like the list of positions (robotPositions of the original program signature), without building a
+    pymunk.Vec2d per robot per step, so that with large teams programs only pay for the positions they read.
+    A new one is made every step (see SensorCache.positions), so a program keeping it keeps that step's values.
+    """
+
+    __slots__ = ("robots", "values")
+
+    def __init__(self, robots: List[Robot]):
+        self.robots = robots
+        self.values: List[Optional[pymunk.Vec2d]] = [None] * len(robots)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self.values)))]
+        value = self.values[idx]
+        if value is None:
+            value = self.values[idx] = self.robots[idx].sprite.body.position
+        return value
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def dribble_zone(bearing: float, distance: float) -> int:
+    """Returns which catchment area of a robot the ball is in, as the dribbleState it gives.
+
+    Args:
+        bearing: Bearing of the ball from the robot (as from vec_to_world, in radians).
+        distance: Distance from the robot to the ball.
+
+    Returns: 1 for the front catchment area, 2 for the back one, 0 for neither.
+    """
+
+    bearing = bearing * 180 / math.pi
+    if (bearing > 346 or bearing < 14) and distance < 40:
+        return 1
+    elif (166 < bearing < 194) and distance < 40:
+        return 2
+    return 0
+
+
+@dataclass
+class GoalEvent:
+    """A goal scored in a Match.
+
+    Attributes:
+        step: Step in which the ball entered the goal.
+        team: Team that scored, 0 for own robots (scoring in the blue goal at the top), 1 for opponents.
+        score: Score after the goal, as [own, opponent].
+    """
+
+    step: int
+    team: int
+    score: Tuple[int, int]
+
+
+@dataclass
+class ScheduledProgram:
+    """A program run by a Match, and how often it runs.
+
+    Attributes:
+        name: Name of the program ("attack", "defend", "o_attack" or "o_defend").
+        program: The program, None if its robots are controlled from outside.
+        robots: Robots passed to the program.
+        call: The program taking an Observation (through legacy_adapter for the original signature).
+        observation: The Observation passed to the program, updated in place every step.
+        interval: Number of physics steps from one run of the program to the next.
+        dribbling: Robots the program dribbled with in its last run, which keep dribbling until its next run.
+        worker: ProgramWorker running the program in another process (see workers.py), if isolated.
+        calls: Number of runs of the program.
+        time: Total time taken by the program (in seconds).
+        maxTime: Time taken by the slowest run.
+        overBudget: Number of runs over the budget of the match.
+        timeouts: Number of runs an isolated program did not answer in time for.
+        errors: Number of runs of an isolated program that raised an exception.
+        lastError: Traceback of the last exception raised by an isolated program.
+        worst: The slowest runs, as a heap of (time, step).
+    """
+
+    name: str
+    program: Optional[ProgramType]
+    robots: List[Robot]
+    interval: int = 1
+    call: Optional[Callable[[Observation], None]] = None
+    observation: Optional[Observation] = None
+    dribbling: List[Robot] = field(default_factory=list)
+    worker: Optional[Any] = None
+    calls: int = 0
+    time: float = 0
+    maxTime: float = 0
+    overBudget: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    lastError: Optional[str] = None
+    worst: List[Tuple[float, int]] = field(default_factory=list)
+
+    def account(self, seconds: float, step: int, budget: Optional[float]) -> None:
+        """Adds a run of the program to its stats.
+
+        Args:
+            seconds: Time taken by the run.
+            step: Step of the match the run was for.
+            budget: Time allowed per run, if any.
+        """
+
+        self.calls += 1
+        self.time += seconds
+        self.maxTime = max(self.maxTime, seconds)
+        if budget is not None and seconds > budget:
+            self.overBudget += 1
+        if len(self.worst) < WORST_CALLS:
+            heapq.heappush(self.worst, (seconds, step))
+        elif seconds > self.worst[0][0]:
+            heapq.heapreplace(self.worst, (seconds, step))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the stats of the program, with worst as a list of (time, step), slowest first."""
+
+        return {
+            "calls": self.calls,
+            "meanTime": self.time / self.calls if self.calls else 0,
+            "maxTime": self.maxTime,
+            "overBudget": self.overBudget,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "worst": sorted(self.worst, reverse=True),
+        }
+
+
+class Match:
+    """Window-free simulation core.
+
+    Owns the pymunk space, the robots, the ball and the programs controlling them,
+    so that a match can be stepped at full speed without an arcade.Window (or an OpenGL context).
+
+    Attributes:
+        space: The pymunk.Space containing every field element, robot and the ball.
+        robots: List of Robots, the own team then the opponents, each team in the order of its spawns (see
+            scenario.py), e.g. [own attack robot, own defense robot, opponent attack robot, opponent defense robot]
+            in the default scenario.
+        teams: The Robots of each team, as [own robots, opponent robots].
+        robotTeams: Team of each robot of robots (0 for own robots, 1 for the opponents).
+        width: Width of the field.
+        height: Height of the field.
+        ball: PymunkSprite of the ball.
+        ballAngle: Orientation of the ball (in radians).
+        timeStep: Duration of a physics step, TIME_STEP divided by the number of substeps.
+        steps: Number of physics steps taken so far.
+        score: Goals scored, as [own, opponent].
+        goals: GoalEvent of every goal scored so far.
+        goalListeners: Functions called with the GoalEvent of every goal, after the step it was scored in.
+        autoKickoff: Whether the match is reset to the kickoff positions after every goal (see kickoff).
+        possession: Number of steps in which each team dribbled the ball, as [own, opponent].
+        recorder: A Recorder (see recorder.py) recording every step, if any.
+        referee: A Referee (see referee.py) judging the rules after every step, if any.
+        joints: The (pivot joint, gear joint) driving each robot from its targetPointBody.
+        scenario: The ScenarioTemplate the field, robots and ball were built from.
+        fieldShapes: Static shapes of the field, by group name (see scenario.py).
+        goalSensors: Sensor shapes in the mouth of each goal.
+        goalScorers: Team scoring in each goal of goalSensors (0 for own robots, 1 for the opponents).
+    """
+
+    def __init__(
         self,
         config: Dict[str, bool],
-        attack: ProgramType,
-        defend: ProgramType,
-        o_attack: ProgramType,
-        o_defend: ProgramType,
+        attack: Optional[ProgramType],
+        defend: Optional[ProgramType],
+        o_attack: Optional[ProgramType],
+        o_defend: Optional[ProgramType],
+        seed: Optional[int] = None,
+        exact_lines: bool = False,
+        raycast_tof: bool = True,
+        substeps: int = 1,
+        control_rates: Optional[Dict[str, float]] = None,
+        program_budget: Optional[float] = None,
+        isolate: Iterable[str] = (),
+        program_timeout: Optional[float] = None,
+        parallel: bool = False,
+        quiet_workers: bool = False,
+        kickoff: bool = True,
+        scenario: Union[str, ScenarioTemplate, None] = None,
+        spatial_hash: bool = False,
     ):
-        """set up everything"""
+        """set up everything
 
-        # background
-        self.background: arcade.Texture = arcade.load_texture("images/field.jpg")
+        Args:
+            attack, defend, o_attack, o_defend: Programs controlling the robots (attack and defend control the
+                own team, o_attack and o_defend the opponents, whatever the size of the teams), may be None if
+                the robots are controlled from outside (step then leaves them alone).
+            seed: If given, the ball starts slightly off the centre spot (randomised from the seed),
+                so that different seeds play out different matches.
+            exact_lines: Whether line detection checks every line instead of using the LineIndex,
+                to validate the index.
+            raycast_tof: Whether TOF readings are measured with raycasts (see TOFSensors), instead of
+                from the coordinates of the robot.
+            substeps: Number of physics steps per TIME_STEP, for more accurate physics
+                (programs still run at their own control rate, see control_rates).
+            control_rates: Number of times per second to run each program, by name, overriding
+                the rate declared with tools.control_rate (CONTROL_RATE if neither is given).
+                Rates are rounded to a whole number of physics steps between runs.
+            program_budget: Time a run of a program should take at most (in seconds), runs over it are
+                counted in program_stats.
+            isolate: Names of the programs to run in worker processes (see workers.py), so that a slow or
+                stuck program cannot stall the match. Isolated programs run at the same time as each other
+                (and as the programs that are not isolated), each in its own process, so they do not share
+                module-level state with any other program (see parallel). Call close() once done with the
+                match.
+            program_timeout: Time to wait for isolated programs (in seconds) in a step, defaults to
+                program_budget. A program that does not answer in time keeps its previous commands, and so
+                does an isolated program raising an exception (counted in errors, see ScheduledProgram),
+                instead of ending the match.
+            parallel: Whether to isolate every program, so that all four run at the same time and a step
+                takes as long as the slowest program instead of all of them. This does not play the same match
+                as running them in turn: every program sees the state at the start of the step rather than the
+                commands of the programs before it, and programs no longer share globals of their module (in
+                examples/own.py, defend reads the defenseRobot set by attack, and never sees it change). Only
+                use it with programs that do not depend on each other.
+            quiet_workers: Whether isolated programs print to os.devnull instead of the standard output
+                (their worker processes do not see a contextlib.redirect_stdout of the main process).
+            kickoff: Whether to reset the match to the kickoff positions after every goal, so that matches can
+                run unattended. Otherwise the ball stays where it is.
+            scenario: The field, robots and ball (see scenario.py), as the name of a scenario file or a
+                ScenarioTemplate, the default scenario if not given.
+            spatial_hash: Whether the space indexes its shapes in a spatial hash (cells of SPATIAL_HASH_DIM)
+                instead of pymunk's bounding box tree. The tree has been faster with any number of robots
+                measured so far (see benchmarks/scaling.py), so it is the default.
+        """
+
+        self.seed: Optional[int] = seed
+        self.rng = random.Random(seed)
 
         # pymunk space
         self.space: pymunk.Space = pymunk.Space()
         self.space.gravity = (0, 0)
         # self.space.damping = 0.4
         self.space.collision_slop = 0.1
+        self.timeStep: float = TIME_STEP / substeps
+        self.steps: int = 0
 
-        # lists
-        self.dynamicSpriteList = arcade.SpriteList()
-        self.arrowsList = arcade.ShapeElementList()
-
-        # field elements
-        body = pymunk.Body(body_type=pymunk.Body.STATIC)
-        self.space.add(body)
-
-        # walls
-        walls = [
-            pymunk.Segment(body, (0, 0), (SCREEN_WIDTH, 0), 2.0),
-            pymunk.Segment(body, (0, 0), (0, SCREEN_HEIGHT), 2.0),
-            pymunk.Segment(
-                body, (0, SCREEN_HEIGHT), (SCREEN_WIDTH, SCREEN_HEIGHT), 2.0
-            ),
-            pymunk.Segment(body, (SCREEN_WIDTH, SCREEN_HEIGHT), (SCREEN_WIDTH, 0), 2.0),
-        ]
-        for line in walls:
-            line.friction = 0.7
-            line.elasticity = 0.6
-            line.filter = pymunk.ShapeFilter(categories=1)
-        self.space.add(*walls)
-
-        # goals
-        goals = [
-            pymunk.Segment(
-                body, (180, 78), (SCREEN_WIDTH - 180, 78), 2.0
-            ),  # yellow crossbar
-            pymunk.Segment(
-                body,
-                (180, SCREEN_HEIGHT - 78),
-                (SCREEN_WIDTH - 180, SCREEN_HEIGHT - 78),
-                2.0,
-            ),  # blue crossbar
-            pymunk.Segment(body, (180, 60), (SCREEN_WIDTH - 180, 60), 2.0),
-            pymunk.Segment(body, (180, 78), (180, 60), 2.0),
-            pymunk.Segment(
-                body, (SCREEN_WIDTH - 180, 78), (SCREEN_WIDTH - 180, 60), 2.0
-            ),
-            pymunk.Segment(
-                body,
-                (180, SCREEN_HEIGHT - 60),
-                (SCREEN_WIDTH - 180, SCREEN_HEIGHT - 60),
-                2.0,
-            ),
-            pymunk.Segment(
-                body, (180, SCREEN_HEIGHT - 78), (180, SCREEN_HEIGHT - 60), 2.0
-            ),
-            pymunk.Segment(
-                body,
-                (SCREEN_WIDTH - 180, SCREEN_HEIGHT - 78),
-                (SCREEN_WIDTH - 180, SCREEN_HEIGHT - 60),
-                2.0,
-            ),
-        ]
-        for idx, line in enumerate(goals):
-            line.elasticity = 0.9
-            if idx < 2:
-                line.friction = 0.2
-                line.filter = pymunk.ShapeFilter(categories=2)
-            else:
-                line.friction = 1
-                line.filter = pymunk.ShapeFilter(categories=1)
-        self.space.add(*goals)
+        # match stats
+        self.score: List[int] = [0, 0]
+        self.possession: List[int] = [0, 0]
+        self.ballInGoal: bool = False
+        self.goals: List[GoalEvent] = []
+        self.goalListeners: List[Callable[[GoalEvent], None]] = []
+        self.autoKickoff: bool = kickoff
+        # team that scored during the current step, set by the goal sensors
+        self._scored: Optional[int] = None
 
+        # field elements, robots and ball, built from the scenario (see scenario.py)
+        self.scenario: ScenarioTemplate = resolve_scenario(scenario)
+        self.width: float = self.scenario.width
+        self.height: float = self.scenario.height
+        self.fieldShapes: Dict[str, List[pymunk.Shape]] = self.scenario.build_static(
+            self.space
+        )
         # white lines around the field
-        self.fieldLines = [
-            pymunk.Segment(body, (77, 77), (77, SCREEN_HEIGHT - 77), 4.0),
-            pymunk.Segment(
-                body,
-                (77, SCREEN_HEIGHT - 77),
-                (SCREEN_WIDTH - 77, SCREEN_HEIGHT - 77),
-                4.0,
-            ),
-            pymunk.Segment(
-                body,
-                (SCREEN_WIDTH - 77, SCREEN_HEIGHT - 77),
-                (SCREEN_WIDTH - 77, 77),
-                4.0,
-            ),
-            pymunk.Segment(body, (SCREEN_WIDTH - 77, 77), (77, 77), 4.0),
-        ]
-        for line in self.fieldLines:
-            line.filter = pymunk.ShapeFilter(categories=4)
-            line.collision_type = 3
-        self.space.add(*self.fieldLines)
-
+        self.fieldLines: List[pymunk.Segment] = self.fieldShapes["fieldLines"]
         # penalty area lines
-        self.penaltyLines = [
-            pymunk.Circle(body, 40, (210, 110)),
-            pymunk.Circle(body, 40, (210, SCREEN_HEIGHT - 110)),
-            pymunk.Circle(body, 40, (SCREEN_WIDTH - 210, 110)),
-            pymunk.Circle(body, 40, (SCREEN_WIDTH - 210, SCREEN_HEIGHT - 110)),
-            pymunk.Segment(body, (171, 77), (171, 112), 4.0),
-            pymunk.Segment(body, (211, 152), (SCREEN_WIDTH - 211, 152), 4.0),
-            pymunk.Segment(
-                body, (SCREEN_WIDTH - 171, 77), (SCREEN_WIDTH - 171, 112), 4.0
-            ),
-            pymunk.Segment(
-                body, (171, SCREEN_HEIGHT - 77), (171, SCREEN_HEIGHT - 112), 4.0
-            ),
-            pymunk.Segment(
-                body,
-                (211, SCREEN_HEIGHT - 152),
-                (SCREEN_WIDTH - 211, SCREEN_HEIGHT - 152),
-                4.0,
-            ),
-            pymunk.Segment(
-                body,
-                (SCREEN_WIDTH - 171, SCREEN_HEIGHT - 77),
-                (SCREEN_WIDTH - 171, SCREEN_HEIGHT - 112),
-                4.0,
-            ),
-        ]
-        for line in self.penaltyLines:
-            line.filter = pymunk.ShapeFilter(categories=4)
-            line.collision_type = 3
-        self.space.add(*self.penaltyLines)
+        self.penaltyLines: List[Union[pymunk.Segment, pymunk.Circle]] = (
+            self.fieldShapes["penaltyLines"]
+        )
 
         # robots
-        self.robots = [
-            Robot(
-                "images/robot.png",
-                0.02176,
-                2.1,
-                SCREEN_WIDTH / 2,
-                SCREEN_HEIGHT * 17 / 40,
-                orientation=0,
-            ),
-            Robot(
-                "images/robot.png",
-                0.02176,
-                2.1,
-                SCREEN_WIDTH / 2,
-                SCREEN_HEIGHT / 6,
-                orientation=0,
-            ),
-            Robot(
-                "images/enemy.png",
-                0.01611170784103114930182599355532,
-                2.1,
-                SCREEN_WIDTH / 2,
-                SCREEN_HEIGHT * 7 / 10,
-            ),
-            Robot(
-                "images/enemy.png",
-                0.01611170784103114930182599355532,
-                2.1,
-                SCREEN_WIDTH / 2,
-                SCREEN_HEIGHT * 5 / 6,
-            ),
+        self.robots: List[Robot] = self.scenario.build_robots()
+        teamSizes = self.scenario.teamSizes
+        self.teams: List[List[Robot]] = [
+            self.robots[: teamSizes[0]],
+            self.robots[teamSizes[0] :],
         ]
-        for i in range(4):
-            self.dynamicSpriteList.append(self.robots[i].sprite)
-            self.robots[i].sprite.shape.filter = pymunk.ShapeFilter(
-                categories=8, mask=pymunk.ShapeFilter.ALL_MASKS() ^ 0b100
+        self.robotTeams: List[int] = [
+            team for team, size in enumerate(teamSizes) for _ in range(size)
+        ]
+        self.joints: List[Tuple[pymunk.Constraint, pymunk.Constraint]] = []
+        for idx, robot in enumerate(self.robots):
+            # each robot in its own group, so that its TOF sensors do not see itself
+            robot.sprite.shape.filter = self.scenario.robotFilter._replace(
+                group=idx + 1
             )
-            self.robots[i].sprite.shape.collision_type = 1
-            self.j1 = pymunk.constraints.PivotJoint(
-                self.robots[i].targetPointBody,
-                self.robots[i].sprite.body,
+            robot.sprite.shape.collision_type = 1
+            j1 = pymunk.constraints.PivotJoint(
+                robot.targetPointBody,
+                robot.sprite.body,
                 (0, 0),
                 (0, 0),
             )
-            self.j1.max_force = 7000
-            self.j1.max_bias = 0
-            self.j2 = pymunk.constraints.GearJoint(
-                self.robots[i].targetPointBody, self.robots[i].sprite.body, 0, 1
-            )
-            self.j2.max_force = 50000
-            self.space.add(
-                self.robots[i].sprite.body,
-                self.robots[i].sprite.shape,
-                self.j1,
-                self.j2,
+            j1.max_force = 7000
+            j1.max_bias = 0
+            j2 = pymunk.constraints.GearJoint(
+                robot.targetPointBody, robot.sprite.body, 0, 1
             )
+            j2.max_force = 50000
+            self.space.add(robot.sprite.body, robot.sprite.shape, j1, j2)
+            self.joints.append((j1, j2))
 
         # ball
-        self.ball = PymunkSprite(
-            "images/ball.png",
-            0.01897533206831119544592030360531,
-            0.07,
-            SCREEN_WIDTH / 2,
-            SCREEN_HEIGHT / 2,
-        )
-        self.dynamicSpriteList.append(self.ball)
-        self.ball.shape.filter = pymunk.ShapeFilter(
-            categories=16, mask=pymunk.ShapeFilter.ALL_MASKS() ^ 0b110
-        )
+        self.ball: PymunkSprite = self.scenario.build_ball()
+        jitter = self.scenario.ball.jitter
+        if seed is not None and jitter:
+            self.ball.body.position += (
+                self.rng.uniform(-jitter, jitter),
+                self.rng.uniform(-jitter, jitter),
+            )
+        self.ball.shape.filter = self.scenario.ballFilter
         self.ball.shape.collision_type = 2
         self.space.add(self.ball.body, self.ball.shape)
-        self.ballAngle = 0
-        self.j1 = pymunk.constraints.PivotJoint(
+        self.ballAngle: float = 0
+        j1 = pymunk.constraints.PivotJoint(
             self.space.static_body, self.ball.body, (0, 0), (0, 0)
         )
-        self.j1.max_force = 10
-        self.j1.max_bias = 0
-        self.j2 = pymunk.constraints.GearJoint(
-            self.space.static_body, self.ball.body, 0, 1
+        j1.max_force = 10
+        j1.max_bias = 0
+        j2 = pymunk.constraints.GearJoint(self.space.static_body, self.ball.body, 0, 1)
+        j2.max_force = 1000
+        self.space.add(j1, j2)
+
+        # goal sensors, the mouth of each goal behind its crossbar, inset by half the ball so that a goal is
+        # scored as the centre of the ball crosses the crossbar
+        inset = (self.ball.shape.bb.top - self.ball.shape.bb.bottom) / 2
+        self.goalSensors: List[pymunk.Poly] = self.scenario.build_goals(
+            self.space, inset
+        )
+        # team scoring in each goal
+        self.goalScorers: List[int] = [goal.scoredBy for goal in self.scenario.goals]
+        for sensor in self.goalSensors:
+            sensor.collision_type = GOAL_COLLISION_TYPE
+        handler = self.space.add_collision_handler(2, GOAL_COLLISION_TYPE)
+        handler.begin = self.ball_enters_goal
+        handler.separate = self.ball_leaves_goal
+
+        # broadphase, once every shape is in the space
+        if spatial_hash:
+            self.space.use_spatial_hash(
+                SPATIAL_HASH_DIM, SPATIAL_HASH_CELLS * len(self.space.shapes)
+            )
+        # query filters finding every robot but one, see neighbours
+        robotCategories = self.scenario.robotFilter.categories
+        self.neighbourFilters: List[pymunk.ShapeFilter] = [
+            pymunk.ShapeFilter(
+                group=robot.sprite.shape.filter.group,
+                categories=robotCategories,
+                mask=robotCategories,
+            )
+            for robot in self.robots
+        ]
+        # (index, x, y) of every robot found by a query, see neighbours
+        self._found: List[Tuple[int, float, float]] = []
+        try:
+            self._pointQuery = ffi.callback("cpSpacePointQueryFunc", self._found_robot)
+        except MemoryError:
+            # systems not allowing cffi to create callbacks go through space.point_query instead
+            self._pointQuery = None
+
+        # where every body starts, to reset them to after a goal
+        self.kickoffPositions: List[Tuple[pymunk.Vec2d, float]] = [
+            (robot.sprite.body.position, robot.sprite.body.angle)
+            for robot in self.robots
+        ]
+
+        # set by a Recorder (see recorder.py) to record every step
+        self.recorder = None
+        # set by a Referee (see referee.py) to judge the rules after every step
+        self.referee = None
+
+        # set to a Timings to time each phase of a step (see timings.py)
+        self.timings: Optional[Timings] = None
+
+        # sensors
+        self.sensors: SensorCache = SensorCache(self)
+        self.tofSensors: TOFSensors = TOFSensors(
+            self.space,
+            self.robots,
+            raycast_tof,
+            seed=seed,
+            size=(self.width, self.height),
+        )
+        for idx, robot in enumerate(self.robots):
+            robot.TOFReadings = LazyTOFReadings(self.sensors, idx)
+        self.exactLines: bool = exact_lines
+        self.lineIndex: LineIndex = LineIndex(
+            self.fieldLines + self.penaltyLines,
+            max(
+                vertex.length
+                for robot in self.robots
+                for vertex in robot.sprite.shape.get_vertices()
+            ),
+            size=(self.width, self.height),
         )
-        self.j2.max_force = 1000
-        self.space.add(self.j1, self.j2)
 
         # programs
-        self.pconfig = config
-        self.attack = attack
-        self.defend = defend
-        self.o_attack = o_attack
-        self.o_defend = o_defend
-
-    def on_draw(self):
-        """called whenever we need to draw the window"""
-        arcade.start_render()
-        draw_start_time = timeit.default_timer()
-        arcade.draw_texture_rectangle(
-            SCREEN_WIDTH // 2,
-            SCREEN_HEIGHT // 2,
-            SCREEN_HEIGHT,
-            SCREEN_WIDTH,
-            self.background,
-            90,
+        self.pconfig: Dict[str, bool] = config
+        self.attack: Optional[ProgramType] = attack
+        self.defend: Optional[ProgramType] = defend
+        self.o_attack: Optional[ProgramType] = o_attack
+        self.o_defend: Optional[ProgramType] = o_defend
+        # every program is passed an Observation (see observation.py), all of them sharing one state
+        self.observationState: ObservationState = ObservationState(
+            len(self.robots), self.read_bodies
         )
-        self.dynamicSpriteList.draw()
-        if self.arrowsList:
-            self.arrowsList.draw()
-
-        """if self.robots[0].dribbleState == 0:
-            arcade.draw_line(
-                self.robots[0].sprite.body.position.x,
-                self.robots[0].sprite.body.position.y,
-                self.ball.body.position.x,
-                self.ball.body.position.y,
-                arcade.color.RED,
-                1,
+        self.programList: List[ScheduledProgram] = []
+        for name, program, robots in [
+            ("attack", attack, self.teams[0]),
+            ("defend", defend, self.teams[0]),
+            ("o_attack", o_attack, self.teams[1]),
+            ("o_defend", o_defend, self.teams[1]),
+        ]:
+            rate = (control_rates or {}).get(
+                name, getattr(program, "controlRate", CONTROL_RATE)
             )
-        else:
-            arcade.draw_line(
-                self.robots[0].sprite.body.position.x,
-                self.robots[0].sprite.body.position.y,
-                SCREEN_WIDTH / 2,
-                SCREEN_HEIGHT - 78,
-                arcade.color.RED,
-                1,
-            )"""
-
-        # display timings
-        output = f"Processing time: {self.processingTime:.3f}"
-        arcade.draw_text(output, 20, SCREEN_HEIGHT - 20, arcade.color.WHITE)
-        output = f"Drawing time: {self.drawTime:.3f}"
-        arcade.draw_text(output, 20, SCREEN_HEIGHT - 40, arcade.color.WHITE)
-        output = f"Estimated FPS: {self.refreshRate:.1f}"
-        arcade.draw_text(output, 20, SCREEN_HEIGHT - 60, arcade.color.WHITE)
-        # output = f"Mouse: {self.mousePos}"
-        # arcade.draw_text(output, 20, SCREEN_HEIGHT - 60, arcade.color.WHITE)
-
-        self.drawTime = timeit.default_timer() - draw_start_time
-
-    def on_update(self, delta_time: float):
-        self.refreshRate = 1 / delta_time
-        start_time = timeit.default_timer()
-
-        # user interaction
-        if self.key is not None and self.key > 0:
-            if self.key == arcade.MOUSE_BUTTON_RIGHT or self.key == arcade.key.B:
-                self.ball.body.position = pymunk.Vec2d(*self.mousePos)
-                self.ball.body.velocity = (0, 0)
-                print(self.ball.body.position)
-            elif arcade.key.KEY_1 <= self.key <= arcade.key.KEY_4:
-                self.robots[
-                    self.key - arcade.key.KEY_1
-                ].sprite.body.position = pymunk.Vec2d(*self.mousePos)
-                self.robots[self.key - arcade.key.KEY_1].sprite.body.velocity = (0, 0)
-                print(self.robots[self.key - arcade.key.KEY_1].sprite.body.position)
-            elif self.key == arcade.key.Q or self.key == arcade.key.W:
-                self.robots[
-                    0 if self.key == arcade.key.Q else 1
-                ].sprite.body.position = (
-                    SCREEN_WIDTH / 2,
-                    30,
-                )
-                self.robots[
-                    0 if self.key == arcade.key.Q else 1
-                ].sprite.body.velocity = (0, 0)
-                self.robots[0 if self.key == arcade.key.Q else 1].sprite.body.angle = (
-                    math.pi / 2
-                )
-            elif self.key == arcade.key.E or self.key == arcade.key.R:
-                self.robots[
-                    2 if self.key == arcade.key.E else 3
-                ].sprite.body.position = (
-                    SCREEN_WIDTH / 2,
-                    SCREEN_HEIGHT - 30,
-                )
-                self.robots[
-                    2 if self.key == arcade.key.E else 3
-                ].sprite.body.velocity = (0, 0)
-                self.robots[2 if self.key == arcade.key.E else 3].sprite.body.angle = (
-                    math.pi / 2
-                )
-            self.key = 0
-
-        if self.arrowState == 2:
-            self.arrowState = 0
-            self.arrowsList.append(
-                arcade.create_line(
-                    self.arrowStart[0],
-                    self.arrowStart[1],
-                    self.arrowEnd[0],
-                    self.arrowEnd[1],
-                    (255, 0, 0),
-                    2,
+            interval = max(1, round(1 / (rate * self.timeStep)))
+            self.programList.append(
+                ScheduledProgram(
+                    name,
+                    program,
+                    robots,
+                    interval,
+                    legacy_adapter(program, self.sensors.positions),
+                    Observation(
+                        self.observationState,
+                        robots,
+                        [self.robots.index(robot) for robot in robots],
+                        self.line,
+                        self.dribble,
+                        self.kick,
+                        self.neighbours,
+                    ),
                 )
             )
-            print(self.arrowsList)
-        elif self.arrowState == 3:
-            self.arrowState = 0
-            while self.arrowsList:
-                self.arrowsList.remove(self.arrowsList[0])
-
-        # update sprite positions
-        for sprite in self.dynamicSpriteList:
-            sprite.center_x = sprite.shape.body.position.x
-            sprite.center_y = sprite.shape.body.position.y
-            sprite.angle = math.degrees(sprite.shape.body.angle)
-
-        # update sensor readings
-        for robot in self.robots:
-            robot.TOFReadings = [
-                SCREEN_HEIGHT - robot.sprite.body.position.y,
-                SCREEN_WIDTH - robot.sprite.body.position.x,
-                robot.sprite.body.position.y,
-                robot.sprite.body.position.x,
-            ]
-
-        if self.pause:
-            return
+        # program being run, for dribble to know whose dribbler to keep running
+        self._running: Optional[ScheduledProgram] = None
+
+        # program budget
+        self.programBudget: Optional[float] = program_budget
+        self.programTimeout: Optional[float] = (
+            program_budget if program_timeout is None else program_timeout
+        )
+        self.isolated: List[ScheduledProgram] = [
+            scheduled
+            for scheduled in self.programList
+            if scheduled.program is not None
+            and (parallel or scheduled.name in set(isolate))
+        ]
+        self.observationBuffer = None
+        if self.isolated:
+            from workers import ObservationBuffer, ProgramWorker
+
+            self.observationBuffer = ObservationBuffer(len(self.robots))
+            for scheduled in self.isolated:
+                scheduled.worker = ProgramWorker(
+                    scheduled.program,
+                    [self.robots.index(robot) for robot in scheduled.robots],
+                    self.observationBuffer,
+                    quiet_workers,
+                )
+
+    def step(self) -> None:
+        """Advances the match by one physics step, running the programs beforehand."""
 
         self.programs()
+        self.physics_step()
+
+    def physics_step(self) -> None:
+        """Applies the field forces and steps the physics by one step, without running the programs."""
+
+        timings = self.timings
+        if timings is not None:
+            timings.start()
 
         # convert between angles
         if self.ball.body.angle >= 0:
@@ -432,74 +888,249 @@ class SimWin(arcade.Window):
                 self.robots[0].sprite.body.angle, 2 * math.pi
             )
 
-        # slopes
-        if self.ball.body.position.x <= 35:
-            force = rel_vec_to_point(
-                self.ball.body, (35, self.ball.body.position.y), self.ballAngle
+        # slopes, pushing the ball back towards the field (same forces as rel_vec_to_point to the
+        # nearest point 35 away from the wall, with the position read once)
+        x, y = self.ball.body.position
+        if x <= 35:
+            self.ball.body.apply_force_at_local_point((35 - x, 0.0), (0, 0))
+        if x >= self.width - 35:
+            self.ball.body.apply_force_at_local_point(
+                (self.width - 35 - x, 0.0), (0, 0)
             )
-            self.ball.body.apply_force_at_local_point(force, (0, 0))
-        if self.ball.body.position.x >= SCREEN_WIDTH - 35:
-            force = rel_vec_to_point(
-                self.ball.body,
-                (SCREEN_WIDTH - 35, self.ball.body.position.y),
-                self.ballAngle,
+        if y <= 35:
+            self.ball.body.apply_force_at_local_point((0.0, 35 - y), (0, 0))
+        if y >= self.height - 35:
+            self.ball.body.apply_force_at_local_point(
+                (0.0, self.height - 35 - y), (0, 0)
             )
-            self.ball.body.apply_force_at_local_point(force, (0, 0))
-        if self.ball.body.position.y <= 35:
-            force = rel_vec_to_point(
-                self.ball.body, (self.ball.body.position.x, 35), self.ballAngle
+
+        if timings is not None:
+            timings.mark("slopes")
+        self.space.step(self.timeStep)
+        if timings is not None:
+            timings.mark("physics")
+        self.sensors.clear()
+        self.steps += 1
+        self.update_stats()
+        if self.referee is not None:
+            self.referee.check()
+        if self.recorder is not None:
+            self.recorder.record()
+
+    def run(self, steps: int) -> None:
+        """Advances the match by a number of physics steps, as fast as possible.
+
+        Args:
+            steps: Number of physics steps to take (1 / timeStep steps are one simulated second).
+        """
+
+        for _ in range(steps):
+            self.step()
+
+    def update_stats(self) -> None:
+        """Counts possession, and handles a goal scored during the step (see ball_enters_goal)."""
+
+        for team, robots in enumerate(self.teams):
+            for robot in robots:
+                if robot.dribbleState:
+                    self.possession[team] += 1
+                    break
+
+        if self._scored is not None:
+            team, self._scored = self._scored, None
+            self.score[team] += 1
+            event = GoalEvent(self.steps, team, (self.score[0], self.score[1]))
+            self.goals.append(event)
+            for listener in self.goalListeners:
+                listener(event)
+            if self.autoKickoff:
+                self.kickoff()
+
+    def ball_enters_goal(
+        self, arbiter: pymunk.Arbiter, space: pymunk.Space, data: Dict[str, Any]
+    ) -> bool:
+        """Collision handler called by pymunk when the ball starts touching a goal sensor.
+
+        The goal is only counted after the step (bodies cannot be moved during space.step),
+        once per time the ball enters a goal.
+        """
+
+        self._scored = self.goalScorers[self.goalSensors.index(arbiter.shapes[1])]
+        self.ballInGoal = True
+        return True
+
+    def ball_leaves_goal(
+        self, arbiter: pymunk.Arbiter, space: pymunk.Space, data: Dict[str, Any]
+    ) -> None:
+        """Collision handler called by pymunk when the ball stops touching a goal sensor."""
+
+        self.ballInGoal = False
+
+    def kickoff(self) -> None:
+        """Resets the ball and every robot to where they started, at rest, without rebuilding anything.
+
+        With a seed, the ball is placed slightly off the centre spot again (see __init__). Robots stop moving
+        and dribbling until their programs give new commands. Robots taken out of the space (removed by a
+        Referee) are left where they are.
+        """
+
+        position = pymunk.Vec2d(*self.scenario.ball.position)
+        jitter = self.scenario.ball.jitter
+        if self.seed is not None and jitter:
+            position += (
+                self.rng.uniform(-jitter, jitter),
+                self.rng.uniform(-jitter, jitter),
             )
-            self.ball.body.apply_force_at_local_point(force, (0, 0))
-        if self.ball.body.position.y >= SCREEN_HEIGHT - 35:
-            force = rel_vec_to_point(
-                self.ball.body,
-                (self.ball.body.position.x, SCREEN_HEIGHT - 35),
-                self.ballAngle,
+        bodies = [(self.ball.body, position, 0.0)]
+        for robot, (position, angle) in zip(self.robots, self.kickoffPositions):
+            if robot.sprite.body.space is None:
+                continue
+            bodies.append((robot.sprite.body, position, angle))
+            robot.targetPointBody.velocity = (0, 0)
+            robot.targetPointBody.angle = angle
+            robot.dribbleState = 0
+        for body, position, angle in bodies:
+            body.position = position
+            body.angle = angle
+            body.velocity = (0, 0)
+            body.angular_velocity = 0
+            body.force = (0, 0)
+            body.torque = 0
+            self.space.reindex_shapes_for_body(body)
+        for scheduled in self.programList:
+            scheduled.dribbling.clear()
+        self.sensors.clear()
+
+    def programs(self) -> None:
+        """Runs every program due to run in this step, own programs first.
+
+        Between runs of a program, its robots keep their last move and turn commands (which are
+        velocities and angles of their target bodies), and its dribblers keep running.
+        Programs that are None are skipped.
+        """
+
+        observed = False
+        timings = self.timings
+        deadline = self.submit_isolated() if self.isolated else None
+        for scheduled in self.programList:
+            if scheduled.program is None:
+                continue
+            if self.steps % scheduled.interval:
+                for robot in scheduled.dribbling:
+                    self.apply_dribble(robot)
+                continue
+
+            if timings is not None:
+                timings.start()
+            if scheduled.worker is not None:
+                self.collect_isolated(scheduled, deadline)
+            else:
+                if not observed:
+                    self.observationState.update(self.steps)
+                    observed = True
+                scheduled.dribbling.clear()
+                self._running = scheduled
+                start_time = timeit.default_timer()
+                scheduled.call(scheduled.observation)
+                scheduled.account(
+                    timeit.default_timer() - start_time, self.steps, self.programBudget
+                )
+                self._running = None
+            if timings is not None:
+                timings.mark(scheduled.name)
+
+    def read_bodies(self) -> List[Tuple[float, float, float, float, float, float]]:
+        """Returns (x, y, vx, vy, angle, angular velocity) of the ball, then of every robot."""
+
+        bodies = []
+        for body in [self.ball.body] + [robot.sprite.body for robot in self.robots]:
+            # read through chipmunk directly, skipping pymunk's Vec2d wrappers
+            position = lib.cpBodyGetPosition(body._body)
+            velocity = lib.cpBodyGetVelocity(body._body)
+            bodies.append(
+                (
+                    position.x,
+                    position.y,
+                    velocity.x,
+                    velocity.y,
+                    lib.cpBodyGetAngle(body._body),
+                    lib.cpBodyGetAngularVelocity(body._body),
+                )
             )
-            self.ball.body.apply_force_at_local_point(force, (0, 0))
+        return bodies
 
-        self.space.step(1 / 60.0)
+    def submit_isolated(self) -> Optional[float]:
+        """Starts every isolated program due to run in this step, on a single observation.
 
-        self.processingTime = timeit.default_timer() - start_time
+        Workers still busy with an earlier run (which timed out) are not started again,
+        the result of the earlier run is applied once it arrives.
 
-    def programs(self):
-        robotPositions = [x.sprite.body.position for x in self.robots]
+        Returns: The time (as from timeit.default_timer) to stop waiting for the programs at,
+            None to wait as long as they take.
+        """
 
-        # own programs
-        self.attack(
-            [self.robots[0], self.robots[1]],
-            self.line,
-            self.ball.body.position,
-            robotPositions,
-            self.dribble,
-            self.kick,
-        )
-        self.defend(
-            [self.robots[0], self.robots[1]],
-            self.line,
-            self.ball.body.position,
-            robotPositions,
-            self.dribble,
-            self.kick,
-        )
+        due = [
+            scheduled
+            for scheduled in self.isolated
+            if not self.steps % scheduled.interval and not scheduled.worker.busy
+        ]
+        if due:
+            slot = self.observationBuffer.write(self)
+            for scheduled in due:
+                scheduled.worker.submit(slot)
+        if self.programTimeout is None:
+            return None
+        return timeit.default_timer() + self.programTimeout
 
-        # opponent programs
-        self.o_attack(
-            [self.robots[2], self.robots[3]],
-            self.line,
-            self.ball.body.position,
-            robotPositions,
-            self.dribble,
-            self.kick,
-        )
-        self.o_defend(
-            [self.robots[2], self.robots[3]],
-            self.line,
-            self.ball.body.position,
-            robotPositions,
-            self.dribble,
-            self.kick,
-        )
+    def collect_isolated(
+        self, scheduled: ScheduledProgram, deadline: Optional[float]
+    ) -> None:
+        """Waits for an isolated program started by submit_isolated and applies the commands it gave.
+
+        Args:
+            scheduled: The ScheduledProgram to wait for.
+            deadline: Time to stop waiting at, as returned by submit_isolated.
+        """
+
+        from workers import ProgramError, apply_commands
+
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - timeit.default_timer(), 0)
+        try:
+            result = scheduled.worker.result(timeout)
+            if result is None:
+                scheduled.timeouts += 1
+        except ProgramError as error:
+            # the run is lost like one that did not answer in time, the worker keeps serving the next runs
+            scheduled.errors += 1
+            scheduled.lastError = error.details
+            result = None
+        if result is None:
+            for robot in scheduled.dribbling:
+                self.apply_dribble(robot)
+            return
+
+        commands, seconds, step = result
+        scheduled.dribbling.clear()
+        self._running = scheduled
+        apply_commands(self, scheduled, commands)
+        self._running = None
+        scheduled.account(seconds, step, self.programBudget)
+
+    def program_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the stats of every program by name, see ScheduledProgram.stats."""
+
+        return {scheduled.name: scheduled.stats() for scheduled in self.programList}
+
+    def close(self) -> None:
+        """Stops the worker processes of isolated programs, if any."""
+
+        for scheduled in self.isolated:
+            if scheduled.worker is not None:
+                scheduled.worker.close()
+                scheduled.worker = None
+        self.isolated = []
 
     # TODO: somehow make this in the program code (deals with field)
     def line(self, robot: Robot) -> pymunk.Vec2d:
@@ -513,6 +1144,63 @@ class SimWin(arcade.Window):
             HINT: Move in the opposite direction of this vector to move away from lines.
         """
 
+        return self.sensors.line(robot)
+
+    def neighbours(self, robot: Robot, radius: float) -> List[Tuple[int, float]]:
+        """Finds the robots near a robot, with a query of the space instead of a scan of every robot.
+
+        Args:
+            robot: A Robot.
+            radius: Largest distance between the centres of the robots.
+
+        Returns: (index in robots, distance) of every other robot whose centre is within radius of the centre
+            of robot, nearest first. Robots removed from play (see referee.py) are not found.
+        """
+
+        # same as space.point_query, calling chipmunk directly with a reused callback (skips building a
+        # PointQueryInfo for every shape found, which is most of its cost)
+        position = lib.cpBodyGetPosition(robot.sprite.body._body)
+        found = self._found
+        found.clear()
+        # the group of every robot is its index + 1, see __init__
+        shape_filter = self.neighbourFilters[robot.sprite.shape.filter.group - 1]
+        if self._pointQuery is None:
+            for info in self.space.point_query(
+                (position.x, position.y), radius, shape_filter
+            ):
+                found.append((info.shape.filter.group - 1, *info.shape.body.position))
+        else:
+            lib.cpSpacePointQuery(
+                self.space._space,
+                (position.x, position.y),
+                radius,
+                shape_filter,
+                self._pointQuery,
+                ffi.NULL,
+            )
+        # any robot whose centre is within radius has a point within radius, the converse is not true
+        neighbours = []
+        for idx, x, y in found:
+            distance = math.hypot(x - position.x, y - position.y)
+            if distance <= radius:
+                neighbours.append((idx, distance))
+        neighbours.sort(key=lambda neighbour: (neighbour[1], neighbour[0]))
+        return neighbours
+
+    def _found_robot(self, shape, point, distance, gradient, data) -> None:
+        """Callback of the chipmunk point queries of neighbours, collecting the robots found."""
+
+        position = lib.cpBodyGetPosition(lib.cpShapeGetBody(shape))
+        self._found.append(
+            (lib.cpShapeGetFilter(shape).group - 1, position.x, position.y)
+        )
+
+    def detect_line(self, robot: Robot) -> pymunk.Vec2d:
+        """Same as line, without going through the sensor cache."""
+
+        if not self.exactLines:
+            return -self.lineIndex.query(robot.sprite.shape)
+
         resultant = pymunk.Vec2d(0, 0)
         for line in self.fieldLines + self.penaltyLines:
             if line.shapes_collide(robot.sprite.shape).points:
@@ -521,30 +1209,28 @@ class SimWin(arcade.Window):
 
     # TODO: somehow make this in the program code (deals with ball)
     def dribble(self, robot: Robot) -> None:
-        robot_to_ball = rel_vec_to_point(
-            robot.sprite.body,
-            self.ball.body.position,
-            robot.orientation,
-        )
-        if (
-            vec_to_world(robot_to_ball) * 180 / math.pi > 346
-            or vec_to_world(robot_to_ball) * 180 / math.pi < 14
-        ) and robot_to_ball.length < 40:
-            force = 30 * rel_vec_to_point(
-                self.ball.body, robot.sprite.body.position, self.ballAngle
-            )
+        """Runs the dribbler of a robot, which keeps running until the next run of the calling program.
+
+        Args:
+            robot: A Robot whose dribbler pulls the ball in if the ball is in one of its catchment areas
+                (and sets robot.dribbleState).
+        """
+
+        if self._running is not None and robot not in self._running.dribbling:
+            self._running.dribbling.append(robot)
+        self.apply_dribble(robot)
+
+    def apply_dribble(self, robot: Robot) -> None:
+        """Applies the dribbler force of a robot for one physics step."""
+
+        robot_to_ball, bearing, distance = self.sensors.ball(robot)
+        robot.dribbleState = dribble_zone(bearing, distance)
+        if robot.dribbleState == 1:
+            force = 30 * -robot_to_ball
             self.ball.body.apply_force_at_local_point(force, (0, 0))
-            robot.dribbleState = 1
-        elif (
-            166 < vec_to_world(robot_to_ball) * 180 / math.pi < 194
-        ) and robot_to_ball.length < 40:
-            force = 31 * rel_vec_to_point(
-                self.ball.body, robot.sprite.body.position, self.ballAngle
-            )
+        elif robot.dribbleState == 2:
+            force = 31 * -robot_to_ball
             self.ball.body.apply_force_at_local_point(force, (0, 0))
-            robot.dribbleState = 2
-        else:
-            robot.dribbleState = 0
 
     # TODO: somehow make this in the program code (deals with ball)
     def kick(self, robot: Robot) -> None:
@@ -562,39 +1248,67 @@ class SimWin(arcade.Window):
                 (self.ball.body.position.x, self.ball.body.position.y + 10),
             )"""
 
-    def on_mouse_motion(self, x, y, dx, dy):
-        self.mousePos = (x, y)
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        if button == arcade.MOUSE_BUTTON_LEFT:
-            if self.arrowState == 0:
-                self.arrowStart = (x, y)
-            elif self.arrowState == 1:
-                self.arrowEnd = (x, y)
-            self.arrowState += 1
-        else:
-            self.key = button
-
-    def on_key_press(self, key, modifiers):
-        self.key = key
-        if key == arcade.key.P:
-            self.pause = not self.pause
-        elif key == arcade.key.ESCAPE:
-            self.arrowState = 3
-        else:
-            self.key = key
+def main(*args, **kwargs):
+    """Opens the simulation window and runs a match in it, see window.main.
+
+    arcade is only imported here, so that importing this module (and programs importing main from it)
+    never loads the windowing stack.
+    """
+
+    from window import main
 
+    main(*args, **kwargs)
 
-def main(
+
+def __getattr__(name: str) -> Any:
+    # SimWin moved to window.py, it is imported on first use so that headless code never loads arcade
+    if name == "SimWin":
+        from window import SimWin
+
+        return SimWin
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def run_headless(
     config: Dict[str, bool],
     attack: ProgramType,
     defend: ProgramType,
     o_attack: ProgramType,
     o_defend: ProgramType,
-):
-    window = SimWin(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
-    window.setup(config, attack, defend, o_attack, o_defend)
-    arcade.run()
+    steps: int,
+    seed: Optional[int] = None,
+    substeps: int = 1,
+    scenario: Union[str, ScenarioTemplate, None] = None,
+) -> Match:
+    """Runs a match for a number of physics steps without opening a window.
+
+    Args:
+        config: Program config, see CONFIG in program.py.
+        attack: Program for own attacking robot.
+        defend: Program for own defending robot.
+        o_attack: Program for opponent attacking robot.
+        o_defend: Program for opponent defending robot.
+        steps: Number of physics steps to run (60 * substeps steps are one simulated second).
+        seed: Seed of the match, see Match.
+        substeps: Number of physics steps per TIME_STEP, see Match.
+        scenario: Scenario to play (see scenario.py), the default one if not given.
+
+    Returns: The Match after the last step, to inspect the final state.
+    """
+
+    match = Match(
+        config,
+        attack,
+        defend,
+        o_attack,
+        o_defend,
+        seed,
+        substeps=substeps,
+        scenario=scenario,
+    )
+    match.run(steps)
+    return match
 
 
 if __name__ == "__main__":
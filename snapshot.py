@@ -0,0 +1,274 @@
+"""Snapshots of the dynamic state of a match, for forking the world (lookahead, branching rollouts, fast resets).
+
+Only what changes during a match is copied: the dynamic bodies, the target bodies that robots are pulled
+towards (which carry the move/turn commands), the Robot attributes, the ball angle, the match stats and goals,
+the random generator placing the ball at kickoff, the seed of the TOF noise, the dribblers kept running
+between runs of the programs and the state of the Referee, if any (its calls, its timers and the robots it took
+out of the space, which are taken out or put back on restore). Everything else (shapes, constraints,
+materials, filters) is identical between matches built the same way, so a snapshot can be restored into any
+such Match, like the pre-built ones of a MatchPool.
+
+Not included: module-level state of the programs (e.g. globals in examples/own.py), and pymunk's contact
+cache, so a restored match steps like a match whose bodies were just placed there (contacts are found again
+in the next step) rather than exactly like the original.
+
+Example:
+    pool = MatchPool(2, config, attack, defend, o_attack, o_defend)
+    start = take_snapshot(match)
+    branch = pool.fork(start)
+    match.kick(match.robots[0])
+    match.run(60)
+    branch.run(10)
+    branch.kick(branch.robots[0])
+    branch.run(50)
+    pool.release(branch)
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymunk._chipmunk_cffi import lib
+
+from referee import Call, Referee
+from simulation import GoalEvent, Match
+
+__all__ = ["Snapshot", "take_snapshot", "restore_snapshot", "MatchPool"]
+
+
+@dataclass
+class Snapshot:
+    """The dynamic state of a match between two steps.
+
+    Attributes:
+        steps: Number of steps taken by the match.
+        bodies: (x, y, vx, vy, angle, angular velocity) of the ball, then of every robot.
+        targets: (vx, vy, angle) of the target body of every robot, set by Robot.move and Robot.turn.
+        robots: (direction, speed, angle, orientation, dribbleState, chaseState) of every robot.
+        ballAngle: Match.ballAngle.
+        stats: (score, possession, ballInGoal) of the match.
+        tofNoise: Entropy of the TOF noise (see TOFSensors), which differs between matches without a seed.
+        dribbling: Indices of the robots each program keeps dribbling with until its next run.
+        goals: Match.goals.
+        rngState: State of Match.rng, which moves the ball off the centre spot at every kickoff.
+        scored: Team that scored during the last step, if the goal is not counted yet (see Match.update_stats).
+        referee: (calls, removed, progressPoint, progressSteps, penaltyAreaSteps, pushingSteps) of the
+            Referee of the match, None without one.
+    """
+
+    steps: int
+    bodies: List[Tuple[float, float, float, float, float, float]]
+    targets: List[Tuple[float, float, float]]
+    robots: List[Tuple[float, float, float, float, int, int]]
+    ballAngle: float
+    stats: Tuple[List[int], List[int], bool]
+    tofNoise: int
+    dribbling: List[List[int]]
+    goals: List[GoalEvent]
+    rngState: Any
+    scored: Optional[int]
+    referee: Optional[Tuple[List[Call], Dict[int, int], Any, int, List[int], Dict]]
+
+
+def _dynamic_bodies(match: Match) -> list:
+    return [match.ball.body] + [robot.sprite.body for robot in match.robots]
+
+
+def _referee_state(referee: Optional[Referee]) -> Optional[tuple]:
+    if referee is None:
+        return None
+    # calls are never changed once made, so the list can be copied shallowly
+    return (
+        list(referee.calls),
+        dict(referee.removed),
+        referee.progressPoint,
+        referee.progressSteps,
+        list(referee.penaltyAreaSteps),
+        dict(referee.pushingSteps),
+    )
+
+
+def take_snapshot(match: Match) -> Snapshot:
+    """Copies the dynamic state of a match.
+
+    Args:
+        match: The Match to copy, in between steps.
+    """
+
+    bodies = []
+    for body in _dynamic_bodies(match):
+        # read through chipmunk directly, skipping pymunk's Vec2d wrappers
+        position = lib.cpBodyGetPosition(body._body)
+        velocity = lib.cpBodyGetVelocity(body._body)
+        bodies.append(
+            (
+                position.x,
+                position.y,
+                velocity.x,
+                velocity.y,
+                lib.cpBodyGetAngle(body._body),
+                lib.cpBodyGetAngularVelocity(body._body),
+            )
+        )
+    targets = []
+    for robot in match.robots:
+        velocity = lib.cpBodyGetVelocity(robot.targetPointBody._body)
+        targets.append(
+            (velocity.x, velocity.y, lib.cpBodyGetAngle(robot.targetPointBody._body))
+        )
+
+    return Snapshot(
+        match.steps,
+        bodies,
+        targets,
+        [
+            (
+                robot.direction,
+                robot.speed,
+                robot.angle,
+                robot.orientation,
+                robot.dribbleState,
+                robot.chaseState,
+            )
+            for robot in match.robots
+        ],
+        match.ballAngle,
+        (list(match.score), list(match.possession), match.ballInGoal),
+        match.tofSensors.entropy,
+        [
+            [match.robots.index(robot) for robot in scheduled.dribbling]
+            for scheduled in match.programList
+        ],
+        list(match.goals),
+        match.rng.getstate(),
+        match._scored,
+        _referee_state(match.referee),
+    )
+
+
+def restore_snapshot(match: Match, snapshot: Snapshot) -> None:
+    """Puts a match back into the state of a snapshot.
+
+    Args:
+        match: A Match built the same way (same field and robots) as the one the snapshot was taken from.
+        snapshot: The Snapshot to restore.
+    """
+
+    bodies = _dynamic_bodies(match)
+    if len(bodies) != len(snapshot.bodies):
+        raise ValueError("snapshot was taken from a match with different robots")
+    if (match.referee is None) != (snapshot.referee is None):
+        raise ValueError(
+            "snapshot was taken from a match with a referee"
+            if match.referee is None
+            else "snapshot was taken from a match without a referee"
+        )
+
+    # robots removed from play by the referee are out of the space, put them back or take them out
+    removed = set() if snapshot.referee is None else set(snapshot.referee[1])
+    for idx, robot in enumerate(match.robots):
+        body = robot.sprite.body
+        if idx in removed and body.space is not None:
+            match.space.remove(body, robot.sprite.shape, *match.joints[idx])
+        elif idx not in removed and body.space is None:
+            match.space.add(body, robot.sprite.shape, *match.joints[idx])
+
+    for body, (x, y, vx, vy, angle, angularVelocity) in zip(bodies, snapshot.bodies):
+        lib.cpBodySetPosition(body._body, (x, y))
+        lib.cpBodySetVelocity(body._body, (vx, vy))
+        lib.cpBodySetAngle(body._body, angle)
+        lib.cpBodySetAngularVelocity(body._body, angularVelocity)
+        body.force = (0, 0)
+        body.torque = 0
+        # update the cached positions of the shapes, used by queries before the next step
+        if body.space is not None:
+            match.space.reindex_shapes_for_body(body)
+    for robot, (vx, vy, angle) in zip(match.robots, snapshot.targets):
+        lib.cpBodySetVelocity(robot.targetPointBody._body, (vx, vy))
+        lib.cpBodySetAngle(robot.targetPointBody._body, angle)
+    for robot, state in zip(match.robots, snapshot.robots):
+        (
+            robot.direction,
+            robot.speed,
+            robot.angle,
+            robot.orientation,
+            robot.dribbleState,
+            robot.chaseState,
+        ) = state
+
+    match.steps = snapshot.steps
+    match.ballAngle = snapshot.ballAngle
+    score, possession, match.ballInGoal = snapshot.stats
+    match.score = list(score)
+    match.possession = list(possession)
+    tof = match.tofSensors
+    if tof.entropy != snapshot.tofNoise:
+        tof.entropy = snapshot.tofNoise
+        tof.blockNumber = -1
+    for scheduled, dribbling in zip(match.programList, snapshot.dribbling):
+        scheduled.dribbling[:] = [match.robots[idx] for idx in dribbling]
+    match.goals = list(snapshot.goals)
+    match.rng.setstate(snapshot.rngState)
+    match._scored = snapshot.scored
+    if snapshot.referee is not None:
+        referee = match.referee
+        (
+            calls,
+            removed,
+            referee.progressPoint,
+            referee.progressSteps,
+            penaltyAreaSteps,
+            pushingSteps,
+        ) = snapshot.referee
+        referee.calls = list(calls)
+        referee.removed = dict(removed)
+        referee.penaltyAreaSteps = list(penaltyAreaSteps)
+        referee.pushingSteps = dict(pushingSteps)
+    match.sensors.clear()
+
+
+class MatchPool:
+    """A pool of pre-built matches to restore snapshots into, so that forking never builds a new space.
+
+    Every match in the pool is built with the same arguments (and so the same programs, which are shared).
+    """
+
+    def __init__(self, size: int, *args, referee: bool = False, **kwargs):
+        """
+        Args:
+            size: Number of matches to build up front (more are built if the pool runs out).
+            *args, **kwargs: Arguments to build every Match with.
+            referee: Whether every match is judged by a Referee (with its default settings), to fork
+                snapshots of refereed matches.
+        """
+
+        self.args = args
+        self.kwargs = kwargs
+        self.referee = referee
+        self.free: List[Match] = [self._build() for _ in range(size)]
+
+    def _build(self) -> Match:
+        match = Match(*self.args, **self.kwargs)
+        if self.referee:
+            Referee(match)
+        return match
+
+    def fork(self, snapshot: Snapshot) -> Match:
+        """Returns a match from the pool, in the state of a snapshot.
+
+        Args:
+            snapshot: The Snapshot to restore.
+        """
+
+        match = self.free.pop() if self.free else self._build()
+        restore_snapshot(match, snapshot)
+        return match
+
+    def release(self, match: Match) -> None:
+        """Returns a forked match to the pool, to be reused by a later fork.
+
+        Args:
+            match: A Match returned by fork.
+        """
+
+        match.recorder = None
+        self.free.append(match)
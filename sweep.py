@@ -0,0 +1,435 @@
+"""Tunes the named parameters of a program module by playing headless matches over a process pool.
+
+Program modules list their tuning constants in a `PARAMS` dict, read by the programs on every run, and the
+range worth searching for each of them in `PARAM_RANGES` (see examples/own.py). Every point of a search (a value
+for each swept parameter, the others keeping their defaults) plays every opponent once per seed, the same
+seeded matches for every point, and is scored by the mean of an objective over those matches.
+
+Searches:
+    grid: every combination of --levels evenly spaced values of each parameter.
+    random: --points points drawn uniformly from the ranges.
+    halving: successive halving, --points random points are played on --min-seeds seeds, the best 1/--eta
+        of them are played on --eta times as many seeds, and so on until a single point is left or every
+        seed is played.
+
+Outcomes are cached per point and seed (and kept in --cache, a ResultCache directory, if given, see results.py),
+so playing more seeds of the same points in the next round of a halving search, or rerunning a sweep, only plays
+the missing matches.
+
+Example:
+    python sweep.py --tune examples.own --opponents examples.opponent --params approachCurve chaseSpeed \\
+        --search halving --points 16 --seeds 0 1 2 3 4 5 6 7
+"""
+
+import argparse
+import importlib
+import itertools
+import math
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from results import ResultCache, match_key, open_cache
+from tournament import run_match
+
+Params = Dict[str, float]
+
+# score of a match for the tuned module, from its outcome (see play_point)
+OBJECTIVES: Dict[str, Callable[[Dict[str, Any]], float]] = {
+    "goals": lambda outcome: outcome["goals"][0] - outcome["goals"][1],
+    "possession": lambda outcome: outcome["possession"][0] - outcome["possession"][1],
+}
+# two-sided 95% critical values of Student's t distribution, by degrees of freedom (the normal one beyond)
+T_CRITICAL = (
+    12.706,
+    4.303,
+    3.182,
+    2.776,
+    2.571,
+    2.447,
+    2.365,
+    2.306,
+    2.262,
+    2.228,
+    2.201,
+    2.179,
+    2.160,
+    2.145,
+    2.131,
+    2.120,
+    2.110,
+    2.101,
+    2.093,
+    2.086,
+    2.080,
+    2.074,
+    2.069,
+    2.064,
+    2.060,
+    2.056,
+    2.052,
+    2.048,
+    2.045,
+    2.042,
+)
+
+# PARAMS of every tuned module as imported, in the worker processes
+_defaults: Dict[str, Params] = {}
+
+
+@dataclass
+class SweepPoint:
+    """A point of a search, and its scores so far.
+
+    Attributes:
+        params: Value of every swept parameter (the others keep their defaults).
+        scores: Objective of every match played, see Sweep.evaluate.
+    """
+
+    params: Params
+    scores: List[float] = field(default_factory=list)
+
+    @property
+    def mean(self) -> float:
+        return statistics.mean(self.scores) if self.scores else -math.inf
+
+    @property
+    def interval(self) -> float:
+        """Half width of the 95% confidence interval of the mean (infinite with fewer than 2 scores)."""
+
+        if len(self.scores) < 2:
+            return math.inf
+        df = len(self.scores) - 1
+        critical = T_CRITICAL[df - 1] if df <= len(T_CRITICAL) else 1.96
+        return critical * statistics.stdev(self.scores) / math.sqrt(len(self.scores))
+
+
+def parameter_ranges(
+    module: str, names: Optional[Iterable[str]] = None
+) -> Dict[str, Tuple[float, float]]:
+    """Returns the ranges of the parameters of a program module.
+
+    Args:
+        module: Name of the module, providing PARAMS and PARAM_RANGES.
+        names: Parameters to return, all of PARAM_RANGES if not given.
+
+    Raises:
+        ValueError: If a parameter is not in PARAMS, or has no range.
+    """
+
+    programModule = importlib.import_module(module)
+    params = getattr(programModule, "PARAMS", {})
+    ranges = getattr(programModule, "PARAM_RANGES", {})
+    if names is None:
+        names = list(ranges)
+    for name in names:
+        if name not in params:
+            raise ValueError(f"{module} has no parameter {name!r}")
+        if name not in ranges:
+            raise ValueError(f"{module} has no range for parameter {name!r}")
+    return {name: ranges[name] for name in names}
+
+
+def _value(low: float, high: float, fraction: float) -> float:
+    """Returns the value at a fraction of a range, rounded if the range is of integers."""
+
+    value = low + (high - low) * fraction
+    if isinstance(low, int) and isinstance(high, int):
+        return int(round(value))
+    return value
+
+
+def grid_points(
+    ranges: Dict[str, Tuple[float, float]], levels: int
+) -> List[SweepPoint]:
+    """Returns every combination of evenly spaced values of each parameter.
+
+    Args:
+        ranges: (low, high) of every swept parameter.
+        levels: Number of values of each parameter, both ends of its range included.
+    """
+
+    values = []
+    for low, high in ranges.values():
+        fractions = (
+            [idx / (levels - 1) for idx in range(levels)] if levels > 1 else [0.5]
+        )
+        # integer ranges narrower than the number of levels give the same value more than once
+        values.append(sorted(set(_value(low, high, x) for x in fractions)))
+    return [
+        SweepPoint(dict(zip(ranges, combination)))
+        for combination in itertools.product(*values)
+    ]
+
+
+def random_points(
+    ranges: Dict[str, Tuple[float, float]], count: int, rng: random.Random
+) -> List[SweepPoint]:
+    """Returns points drawn uniformly from the ranges of the parameters.
+
+    Args:
+        ranges: (low, high) of every swept parameter.
+        count: Number of points.
+        rng: Random number generator to draw with.
+    """
+
+    return [
+        SweepPoint(
+            {
+                name: _value(low, high, rng.random())
+                for name, (low, high) in ranges.items()
+            }
+        )
+        for _ in range(count)
+    ]
+
+
+def play_point(
+    tune: str, opponent: str, params: Params, seed: int, steps: int, referee: bool
+) -> Dict[str, Any]:
+    """Plays a single match with parameters of a module set to a point, this is what runs inside the worker processes.
+
+    Args:
+        tune: Name of the module providing the own programs, whose PARAMS are changed.
+        opponent: Name of the module providing the opponent programs.
+        params: Value of every swept parameter.
+        seed: Seed of the match.
+        steps: Number of physics steps to play.
+        referee: Whether a Referee judges the rules.
+
+    Returns: The MatchResult of the match, as a dict (so that it can be stored in a ResultCache).
+    """
+
+    module = importlib.import_module(tune)
+    defaults = _defaults.setdefault(tune, dict(module.PARAMS))
+    module.PARAMS.update(params)
+    try:
+        result = run_match(tune, opponent, seed, steps, referee=referee)
+    finally:
+        module.PARAMS.clear()
+        module.PARAMS.update(defaults)
+    return asdict(result)
+
+
+class Sweep:
+    """Scores points of a search over a process pool, caching the outcome of every match.
+
+    Attributes:
+        outcomes: Outcome of every match played or read from the cache in this sweep, by key (see key).
+        played: Number of matches played (not read from the cache).
+    """
+
+    def __init__(
+        self,
+        tune: str,
+        opponents: Iterable[str],
+        steps: int = 60 * 60,
+        objective: str = "goals",
+        referee: bool = True,
+        workers: Optional[int] = None,
+        cache: Optional[ResultCache] = None,
+    ):
+        """
+        Args:
+            tune: Name of the module whose parameters are swept, providing the own programs.
+            opponents: Names of the modules providing the opponent programs.
+            steps: Number of physics steps per match (60 steps are one simulated second).
+            objective: Name of the objective to score matches with, see OBJECTIVES.
+            referee: Whether a Referee judges the rules of every match.
+            workers: Number of worker processes, defaults to the number of CPUs.
+            cache: ResultCache to read outcomes from, and to store new outcomes in.
+        """
+
+        self.tune = tune
+        self.opponents = list(opponents)
+        self.steps = steps
+        self.objective = OBJECTIVES[objective]
+        self.referee = referee
+        self.cache = cache
+        self.outcomes: Dict[str, Dict[str, Any]] = {}
+        self.played = 0
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self) -> "Sweep":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def key(self, params: Params, opponent: str, seed: int) -> str:
+        """Returns the key of a match, see match_key (the defaults share the keys of tournament matches)."""
+
+        options = {"referee": self.referee, "budget": None}
+        if params:
+            options["params"] = sorted(params.items())
+        return match_key(self.tune, opponent, seed, self.steps, **options)
+
+    def evaluate(self, points: Iterable[SweepPoint], seeds: Iterable[int]) -> None:
+        """Scores points on every opponent and seed, playing the matches missing from the cache.
+
+        The scores of every point are replaced by one per opponent and seed, in that order.
+
+        Args:
+            points: The points to score.
+            seeds: Seeds to play every opponent with.
+        """
+
+        points = list(points)
+        seeds = list(seeds)
+        missing = {}
+        keys = {}
+        for point in points:
+            for opponent in self.opponents:
+                for seed in seeds:
+                    key = keys[id(point), opponent, seed] = self.key(
+                        point.params, opponent, seed
+                    )
+                    if key in self.outcomes or key in missing:
+                        continue
+                    outcome = None if self.cache is None else self.cache.get(key)
+                    if outcome is None:
+                        missing[key] = (point.params, opponent, seed)
+                    else:
+                        self.outcomes[key] = outcome
+        futures = {
+            self.executor.submit(
+                play_point,
+                self.tune,
+                opponent,
+                params,
+                seed,
+                self.steps,
+                self.referee,
+            ): key
+            for key, (params, opponent, seed) in missing.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            self.outcomes[key] = future.result()
+            if self.cache is not None:
+                self.cache.put(key, self.outcomes[key])
+            self.played += 1
+        for point in points:
+            point.scores = [
+                self.objective(self.outcomes[keys[id(point), opponent, seed]])
+                for opponent in self.opponents
+                for seed in seeds
+            ]
+
+    def close(self) -> None:
+        """Stops the worker processes."""
+
+        self.executor.shutdown()
+
+
+def successive_halving(
+    sweep: Sweep,
+    points: List[SweepPoint],
+    seeds: List[int],
+    min_seeds: int = 2,
+    eta: int = 2,
+) -> Tuple[List[SweepPoint], List[int]]:
+    """Keeps the best points of a search, playing more seeds with the points that are left, see the module docstring.
+
+    Args:
+        sweep: The Sweep to score points with.
+        points: The points to start with.
+        seeds: Every seed that can be played, the first ones are played first.
+        min_seeds: Number of seeds played by every point in the first round.
+        eta: Factor by which the number of points shrinks, and the number of seeds grows, every round.
+
+    Returns: A tuple of (points of the last round from best to worst, seeds they were scored on).
+    """
+
+    count = min(min_seeds, len(seeds))
+    while True:
+        sweep.evaluate(points, seeds[:count])
+        points = sorted(points, key=lambda point: point.mean, reverse=True)
+        if len(points) <= 1 or count >= len(seeds):
+            return points, seeds[:count]
+        points = points[: max(1, math.ceil(len(points) / eta))]
+        count = min(count * eta, len(seeds))
+
+
+def describe(point: SweepPoint) -> str:
+    params = ", ".join(f"{name}={value:.4g}" for name, value in point.params.items())
+    return (
+        f"{point.mean:+.3f} ± {point.interval:.3f} ({len(point.scores)} matches): "
+        f"{params or 'defaults'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tune", default="examples.own")
+    parser.add_argument("--opponents", nargs="+", default=["examples.opponent"])
+    parser.add_argument(
+        "--params", nargs="+", default=None, help="parameters to sweep, all by default"
+    )
+    parser.add_argument(
+        "--search", choices=["grid", "random", "halving"], default="halving"
+    )
+    parser.add_argument("--levels", type=int, default=3, help="values per parameter")
+    parser.add_argument("--points", type=int, default=16)
+    parser.add_argument("--min-seeds", type=int, default=2)
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(range(8)))
+    parser.add_argument("--steps", type=int, default=60 * 60)
+    parser.add_argument("--objective", choices=list(OBJECTIVES), default="goals")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", metavar="DIR", default=None)
+    parser.add_argument(
+        "--cache-size", type=float, default=64, help="size of the cache, in MB"
+    )
+    parser.add_argument("--top", type=int, default=5, help="number of points to list")
+    parser.add_argument("--sample-seed", type=int, default=0)
+    parser.add_argument(
+        "--no-referee", action="store_true", help="do not judge the rules"
+    )
+    args = parser.parse_args()
+
+    ranges = parameter_ranges(args.tune, args.params)
+    rng = random.Random(args.sample_seed)
+    cache = open_cache(
+        args.cache,
+        [(args.tune, opponent) for opponent in args.opponents],
+        int(args.cache_size * 1024 * 1024),
+        referee=not args.no_referee,
+    )
+    with Sweep(
+        args.tune,
+        args.opponents,
+        args.steps,
+        args.objective,
+        not args.no_referee,
+        args.workers,
+        cache,
+    ) as sweep:
+        if args.search == "grid":
+            points = grid_points(ranges, args.levels)
+        else:
+            points = random_points(ranges, args.points, rng)
+        print(f"{args.search} search over {len(points)} points of {', '.join(ranges)}")
+        if args.search == "halving":
+            points, seeds = successive_halving(
+                sweep, points, args.seeds, args.min_seeds, args.eta
+            )
+        else:
+            seeds = args.seeds
+            sweep.evaluate(points, seeds)
+            points.sort(key=lambda point: point.mean, reverse=True)
+        baseline = SweepPoint({})
+        sweep.evaluate([baseline], seeds)
+        print(
+            f"{sweep.played} matches played, {args.objective} per match "
+            f"(mean ± 95% confidence interval over {len(seeds)} seeds):"
+        )
+        for point in points[: args.top]:
+            print("    " + describe(point))
+        print("    " + describe(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import numpy as np
+
+from batch import BatchSim
+from simulation import Match
+from tools import *
+
+
+def test_batch_matches_sequential_matches():
+    seeds = [0, 1, 2]
+    sim = BatchSim(len(seeds))
+    observations = sim.reset(seeds)
+    rng = np.random.default_rng(0)
+    actions = np.zeros((len(seeds), sim.robotCount, 3))
+    history = []
+    for _ in range(120):
+        actions[:, :, 0] = rng.uniform(0, 600, actions.shape[:2])
+        actions[:, :, 1] = rng.uniform(0, 2 * np.pi, actions.shape[:2])
+        actions[:, :, 2] = rng.uniform(-1, 1, actions.shape[:2])
+        history.append(actions.copy())
+        observations = sim.step(actions)
+
+    for k, seed in enumerate(seeds):
+        match = Match({}, None, None, None, None, seed)
+        for step in history:
+            for robot, (speed, direction, angle) in zip(match.robots, step[k]):
+                robot.targetPointBody.velocity = make_vec_from_polar(speed, direction)
+                robot.turn(angle)
+                match.dribble(robot)
+            match.physics_step()
+        assert np.allclose(
+            observations["ballPosition"][k], tuple(match.ball.body.position)
+        )
+        assert np.allclose(
+            observations["robotPositions"][k],
+            [tuple(robot.sprite.body.position) for robot in match.robots],
+        )
+        assert list(observations["dribbleState"][k]) == [
+            robot.dribbleState for robot in match.robots
+        ]
+        assert list(observations["score"][k]) == match.score
@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+import pytest
+
+import program
+from simulation import Match
+
+
+def exact_line(match, robot):
+    resultant = 0, 0
+    for line in match.fieldLines + match.penaltyLines:
+        contacts = line.shapes_collide(robot.sprite.shape)
+        if contacts.points:
+            resultant = (
+                resultant[0] - contacts.normal.x,
+                resultant[1] - contacts.normal.y,
+            )
+    return resultant
+
+
+def test_line_index_matches_shapes_collide():
+    match = Match(program.CONFIG, *[program.attack] * 4, seed=0)
+    robot = match.robots[0]
+    body = robot.sprite.body
+    rng = np.random.default_rng(0)
+    # random poses, plus poses centred on the ends of every line so that most of them touch one
+    positions = [
+        tuple(point)
+        for point in rng.uniform((0, 0), (match.width, match.height), (500, 2))
+    ]
+    for line in match.fieldLines + match.penaltyLines:
+        if hasattr(line, "a"):
+            positions += [tuple(line.a), tuple(line.b)]
+        else:
+            positions.append(tuple(line.offset))
+    touching = 0
+    for position in positions:
+        body.position = position
+        body.angle = rng.uniform(0, 2 * math.pi)
+        match.space.reindex_shapes_for_body(body)
+        expected = exact_line(match, robot)
+        touching += expected != (0, 0)
+        assert tuple(match.detect_line(robot)) == pytest.approx(expected)
+    assert touching > 0
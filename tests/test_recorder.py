@@ -0,0 +1,27 @@
+import numpy as np
+
+import program
+from recorder import Recorder, column, load
+from simulation import Match
+
+
+def test_record_large_teams(tmp_path):
+    match = Match(
+        program.CONFIG,
+        program.attack,
+        program.defend,
+        program.o_attack,
+        program.o_defend,
+        seed=0,
+        scenario="11v11",
+    )
+    path = str(tmp_path / "match.rec")
+    recorder = Recorder(path, match, chunk=4)
+    match.run(10)
+    recorder.close()
+
+    header, data = load(path)
+    assert header["frames"] == 11 and data.shape == (11, len(recorder.columns))
+    assert data[-1, column(header, "step")] == 10
+    last = match.robots[-1].sprite.body.position
+    assert np.allclose(data[-1, column(header, "robot21.x") :][:2], tuple(last))
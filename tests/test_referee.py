@@ -0,0 +1,73 @@
+import referee
+from referee import Referee
+from simulation import Match
+
+
+def refereed_match(**kwargs):
+    match = Match({}, None, None, None, None, seed=1)
+    return match, Referee(match, **kwargs)
+
+
+def place(match, idx, position):
+    body = match.robots[idx].sprite.body
+    body.position = position
+    body.velocity = (0, 0)
+    match.space.reindex_shapes_for_body(body)
+
+
+def run(match, seconds):
+    for _ in range(round(seconds / match.timeStep)):
+        match.physics_step()
+
+
+def test_out_of_bounds_robot_is_removed_then_returned():
+    match, judge = refereed_match(removal_time=1.0)
+    robot = match.robots[0]
+    place(match, 0, (30, 300))
+    run(match, 0.2)
+    assert [(call.rule, call.robot) for call in judge.calls] == [("out of bounds", 0)]
+    assert 0 in judge.removed
+    assert robot.sprite.shape not in match.space.shapes
+    assert not judge.fieldBB.contains_vect(robot.sprite.body.position)
+
+    run(match, 1.0)
+    assert judge.calls[-1].rule == "return" and judge.calls[-1].robot == 0
+    assert judge.removed == {}
+    assert robot.sprite.shape in match.space.shapes
+    spot = judge.calls[-1].position
+    assert spot in [tuple(candidate) for candidate in judge.spots]
+    assert robot.sprite.body.position.get_distance(spot) < 5
+
+
+def test_multiple_defense_removes_the_robot_furthest_from_goal():
+    match, judge = refereed_match()
+    bottom = judge.penaltyAreas[0]
+    goal = judge.goals[0]
+    place(match, 0, (goal.x - 30, bottom.bottom + 10))
+    place(match, 1, (goal.x + 30, bottom.top - 10))
+    run(match, referee.PENALTY_AREA_TIME - 0.2)
+    assert judge.calls == []
+    run(match, 0.4)
+    assert [(call.rule, call.robot) for call in judge.calls] == [
+        ("multiple defense", 1)
+    ]
+
+
+def test_pushing_removes_the_robot_driving_into_the_other():
+    match, judge = refereed_match()
+    place(match, 0, (273, 400))
+    place(match, 2, (273, 470))
+    for _ in range(round((referee.PUSHING_TIME + 0.2) / match.timeStep)):
+        match.robots[0].move(300, 0)
+        match.robots[2].move(100, 3.14159)
+        match.physics_step()
+    assert [(call.rule, call.robot) for call in judge.calls] == [("pushing", 0)]
+
+
+def test_ball_without_progress_is_moved_to_a_neutral_spot():
+    match, judge = refereed_match()
+    match.ball.body.position = (150, 250)
+    run(match, referee.PROGRESS_TIME + 0.2)
+    calls = [call for call in judge.calls if call.rule == "lack of progress"]
+    assert len(calls) == 1 and calls[0].robot is None
+    assert tuple(match.ball.body.position) == tuple(judge.spots[1])
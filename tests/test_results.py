@@ -0,0 +1,37 @@
+import time
+
+from results import ResultCache, match_key
+
+
+def test_match_keys_depend_on_every_input():
+    key = match_key("examples.own", "examples.opponent", 0, 600)
+    assert key == match_key("examples.own", "examples.opponent", 0, 600)
+    others = [
+        match_key("examples.opponent", "examples.own", 0, 600),
+        match_key("examples.own", "examples.opponent", 1, 600),
+        match_key("examples.own", "examples.opponent", 0, 601),
+        match_key("examples.own", "examples.opponent", 0, 600, "5v5"),
+        match_key("examples.own", "examples.opponent", 0, 600, referee=True),
+    ]
+    assert len({key, *others}) == len(others) + 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    outcome = {"score": [0, 0]}
+    cache = ResultCache(str(tmp_path))
+    cache.put("a", outcome)
+    size = cache.size
+    # room for two entries
+    cache = ResultCache(str(tmp_path), max_bytes=2 * size)
+    time.sleep(0.01)
+    cache.put("b", outcome)
+    time.sleep(0.01)
+    assert cache.get("a") == outcome
+    time.sleep(0.01)
+    cache.put("c", outcome)
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert not (tmp_path / "b.json").exists()
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    # the entries left are found again once reopened
+    assert len(ResultCache(str(tmp_path))) == 2
@@ -0,0 +1,90 @@
+import copy
+import json
+import os
+
+import pytest
+
+from scenario import SCENARIO_DIR, compile_scenario, load_scenario
+
+
+def default_spec():
+    with open(os.path.join(SCENARIO_DIR, "default.json")) as file:
+        return json.load(file)
+
+
+def test_extends_merges_objects_and_replaces_the_rest(tmp_path):
+    path = tmp_path / "moved_ball.json"
+    path.write_text(
+        json.dumps(
+            {
+                "extends": "default",
+                "ball": {"position": [100, 200]},
+                "teams": [
+                    {"robot": "own", "spawns": [[273, 200]]},
+                    {"robot": "opponent", "spawns": [[273, 500]]},
+                ],
+            }
+        )
+    )
+    default = load_scenario("default")
+    extended = load_scenario(str(path))
+    assert extended.ball.position == (100, 200)
+    # the rest of the ball comes from the default scenario
+    assert extended.ball.mass == default.ball.mass
+    assert extended.ball.jitter == default.ball.jitter
+    assert extended.teamSizes == [1, 1]
+    assert [group.name for group in extended.groups] == [
+        group.name for group in default.groups
+    ]
+    assert extended.digest != default.digest
+
+
+def without(spec, *keys):
+    for key in keys[:-1]:
+        spec = spec[key]
+    del spec[keys[-1]]
+
+
+@pytest.mark.parametrize(
+    "change, message",
+    [
+        (lambda spec: spec.update(scale=0), "scale must be a positive number"),
+        (lambda spec: without(spec, "field"), "missing 'field'"),
+        (lambda spec: without(spec, "filters", "goal"), "unknown filter 'goal'"),
+        (
+            lambda spec: spec["static"][0].update(material="ice"),
+            "unknown material 'ice'",
+        ),
+        (
+            lambda spec: spec.update(
+                static=[
+                    group for group in spec["static"] if group["name"] != "penaltyLines"
+                ]
+            ),
+            "no static group named penaltyLines",
+        ),
+        (
+            lambda spec: spec["goals"][0].update(mouth="left"),
+            "mouth must be top or bottom",
+        ),
+        (lambda spec: spec["goals"][0].update(scoredBy=2), "scoredBy must be 0 or 1"),
+        (lambda spec: spec["teams"].pop(), "expected 2 teams"),
+        (
+            lambda spec: spec["teams"][1].update(spawns=[]),
+            "a team needs at least one robot",
+        ),
+        (lambda spec: spec["ball"].update(position=[1, 2, 3]), "expected [x, y]"),
+    ],
+)
+def test_invalid_scenarios_are_rejected(change, message):
+    spec = copy.deepcopy(default_spec())
+    change(spec)
+    with pytest.raises(ValueError) as error:
+        compile_scenario(spec, "broken")
+    assert message in str(error.value)
+    assert str(error.value).startswith("broken")
+
+
+def test_default_scenario_compiles():
+    template = compile_scenario(default_spec(), "default")
+    assert template.teamSizes == load_scenario("default").teamSizes
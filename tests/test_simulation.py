@@ -0,0 +1,11 @@
+import program
+from simulation import Match
+
+
+def test_missing_programs_are_skipped():
+    match = Match(program.CONFIG, program.attack, None, None, program.o_defend, seed=0)
+    match.run(10)
+    assert match.steps == 10
+    stats = match.program_stats()
+    assert stats["attack"]["calls"] == 10
+    assert stats["defend"]["calls"] == 0
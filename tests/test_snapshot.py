@@ -0,0 +1,57 @@
+import program
+from observation import Observation
+from simulation import Match
+from referee import Referee
+from snapshot import MatchPool, restore_snapshot, take_snapshot
+from tools import *
+
+
+@uses_observation
+def idle(observation: Observation) -> None:
+    pass
+
+
+def test_restore_replays_goal_and_kickoff():
+    match = Match(program.CONFIG, idle, idle, idle, idle, seed=3)
+    match.run(5)
+    # put the ball in the mouth of the top goal, scored by the own team in the next step
+    match.ball.body.position = match.goalSensors[1].bb.center()
+    snapshot = take_snapshot(match)
+
+    match.run(5)
+    score, goals = list(match.score), list(match.goals)
+    kickoff = match.ball.body.position
+    assert score == [1, 0] and len(goals) == 1
+
+    restore_snapshot(match, snapshot)
+    assert match.score == [0, 0] and match.goals == []
+    match.run(5)
+    assert match.score == score
+    assert match.goals == goals
+    assert match.ball.body.position == kickoff
+
+
+def test_restore_across_referee_removal():
+    pool = MatchPool(1, program.CONFIG, None, None, None, None, seed=0, referee=True)
+    match = Match(program.CONFIG, None, None, None, None, seed=0)
+    referee = Referee(match)
+    match.run(5)
+    before = take_snapshot(match)
+    referee.remove_robot(0, "out of bounds")
+    match.run(5)
+    after = take_snapshot(match)
+
+    restore_snapshot(match, before)
+    robot = match.robots[0]
+    assert robot.sprite.body.space is match.space and referee.removed == {}
+    assert referee.calls == []
+
+    fork = pool.fork(after)
+    robot = fork.robots[0]
+    assert robot.sprite.body.space is None
+    assert fork.referee.removed == after.referee[1]
+    assert [call.rule for call in fork.referee.calls] == ["out of bounds"]
+    # the robot comes back once its removal time is over, counted from the original removal
+    fork.run(fork.referee.removed[0] - fork.steps + fork.referee.interval)
+    assert robot.sprite.body.space is fork.space and fork.referee.removed == {}
+    assert fork.referee.counts()["return"] == 1
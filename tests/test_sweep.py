@@ -0,0 +1,54 @@
+import random
+
+from sweep import SweepPoint, grid_points, random_points, successive_halving
+
+
+def test_grid_covers_every_combination_of_levels():
+    points = grid_points({"speed": (0.0, 1.0), "curve": (2, 4)}, 3)
+    assert [point.params for point in points] == [
+        {"speed": speed, "curve": curve}
+        for speed in (0.0, 0.5, 1.0)
+        for curve in (2, 3, 4)
+    ]
+
+
+def test_grid_merges_repeated_integer_values():
+    points = grid_points({"count": (1, 2)}, 5)
+    assert [point.params for point in points] == [{"count": 1}, {"count": 2}]
+    # a single level is the middle of the range
+    assert grid_points({"speed": (0.0, 1.0)}, 1)[0].params == {"speed": 0.5}
+
+
+def test_random_points_stay_in_their_ranges():
+    ranges = {"speed": (0.5, 1.5), "count": (1, 10)}
+    points = random_points(ranges, 50, random.Random(0))
+    assert points == random_points(ranges, 50, random.Random(0))
+    for point in points:
+        assert 0.5 <= point.params["speed"] <= 1.5
+        assert (
+            isinstance(point.params["count"], int) and 1 <= point.params["count"] <= 10
+        )
+
+
+class ScoreBySpeed:
+    """Stands in for a Sweep, scoring a point by its speed on every seed not played yet."""
+
+    def __init__(self):
+        self.played = []
+
+    def evaluate(self, points, seeds):
+        for point in points:
+            for seed in seeds[len(point.scores) :]:
+                self.played.append((point.params["speed"], seed))
+                point.scores.append(point.params["speed"])
+
+
+def test_successive_halving_keeps_the_best_points():
+    sweep = ScoreBySpeed()
+    points = [SweepPoint({"speed": speed}) for speed in (0.1, 0.4, 0.3, 0.2)]
+    best, seeds = successive_halving(sweep, points, list(range(8)), min_seeds=2, eta=2)
+    assert [point.params["speed"] for point in best] == [0.4]
+    assert seeds == list(range(8)) and len(best[0].scores) == 8
+    # 4 points on 2 seeds, the best 2 on 4 seeds, the best one on 8 seeds, every match played once
+    assert len(sweep.played) == 4 * 2 + 2 * 2 + 1 * 4
+    assert len(set(sweep.played)) == len(sweep.played)
@@ -0,0 +1,16 @@
+import timings
+from timings import Timings
+
+
+def test_nested_time_is_left_out_of_the_enclosing_phase(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(timings.timeit, "default_timer", lambda: now[0])
+    timed = Timings()
+    timed.start()
+    now[0] = 3.0
+    # 2 of the 3 seconds were spent reading sensors
+    timed.add_nested("tof", 2.0)
+    timed.mark("attack")
+    stats = timed.stats()
+    assert stats["tof"]["max"] == 2.0
+    assert stats["attack"]["max"] == 1.0
@@ -0,0 +1,43 @@
+import math
+
+import numpy as np
+import pymunk
+
+import program
+from simulation import TOF_MASK, TOF_RANGE, Match
+
+
+def idle_match() -> Match:
+    return Match(program.CONFIG, None, None, None, None, seed=0)
+
+
+def test_readings_do_not_depend_on_other_robots():
+    alone, together = idle_match(), idle_match()
+    for step in range(30):
+        # robot 1 is only read in the steps robot 0 is not
+        if step % 2:
+            together.sensors.tof(1)
+        else:
+            assert np.array_equal(alone.sensors.tof(0), together.sensors.tof(0))
+        alone.physics_step()
+        together.physics_step()
+
+
+def test_raycasts_match_segment_queries():
+    match = idle_match()
+    match.tofSensors.noise = 0
+    readings = match.sensors.tof()
+    for idx, robot in enumerate(match.robots):
+        body = robot.sprite.body
+        shape_filter = pymunk.ShapeFilter(
+            group=robot.sprite.shape.filter.group, mask=TOF_MASK
+        )
+        for axis in range(4):
+            direction = pymunk.Vec2d(0, TOF_RANGE).rotated(
+                body.angle - axis * math.pi / 2
+            )
+            hit = match.space.segment_query_first(
+                body.position, body.position + direction, 0, shape_filter
+            )
+            expected = TOF_RANGE if hit is None else hit.alpha * TOF_RANGE
+            assert math.isclose(readings[idx, axis], expected)
@@ -0,0 +1,45 @@
+import pytest
+
+from recorder import load
+from tournament import run_match, run_tournament, summarise
+
+BROKEN = """
+from program import CONFIG
+
+
+def attack(robots, detectLine, ballPosition, robotPositions, dribble, kick):
+    raise ValueError("broken")
+
+
+def defend(robots, detectLine, ballPosition, robotPositions, dribble, kick):
+    pass
+"""
+
+
+@pytest.fixture
+def broken(tmp_path, monkeypatch):
+    (tmp_path / "broken_programs.py").write_text(BROKEN)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return "broken_programs"
+
+
+def test_match_without_steps():
+    result = run_match("examples.own", "examples.opponent", 0, 0)
+    assert result.steps == 0 and result.possession == [0, 0]
+
+
+def test_recording_is_closed_when_the_match_fails(broken, tmp_path):
+    with pytest.raises(ValueError):
+        run_match(broken, "examples.opponent", 0, 10, record_dir=str(tmp_path))
+    header, data = load(str(tmp_path / f"{broken}-examples.opponent-0.rec"))
+    assert header["frames"] == 1 and len(data) == 1
+
+
+def test_failed_match_does_not_stop_the_tournament(broken):
+    results = list(
+        run_tournament(["examples.own", broken], ["examples.opponent"], [0], 30, 2)
+    )
+    errors = {result.own: result.error for result in results}
+    assert errors["examples.own"] is None
+    assert "ValueError: broken" in errors[broken]
+    assert list(summarise(results)) == [("examples.own", "examples.opponent")]
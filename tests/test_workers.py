@@ -0,0 +1,90 @@
+import time
+
+import example
+import examples.opponent
+import examples.own
+import program
+from simulation import Match
+from tools import *
+
+PROGRAMS = (
+    example.CONFIG,
+    examples.own.attack,
+    examples.own.defend,
+    examples.opponent.o_attack,
+    examples.opponent.o_defend,
+)
+
+
+@uses_observation
+def slow(observation):
+    time.sleep(0.05)
+
+
+@uses_observation
+def failing(observation):
+    if observation.step % 2:
+        raise ValueError("boom")
+    for robot in observation.robots:
+        robot.move(300, 0)
+
+
+def play(steps, *programs, **kwargs):
+    # long enough not to time out on a loaded machine, unless a test times out on purpose
+    kwargs.setdefault("program_timeout", 5)
+    match = Match(*programs, seed=1, quiet_workers=True, **kwargs)
+    try:
+        match.run(steps)
+        return match.read_bodies(), match.program_stats(), match.programList
+    finally:
+        match.close()
+
+
+def test_isolated_program_plays_like_in_process():
+    bodies, _, _ = play(120, *PROGRAMS)
+    isolated, stats, _ = play(120, *PROGRAMS, isolate=["attack"])
+    assert isolated == bodies
+    assert (stats["attack"]["errors"], stats["attack"]["timeouts"]) == (0, 0)
+
+
+def test_parallel_matches_are_deterministic():
+    match = Match(*PROGRAMS, seed=1, quiet_workers=True, parallel=True)
+    assert len(match.isolated) == 4
+    match.close()
+    first, stats, _ = play(120, *PROGRAMS, parallel=True)
+    second, _, _ = play(120, *PROGRAMS, parallel=True)
+    assert first == second
+    for name in ("attack", "defend", "o_attack", "o_defend"):
+        assert stats[name]["calls"] == 120
+        assert (stats[name]["errors"], stats[name]["timeouts"]) == (0, 0)
+
+
+def test_slow_isolated_programs_time_out():
+    start = time.perf_counter()
+    _, stats, _ = play(
+        20,
+        program.CONFIG,
+        slow,
+        program.defend,
+        program.o_attack,
+        program.o_defend,
+        isolate=["attack"],
+        program_timeout=0.005,
+    )
+    assert stats["attack"]["timeouts"] > 0
+    # the match does not wait for every run of the program
+    assert time.perf_counter() - start < 20 * 0.05
+
+
+def test_isolated_errors_are_counted():
+    _, stats, programList = play(
+        10,
+        program.CONFIG,
+        failing,
+        program.defend,
+        program.o_attack,
+        program.o_defend,
+        isolate=["attack"],
+    )
+    assert stats["attack"]["errors"] == 5
+    assert "ValueError: boom" in programList[0].lastError
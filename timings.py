@@ -0,0 +1,134 @@
+"""Timing of the phases of a step (and of drawing), kept as rolling histograms.
+
+Timing is off unless a Timings object is given to a Match (match.timings) or a window, so when disabled the
+only cost is a check for None around each phase.
+"""
+
+import csv
+import json
+import timeit
+from typing import Dict, List
+
+import numpy as np
+
+# phases in the order they happen, for display
+PHASES = [
+    "input",
+    "sprites",
+    "attack",
+    "defend",
+    "o_attack",
+    "o_defend",
+    "tof",
+    "slopes",
+    "physics",
+    "draw",
+]
+PERCENTILES = (50, 95, 99)
+
+
+class Timings:
+    """Rolling window of the most recent durations of each named phase.
+
+    A phase is timed either from start() to mark(phase), or by passing a duration to add(phase, seconds).
+    A duration timed during another phase is passed to add_nested(phase, seconds) instead.
+    Each mark() also starts timing the next phase, so consecutive phases only need one mark each.
+    """
+
+    def __init__(self, window: int = 600):
+        """
+        Args:
+            window: Number of most recent durations kept per phase.
+        """
+
+        self.window = window
+        self.samples: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, int] = {}
+        self.maximums: Dict[str, float] = {}
+        self._start: float = timeit.default_timer()
+
+    def start(self) -> None:
+        """Starts timing a phase."""
+
+        self._start = timeit.default_timer()
+
+    def mark(self, phase: str) -> None:
+        """Ends timing a phase started by start() or by the previous mark(), and starts the next one."""
+
+        now = timeit.default_timer()
+        self.add(phase, now - self._start)
+        self._start = now
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Adds a duration to a phase."""
+
+        if phase not in self.samples:
+            self.samples[phase] = np.zeros(self.window)
+            self.counts[phase] = 0
+            self.maximums[phase] = 0
+        self.samples[phase][self.counts[phase] % self.window] = seconds
+        self.counts[phase] += 1
+        if seconds > self.maximums[phase]:
+            self.maximums[phase] = seconds
+
+    def add_nested(self, phase: str, seconds: float) -> None:
+        """Adds a duration measured inside the phase being timed, and leaves it out of that phase.
+
+        The TOF sensors are read by the programs, so their time is counted once under its own phase instead of
+        also in the program reading them, and the phases still add up to the whole step.
+        """
+
+        self.add(phase, seconds)
+        self._start += seconds
+
+    def phases(self) -> List[str]:
+        """Returns the timed phases, known phases first in the order they happen."""
+
+        return [phase for phase in PHASES if phase in self.samples] + sorted(
+            phase for phase in self.samples if phase not in PHASES
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Summarises every phase over the window.
+
+        Returns: A dict mapping each phase to its count (over the whole run), mean, p50, p95, p99
+            (over the window) and max (over the whole run), in seconds.
+        """
+
+        stats = {}
+        for phase in self.phases():
+            samples = self.samples[phase][: min(self.counts[phase], self.window)]
+            percentiles = np.percentile(samples, PERCENTILES)
+            stats[phase] = {
+                "count": self.counts[phase],
+                "mean": float(samples.mean()),
+                **{
+                    f"p{percentile}": float(value)
+                    for percentile, value in zip(PERCENTILES, percentiles)
+                },
+                "max": self.maximums[phase],
+            }
+        return stats
+
+    def lines(self) -> List[str]:
+        """Returns a line of text per phase, in milliseconds, for display."""
+
+        return [
+            f"{phase}: p50 {stat['p50'] * 1000:.3f} p95 {stat['p95'] * 1000:.3f} "
+            f"p99 {stat['p99'] * 1000:.3f} max {stat['max'] * 1000:.3f}"
+            for phase, stat in self.stats().items()
+        ]
+
+    def dump(self, path: str) -> None:
+        """Writes the stats to a file, as JSON if the path ends in .json, else as CSV."""
+
+        stats = self.stats()
+        with open(path, "w", newline="") as file:
+            if path.endswith(".json"):
+                json.dump(stats, file, indent=2)
+                return
+            fields = ["count", "mean", *(f"p{p}" for p in PERCENTILES), "max"]
+            writer = csv.writer(file)
+            writer.writerow(["phase", *fields])
+            for phase, stat in stats.items():
+                writer.writerow([phase, *(stat[field] for field in fields)])
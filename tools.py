@@ -1,21 +1,39 @@
 # vector functions
 import math
-from dataclasses import dataclass
-from typing import Callable, List, Optional, Tuple, Union
+import struct
+from typing import (
+    Callable,
+    Dict,
+    List,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-import arcade
 import pymunk
+from pymunk._chipmunk_cffi import lib
+
+from observation import Observation, ObservationProgramType, uses_observation
 
 __all__ = [
     "SCREEN_WIDTH",
     "SCREEN_HEIGHT",
     "SCREEN_TITLE",
     "PymunkSprite",
+    "image_size",
     "Robot",
     "ProgramType",
+    "Observation",
+    "ObservationProgramType",
+    "uses_observation",
+    "control_rate",
     "rel_vec_to_point",
     "vec_to_world",
     "make_vec_from_polar",
+    "rel_vec_to_point_into",
+    "make_vec_from_polar_into",
 ]
 
 # constants
@@ -23,10 +41,58 @@ SCREEN_WIDTH = 546
 SCREEN_HEIGHT = 729
 SCREEN_TITLE = "Cup"
 
+# (width, height) of every image, so that bodies can be built without reading image files (see image_size)
+IMAGE_SIZES: Dict[str, Tuple[int, int]] = {
+    "images/robot.png": (2758, 2531),
+    "images/enemy.png": (3724, 3429),
+    "images/ball.png": (1054, 1053),
+    "images/field.jpg": (822, 617),
+}
+
+
+# images
+def image_size(filename: str) -> Tuple[int, int]:
+    """Returns the (width, height) of an image in pixels, without decoding it.
+
+    Sizes come from IMAGE_SIZES, or the first time an image missing from it is asked for,
+    from the header of the image (PNG or JPEG).
+
+    Args:
+        filename: Path of the image.
+    """
+
+    if filename not in IMAGE_SIZES:
+        with open(filename, "rb") as file:
+            data = file.read()
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            IMAGE_SIZES[filename] = struct.unpack(">II", data[16:24])
+        elif data[:2] == b"\xff\xd8":
+            # walk the JPEG segments up to the start of frame, which holds the height then the width
+            idx = 2
+            while data[idx + 1] not in (0xC0, 0xC1, 0xC2):
+                idx += 2 + struct.unpack(">H", data[idx + 2 : idx + 4])[0]
+            height, width = struct.unpack(">HH", data[idx + 5 : idx + 9])
+            IMAGE_SIZES[filename] = (width, height)
+        else:
+            raise ValueError(f"{filename} is neither a PNG nor a JPEG image")
+    return IMAGE_SIZES[filename]
+
+
 # classes
-# We need a Sprite and a Pymunk physics object. This class blends them together.
-class PymunkSprite(arcade.Sprite):
-    """An arcade.Sprite object that contains a pymunk object"""  # TODO: not sure if this is correct
+class PymunkSprite:
+    """A pymunk body and box shape, sized after the image it is drawn with.
+
+    The size of the box comes from image_size, so no image is read to build it. Nothing here needs arcade:
+    the window draws every PymunkSprite with a sprite of its own (see BodySprite in window.py).
+
+    Attributes:
+        filename: Path of the image.
+        scale: Scale of the image, in pixels of the field per pixel of the image.
+        body: The pymunk.Body.
+        shape: The pymunk.Poly box of the body.
+    """
+
+    __slots__ = ("filename", "scale", "body", "shape")
 
     def __init__(
         self,
@@ -36,9 +102,11 @@ class PymunkSprite(arcade.Sprite):
         center_x: float = 0,
         center_y: float = 0,
     ):
-        super().__init__(filename, scale=scale, center_x=center_x, center_y=center_y)
-        width = self.texture.width * scale
-        height = self.texture.height * scale
+        self.filename = filename
+        self.scale = scale
+        width, height = image_size(filename)
+        width *= scale
+        height *= scale
 
         moment = pymunk.moment_for_box(mass, (width, height))
         self.body = pymunk.Body(mass, moment, body_type=pymunk.Body.DYNAMIC)
@@ -47,7 +115,6 @@ class PymunkSprite(arcade.Sprite):
         self.shape.friction = 0.8
 
 
-@dataclass
 class Robot:  # TODO: improve docstring, especially attributes
     """A container for robots.
 
@@ -55,6 +122,9 @@ class Robot:  # TODO: improve docstring, especially attributes
     It also has some useful attributes where information about the robot are stored.
     (only useful attributes are listed below, [actually even for those i'm not very sure...])
 
+    Robots have fixed slots instead of a __dict__, so programs cannot add attributes to them
+    (keep state in the program module instead).
+
     Attributes:
         direction: Direction robot is facing, referenced in code.
         speed: Speed robot is travelling at, referenced in code.
@@ -62,46 +132,71 @@ class Robot:  # TODO: improve docstring, especially attributes
         orientation: Orientation of robot, referenced in code.
         dribbleState: State of dribbler, 0 for none, 1 for front, 2 for back, referenced in code.
         chaseState: Chase state for programming purposes, referenced in code.
-        TOFReadings: (fake) TOF sensor readings, clockwise starting from front. [front, right, back, left]
-            Currently calculated based on coordinate position of the robot.
-            # TODO: Make TOF sensor readings more realistic, maybe add some noise 🙃
+        TOFReadings: TOF sensor readings, clockwise starting from front. [front, right, back, left]
+            Distance from the centre of the robot to the nearest wall, goal or robot along each of its axes,
+            with some noise (see TOFSensors in simulation.py). In a Match, this reads the readings of the
+            step in place, without copying them (see LazyTOFReadings in simulation.py).
     """
 
-    filename: str
-    scale: float
-    mass: float
-    center_x: float = 0
-    center_y: float = 0
-    direction: float = 0
-    speed: float = 500
-    angle: float = 0
-    orientation: float = math.pi
-    dribbleState: int = 0
-    chaseState: int = 0
-    TOFReadings: Optional[List[float]] = None
-    targetPointBody: Optional[pymunk.Body] = None
-
-    def __post_init__(self):
-        self.sprite = PymunkSprite(
-            self.filename, self.scale, self.mass, self.center_x, self.center_y
-        )
-        self.TOFReadings = [
-            SCREEN_HEIGHT - self.center_y,
-            SCREEN_WIDTH - self.center_x,
-            self.center_y,
-            self.center_x,
+    __slots__ = (
+        "filename",
+        "scale",
+        "mass",
+        "center_x",
+        "center_y",
+        "direction",
+        "speed",
+        "angle",
+        "orientation",
+        "dribbleState",
+        "chaseState",
+        "TOFReadings",
+        "targetPointBody",
+        "sprite",
+    )
+
+    def __init__(
+        self,
+        filename: str,
+        scale: float,
+        mass: float,
+        center_x: float = 0,
+        center_y: float = 0,
+        direction: float = 0,
+        speed: float = 500,
+        angle: float = 0,
+        orientation: float = math.pi,
+        dribbleState: int = 0,
+        chaseState: int = 0,
+    ):
+        self.filename = filename
+        self.scale = scale
+        self.mass = mass
+        self.center_x = center_x
+        self.center_y = center_y
+        self.direction = direction
+        self.speed = speed
+        self.angle = angle
+        self.orientation = orientation
+        self.dribbleState = dribbleState
+        self.chaseState = chaseState
+        self.sprite = PymunkSprite(filename, scale, mass, center_x, center_y)
+        self.TOFReadings: Sequence[float] = [
+            SCREEN_HEIGHT - center_y,
+            SCREEN_WIDTH - center_x,
+            center_y,
+            center_x,
         ]
         self.targetPointBody = pymunk.Body(
             float("inf"), float("inf"), pymunk.Body.STATIC
         )
 
-        # temporary workaround for https://youtrack.jetbrains.com/issue/PY-28549
-        self.direction = self.direction
-        self.speed = self.speed
-        self.angle = self.angle
-        self.orientation = self.orientation
-        self.dribbleState = self.dribbleState
-        self.chaseState = self.chaseState
+    def __repr__(self) -> str:
+        return (
+            f"Robot(filename={self.filename!r}, position={self.sprite.body.position}, "
+            f"orientation={self.orientation}, dribbleState={self.dribbleState}, "
+            f"chaseState={self.chaseState})"
+        )
 
     def flick(self, direction: int) -> None:
         """Makes the robot flick the ball in the back dribbler.
@@ -128,9 +223,11 @@ class Robot:  # TODO: improve docstring, especially attributes
             direction: A float representing the direction that the robot should travel in (in radians).
         """
 
-        self.targetPointBody.velocity = make_vec_from_polar(
-            speed,
-            direction,
+        # same as make_vec_from_polar, setting the velocity through chipmunk without building a Vec2d
+        angle = math.pi / 2 - direction
+        lib.cpBodySetVelocity(
+            self.targetPointBody._body,
+            (speed * math.cos(angle), speed * math.sin(angle)),
         )
 
     def turn(self, angle: float) -> None:
@@ -144,22 +241,41 @@ class Robot:  # TODO: improve docstring, especially attributes
 
 
 # types
-ProgramType = (
-    Callable[
-        [
-            List[Robot],
-            Callable[[Robot], pymunk.Vec2d],
-            pymunk.Vec2d,
-            List[pymunk.Vec2d],
-            Callable[[Robot], None],
-            Callable[[Robot], None],
-        ],
-        None,
+ProgramType = Callable[
+    [
+        List[Robot],
+        Callable[[Robot], pymunk.Vec2d],
+        pymunk.Vec2d,
+        List[pymunk.Vec2d],
+        Callable[[Robot], None],
+        Callable[[Robot], None],
     ],
-)
+    None,
+]
 
 
 # functions
+def control_rate(hz: float) -> Callable[[ProgramType], ProgramType]:
+    """Returns a decorator declaring how many times per second a program runs (60 by default).
+
+    Between runs, its robots keep their last move and turn commands, and keep dribbling if they were.
+
+    Args:
+        hz: Control loop frequency of the program.
+
+    Example:
+        @control_rate(30)
+        def attack(robots, detectLine, ballPosition, robotPositions, dribble, kick):
+            ...
+    """
+
+    def decorator(program: ProgramType) -> ProgramType:
+        program.controlRate = hz
+        return program
+
+    return decorator
+
+
 def rel_vec_to_point(
     body: pymunk.Body,
     point: Union[pymunk.Vec2d, Tuple[float, float]] = pymunk.Vec2d(0, 0),
@@ -200,3 +316,43 @@ def make_vec_from_polar(mag: float = 0, angle: float = 0) -> pymunk.Vec2d:
     angle = math.pi / 2 - angle
     vec = pymunk.Vec2d(mag * math.cos(angle), mag * math.sin(angle))
     return vec
+
+
+def rel_vec_to_point_into(
+    out: MutableSequence[float],
+    body: pymunk.Body,
+    point: Union[pymunk.Vec2d, Tuple[float, float]],
+) -> MutableSequence[float]:
+    """Writes the relative position of a point from the position of a body into a buffer, and returns it.
+
+    Same values as rel_vec_to_point (which does not rotate the vector either), without building a Vec2d.
+
+    Args:
+        out: Buffer of at least 2 floats (a list or numpy array) to write x and y to.
+        body: The reference pymunk.Body, usually a robot.
+        point: Any point in the world, as a pymunk.Vec2d or a tuple.
+    """
+
+    x, y = body.position
+    out[0] = point[0] - x
+    out[1] = point[1] - y
+    return out
+
+
+def make_vec_from_polar_into(
+    out: MutableSequence[float], mag: float = 0, angle: float = 0
+) -> MutableSequence[float]:
+    """Writes the coordinate of a polar coordinate into a buffer, and returns it.
+
+    Same values as make_vec_from_polar, without building a Vec2d.
+
+    Args:
+        out: Buffer of at least 2 floats (a list or numpy array) to write x and y to.
+        mag: A float representing radial distance.
+        angle: A float representing polar angle (in radians).
+    """
+
+    angle = math.pi / 2 - angle
+    out[0] = mag * math.cos(angle)
+    out[1] = mag * math.sin(angle)
+    return out
@@ -0,0 +1,415 @@
+"""Runs matches between programs without a window, spread over a process pool.
+
+Own program modules provide `attack` and `defend`, opponent program modules provide `o_attack` and `o_defend`
+(and optionally `CONFIG`). Every own module plays every opponent module once per seed.
+
+Example:
+    python tournament.py --own examples.own --opponents examples.opponent --seeds 0 1 2 3
+"""
+
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+import timeit
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from recorder import Recorder
+from referee import Referee
+from results import ResultCache, match_key, open_cache
+from simulation import Match
+
+
+@dataclass
+class MatchResult:
+    """Outcome of a single headless match.
+
+    Attributes:
+        own: Name of the module providing the own programs.
+        opponent: Name of the module providing the opponent programs.
+        seed: Seed of the match.
+        steps: Number of physics steps played.
+        goals: Goals scored, as [own, opponent].
+        possession: Fraction of steps in which each team dribbled the ball, as [own, opponent].
+        runtime: Wall clock time taken to play the match (in seconds).
+        programs: Time taken by each program, see Match.program_stats.
+        referee: Number of calls the referee made for each rule, see Referee.counts.
+        cached: Whether the result was read from a ResultCache instead of playing the match
+            (runtime and programs are then those of the match that was played).
+        error: The exception the match raised, formatted, None if it was played to the end (the goals,
+            possession and stats are then empty).
+    """
+
+    own: str
+    opponent: str
+    seed: int
+    steps: int
+    goals: List[int]
+    possession: List[float]
+    runtime: float
+    programs: Dict[str, Dict[str, Any]]
+    referee: Dict[str, int] = field(default_factory=dict)
+    cached: bool = False
+    error: Optional[str] = None
+
+
+def load_programs(own: str, opponent: str) -> Tuple:
+    """Imports the programs of a pairing.
+
+    Args:
+        own: Name of the module providing `attack` and `defend`.
+        opponent: Name of the module providing `o_attack` and `o_defend`.
+
+    Returns: A tuple of (config, attack, defend, o_attack, o_defend), ready to be passed to Match.
+    """
+
+    ownModule = importlib.import_module(own)
+    opponentModule = importlib.import_module(opponent)
+    config = getattr(ownModule, "CONFIG", getattr(opponentModule, "CONFIG", {}))
+    return (
+        config,
+        ownModule.attack,
+        ownModule.defend,
+        opponentModule.o_attack,
+        opponentModule.o_defend,
+    )
+
+
+def run_match(
+    own: str,
+    opponent: str,
+    seed: int,
+    steps: int,
+    quiet: bool = True,
+    record_dir: Optional[str] = None,
+    budget: Optional[float] = None,
+    isolate: Iterable[str] = (),
+    referee: bool = True,
+    scenario: Optional[str] = None,
+) -> MatchResult:
+    """Plays a single headless match, this is what runs inside the worker processes.
+
+    Args:
+        own: Name of the module providing the own programs.
+        opponent: Name of the module providing the opponent programs.
+        seed: Seed of the match.
+        steps: Number of physics steps to play.
+        quiet: Whether to silence anything the programs print.
+        record_dir: If given, the match is recorded (see recorder.py) into a file in this directory.
+        budget: Time a run of a program should take at most (in seconds), see Match.
+        isolate: Names of the programs to run in worker processes, see Match.
+        referee: Whether a Referee (see referee.py) judges the rules.
+        scenario: Scenario to play (see scenario.py), the default one if not given.
+    """
+
+    programs = load_programs(own, opponent)
+    start_time = timeit.default_timer()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+            match = Match(
+                *programs,
+                seed=seed,
+                program_budget=budget,
+                isolate=isolate,
+                quiet_workers=quiet,
+                scenario=scenario,
+            )
+            if referee:
+                Referee(match)
+            recorder = None
+            try:
+                if record_dir is not None:
+                    recorder = Recorder(
+                        os.path.join(record_dir, f"{own}-{opponent}-{seed}.rec"), match
+                    )
+                match.run(steps)
+            finally:
+                if recorder is not None:
+                    recorder.close()
+                match.close()
+    return MatchResult(
+        own,
+        opponent,
+        seed,
+        match.steps,
+        list(match.score),
+        [x / max(match.steps, 1) for x in match.possession],
+        timeit.default_timer() - start_time,
+        match.program_stats(),
+        {} if match.referee is None else match.referee.counts(),
+    )
+
+
+def run_tournament(
+    own: Iterable[str],
+    opponents: Iterable[str],
+    seeds: Iterable[int],
+    steps: int = 60 * 60,
+    workers: Optional[int] = None,
+    record_dir: Optional[str] = None,
+    budget: Optional[float] = None,
+    isolate: Iterable[str] = (),
+    referee: bool = True,
+    cache: Optional[ResultCache] = None,
+    scenario: Optional[str] = None,
+) -> Iterator[MatchResult]:
+    """Plays every pairing of own and opponent modules for every seed, over a process pool.
+
+    Results are yielded as soon as each match finishes (not in submission order), results found in the cache
+    first. A match raising an exception does not stop the others, its result carries the error instead.
+
+    Args:
+        own: Names of the modules providing own programs.
+        opponents: Names of the modules providing opponent programs.
+        seeds: Seeds to play every pairing with.
+        steps: Number of physics steps per match (60 steps are one simulated second).
+        workers: Number of worker processes, defaults to the number of CPUs.
+        record_dir: If given, every match is recorded into a file in this directory.
+        budget: Time a run of a program should take at most (in seconds), see Match.
+        isolate: Names of the programs to run in worker processes, see Match.
+        referee: Whether a Referee judges the rules of every match.
+        cache: ResultCache to read results from, and to store new results in. Not used when recording
+            matches, or with isolated programs (whose timeouts depend on how busy the machine is).
+        scenario: Scenario to play every match in (see scenario.py), the default one if not given.
+    """
+
+    seeds = list(seeds)
+    isolate = list(isolate)
+    opponents = list(opponents)
+    if record_dir is not None or isolate:
+        cache = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for ownModule in own:
+            for opponentModule in opponents:
+                for seed in seeds:
+                    key = None
+                    if cache is not None:
+                        key = match_key(
+                            ownModule,
+                            opponentModule,
+                            seed,
+                            steps,
+                            scenario,
+                            referee=referee,
+                            budget=budget,
+                        )
+                        outcome = cache.get(key)
+                        if outcome is not None:
+                            yield MatchResult(**{**outcome, "cached": True})
+                            continue
+                    future = executor.submit(
+                        run_match,
+                        ownModule,
+                        opponentModule,
+                        seed,
+                        steps,
+                        True,
+                        record_dir,
+                        budget,
+                        isolate,
+                        referee,
+                        scenario,
+                    )
+                    futures[future] = (key, ownModule, opponentModule, seed)
+        for future in as_completed(futures):
+            key, ownModule, opponentModule, seed = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                yield MatchResult(
+                    ownModule,
+                    opponentModule,
+                    seed,
+                    0,
+                    [0, 0],
+                    [0.0, 0.0],
+                    0.0,
+                    {},
+                    error="".join(traceback.format_exception_only(type(error), error)),
+                )
+                continue
+            if cache is not None:
+                cache.put(key, asdict(result))
+            yield result
+
+
+def summarise(
+    results: Iterable[MatchResult],
+) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Aggregates match results per pairing, leaving out the matches that failed.
+
+    Returns: A dict mapping (own, opponent) to the number of matches, total goals for each side,
+        mean possession of each side, total/mean runtime, total referee calls per rule (under "referee"),
+        and for every program (under "programs") its mean and max time per run, its runs over budget,
+        timeouts and errors, and the seed of its slowest run.
+    """
+
+    summary: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for result in results:
+        if result.error is not None:
+            continue
+        pairing = summary.setdefault(
+            (result.own, result.opponent),
+            {
+                "matches": 0,
+                "goals": 0,
+                "goalsAgainst": 0,
+                "possession": 0,
+                "possessionAgainst": 0,
+                "runtime": 0,
+                "referee": {},
+                "programs": {},
+            },
+        )
+        pairing["matches"] += 1
+        pairing["goals"] += result.goals[0]
+        pairing["goalsAgainst"] += result.goals[1]
+        pairing["possession"] += result.possession[0]
+        pairing["possessionAgainst"] += result.possession[1]
+        pairing["runtime"] += result.runtime
+        for rule, count in result.referee.items():
+            pairing["referee"][rule] = pairing["referee"].get(rule, 0) + count
+        for name, stats in result.programs.items():
+            program = pairing["programs"].setdefault(
+                name,
+                {
+                    "calls": 0,
+                    "time": 0,
+                    "maxTime": 0,
+                    "slowestSeed": None,
+                    "overBudget": 0,
+                    "timeouts": 0,
+                    "errors": 0,
+                },
+            )
+            program["calls"] += stats["calls"]
+            program["time"] += stats["meanTime"] * stats["calls"]
+            program["overBudget"] += stats["overBudget"]
+            program["timeouts"] += stats["timeouts"]
+            program["errors"] += stats["errors"]
+            if stats["maxTime"] > program["maxTime"]:
+                program["maxTime"] = stats["maxTime"]
+                program["slowestSeed"] = result.seed
+    for pairing in summary.values():
+        pairing["possession"] /= pairing["matches"]
+        pairing["possessionAgainst"] /= pairing["matches"]
+        pairing["meanRuntime"] = pairing["runtime"] / pairing["matches"]
+        for program in pairing["programs"].values():
+            program["meanTime"] = program.pop("time") / max(program["calls"], 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--own", nargs="+", default=["examples.own"])
+    parser.add_argument("--opponents", nargs="+", default=["examples.opponent"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(range(8)))
+    parser.add_argument("--steps", type=int, default=60 * 60)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--record", metavar="DIR", default=None)
+    parser.add_argument(
+        "--budget", type=float, default=None, help="time per program run, in ms"
+    )
+    parser.add_argument(
+        "--isolate",
+        nargs="+",
+        default=[],
+        choices=["attack", "defend", "o_attack", "o_defend"],
+        help="programs to run in worker processes, waiting at most --budget for them",
+    )
+    parser.add_argument(
+        "--no-referee", action="store_true", help="do not judge the rules"
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        default=None,
+        help="reuse the results of matches whose programs and settings did not change",
+    )
+    parser.add_argument(
+        "--cache-size", type=float, default=64, help="size of the cache, in MB"
+    )
+    parser.add_argument(
+        "--scenario", default=None, help="scenario to play (see scenario.py)"
+    )
+    args = parser.parse_args()
+    budget = None if args.budget is None else args.budget / 1000
+    if args.record is not None:
+        os.makedirs(args.record, exist_ok=True)
+    cache = open_cache(
+        args.cache,
+        [(own, opponent) for own in args.own for opponent in args.opponents],
+        int(args.cache_size * 1024 * 1024),
+        referee=not args.no_referee,
+        scenario=args.scenario,
+    )
+
+    results = []
+    failed = 0
+    for result in run_tournament(
+        args.own,
+        args.opponents,
+        args.seeds,
+        args.steps,
+        args.workers,
+        args.record,
+        budget,
+        args.isolate,
+        not args.no_referee,
+        cache,
+        args.scenario,
+    ):
+        if result.error is not None:
+            print(
+                f"{result.own} vs {result.opponent} (seed {result.seed}): failed, {result.error}",
+                file=sys.stderr,
+                flush=True,
+            )
+            failed += 1
+            continue
+        print(
+            f"{result.own} vs {result.opponent} (seed {result.seed}): "
+            f"{result.goals[0]}-{result.goals[1]}, "
+            f"possession {result.possession[0]:.2f}/{result.possession[1]:.2f}, "
+            f"{result.runtime:.2f}s" + (" (cached)" if result.cached else ""),
+            flush=True,
+        )
+        results.append(result)
+
+    print()
+    for (own, opponent), pairing in summarise(results).items():
+        print(
+            f"{own} vs {opponent}: {pairing['matches']} matches, "
+            f"goals {pairing['goals']}-{pairing['goalsAgainst']}, "
+            f"possession {pairing['possession']:.2f}/{pairing['possessionAgainst']:.2f}, "
+            f"runtime {pairing['meanRuntime']:.2f}s per match"
+        )
+        if pairing["referee"]:
+            print(
+                "    referee: "
+                + ", ".join(
+                    f"{count} {rule}"
+                    for rule, count in sorted(pairing["referee"].items())
+                )
+            )
+        for name, program in sorted(
+            pairing["programs"].items(), key=lambda item: -item[1]["maxTime"]
+        ):
+            print(
+                f"    {name}: mean {program['meanTime'] * 1000:.3f}ms, "
+                f"max {program['maxTime'] * 1000:.3f}ms (seed {program['slowestSeed']}), "
+                f"{program['overBudget']} runs over budget, {program['timeouts']} timeouts, "
+                f"{program['errors']} errors"
+            )
+    if failed:
+        print(f"\n{failed} matches failed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
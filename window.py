@@ -0,0 +1,385 @@
+"""The simulation window, drawing a Match (see simulation.py) with arcade.
+
+This is the only module (along with replay.py) importing arcade, so headless matches never load the
+windowing stack. Sprites are built here from the bodies of a Match, with the texture of each image loaded once
+and shared (see cached_texture).
+"""
+
+import functools
+import math
+import timeit
+from typing import Dict, Optional, Tuple
+
+import arcade
+import pymunk
+
+from scenario import resolve_scenario
+from simulation import TIME_STEP, Match
+from timings import Timings
+from tools import *
+
+# keys placing the first robots in front of their goal (more robots are selected with TAB, then G)
+GOAL_KEYS = [arcade.key.Q, arcade.key.W, arcade.key.E, arcade.key.R]
+
+
+@functools.lru_cache(maxsize=None)
+def cached_texture(filename: str) -> arcade.Texture:
+    """Returns the texture of an image, loading it the first time only, so sprites of the same image share it.
+
+    Args:
+        filename: Path of the image.
+    """
+
+    return arcade.load_texture(filename)
+
+
+class BodySprite(arcade.Sprite):
+    """An arcade.Sprite drawing a PymunkSprite (see tools.py).
+
+    Attributes:
+        shape: The pymunk shape of the PymunkSprite, whose body gives the position and angle to draw at.
+    """
+
+    def __init__(self, body: PymunkSprite):
+        """
+        Args:
+            body: The PymunkSprite to draw.
+        """
+
+        position = body.body.position
+        super().__init__(scale=body.scale, center_x=position.x, center_y=position.y)
+        self.texture = cached_texture(body.filename)
+        self.shape = body.shape
+
+
+class SimWin(arcade.Window):
+    """Main Simulation Window, drawing a Match"""
+
+    def __init__(self, width, height, title):
+        """create variables"""
+
+        # init parent class
+        super().__init__(width, height, title)
+
+        # set up background
+        self.drawTimeText = None
+        arcade.set_background_color(arcade.color.AMAZON)
+        self.background: Optional[arcade.texture.Texture] = None
+
+        # simulation
+        self.match: Optional[Match] = None
+        # simulated seconds per real second
+        self.turbo: float = 1
+        # simulated time not stepped yet
+        self.accumulator: float = 0
+        # real time on_update may spend stepping physics, the remaining steps waiting for the next frames
+        self.maxStepTime: float = 0.8 * TIME_STEP
+        self.stepsPerFrame: int = 0
+        # simulated time left to step after the last frame, beyond the fraction of a step
+        self.backlog: float = 0
+
+        # lists/elements
+        self.dynamicSpriteList: Optional[arcade.SpriteList] = None
+        self.arrowsList: Optional[arcade.ShapeElementList] = None
+
+        # debug info
+        self.drawTime: float = 0
+        self.processingTime: float = 0
+        self.refreshRate: float = 0
+        self.timings: Optional[Timings] = None
+        self.showTimings: bool = False
+
+        # controls
+        self.mousePos: Tuple[float, float] = (0, 0)
+        self.key: int = 0
+        self.pause: bool = False
+        # robot moved by M and G, changed with TAB
+        self.selected: int = 0
+
+        # some arrow stuff
+        self.arrowState: int = 0
+        self.arrowStart: Tuple[float, float] = (0, 0)
+        self.arrowEnd: Tuple[float, float] = (0, 0)
+
+    def setup(
+        self,
+        config: Dict[str, bool],
+        attack: ProgramType,
+        defend: ProgramType,
+        o_attack: ProgramType,
+        o_defend: ProgramType,
+        substeps: int = 1,
+        turbo: float = 1,
+        timings: Optional[Timings] = None,
+        scenario: Optional[str] = None,
+    ):
+        """set up everything
+
+        Args:
+            substeps: Number of physics steps per frame at normal speed, see Match.
+            turbo: Simulated seconds per real second (UP/DOWN to double/halve it).
+            timings: Timings to time every phase with from the start (else press T to start timing).
+            scenario: Scenario to play (see scenario.py), the default one if not given.
+        """
+
+        # background
+        self.background: arcade.Texture = cached_texture("images/field.jpg")
+
+        # simulation
+        self.match = Match(
+            config,
+            attack,
+            defend,
+            o_attack,
+            o_defend,
+            substeps=substeps,
+            scenario=scenario,
+        )
+        self.turbo = turbo
+        self.accumulator = 0
+        self.timings = self.match.timings = timings
+
+        # lists
+        self.dynamicSpriteList = arcade.SpriteList()
+        self.arrowsList = arcade.ShapeElementList()
+        for body in [robot.sprite for robot in self.match.robots] + [self.match.ball]:
+            self.dynamicSpriteList.append(BodySprite(body))
+
+    def on_draw(self):
+        """called whenever we need to draw the window"""
+        arcade.start_render()
+        draw_start_time = timeit.default_timer()
+        arcade.draw_texture_rectangle(
+            SCREEN_WIDTH // 2,
+            SCREEN_HEIGHT // 2,
+            SCREEN_HEIGHT,
+            SCREEN_WIDTH,
+            self.background,
+            90,
+        )
+        self.dynamicSpriteList.draw()
+        if self.arrowsList:
+            self.arrowsList.draw()
+
+        """if self.match.robots[0].dribbleState == 0:
+            arcade.draw_line(
+                self.match.robots[0].sprite.body.position.x,
+                self.match.robots[0].sprite.body.position.y,
+                self.match.ball.body.position.x,
+                self.match.ball.body.position.y,
+                arcade.color.RED,
+                1,
+            )
+        else:
+            arcade.draw_line(
+                self.match.robots[0].sprite.body.position.x,
+                self.match.robots[0].sprite.body.position.y,
+                SCREEN_WIDTH / 2,
+                SCREEN_HEIGHT - 78,
+                arcade.color.RED,
+                1,
+            )"""
+
+        # display timings
+        output = f"Processing time: {self.processingTime:.3f}"
+        arcade.draw_text(output, 20, SCREEN_HEIGHT - 20, arcade.color.WHITE)
+        output = f"Drawing time: {self.drawTime:.3f}"
+        arcade.draw_text(output, 20, SCREEN_HEIGHT - 40, arcade.color.WHITE)
+        output = f"Estimated FPS: {self.refreshRate:.1f}"
+        arcade.draw_text(output, 20, SCREEN_HEIGHT - 60, arcade.color.WHITE)
+        if self.match is not None:
+            output = (
+                f"Speed: {self.turbo:g}x, {self.stepsPerFrame} steps/frame, "
+                f"selected robot {self.selected + 1}"
+                f"{f' (behind by {self.backlog:.1f}s)' if self.backlog else ''}"
+            )
+            arcade.draw_text(output, 20, SCREEN_HEIGHT - 80, arcade.color.WHITE)
+        # output = f"Mouse: {self.mousePos}"
+        # arcade.draw_text(output, 20, SCREEN_HEIGHT - 60, arcade.color.WHITE)
+        if self.showTimings and self.timings is not None:
+            for idx, output in enumerate(self.timings.lines()):
+                arcade.draw_text(
+                    output, 20, SCREEN_HEIGHT - 110 - 16 * idx, arcade.color.WHITE, 10
+                )
+
+        self.drawTime = timeit.default_timer() - draw_start_time
+        if self.timings is not None:
+            self.timings.add("draw", self.drawTime)
+
+    def on_update(self, delta_time: float):
+        self.refreshRate = 1 / delta_time
+        start_time = timeit.default_timer()
+        timings = self.timings
+        if timings is not None:
+            timings.start()
+        ball = self.match.ball
+        robots = self.match.robots
+
+        # user interaction
+        if self.key is not None and self.key > 0:
+            if self.key == arcade.MOUSE_BUTTON_RIGHT or self.key == arcade.key.B:
+                ball.body.position = pymunk.Vec2d(*self.mousePos)
+                ball.body.velocity = (0, 0)
+                print(ball.body.position)
+            elif (
+                arcade.key.KEY_1 <= self.key <= arcade.key.KEY_9
+                and self.key - arcade.key.KEY_1 < len(robots)
+            ):
+                self.move_to_mouse(self.key - arcade.key.KEY_1)
+            elif self.key == arcade.key.M:
+                self.move_to_mouse(self.selected)
+            elif self.key in GOAL_KEYS and GOAL_KEYS.index(self.key) < len(robots):
+                self.move_to_goal(GOAL_KEYS.index(self.key))
+            elif self.key == arcade.key.G:
+                self.move_to_goal(self.selected)
+            self.key = 0
+            self.match.sensors.clear()
+
+        if self.arrowState == 2:
+            self.arrowState = 0
+            self.arrowsList.append(
+                arcade.create_line(
+                    self.arrowStart[0],
+                    self.arrowStart[1],
+                    self.arrowEnd[0],
+                    self.arrowEnd[1],
+                    (255, 0, 0),
+                    2,
+                )
+            )
+            print(self.arrowsList)
+        elif self.arrowState == 3:
+            self.arrowState = 0
+            while self.arrowsList:
+                self.arrowsList.remove(self.arrowsList[0])
+        if timings is not None:
+            timings.mark("input")
+
+        if not self.pause:
+            self.advance(delta_time)
+            if timings is not None:
+                timings.start()
+
+        # update sprite positions
+        for sprite in self.dynamicSpriteList:
+            sprite.center_x = sprite.shape.body.position.x
+            sprite.center_y = sprite.shape.body.position.y
+            sprite.angle = math.degrees(sprite.shape.body.angle)
+        if timings is not None:
+            timings.mark("sprites")
+
+        self.processingTime = timeit.default_timer() - start_time
+
+    def move_to_mouse(self, idx: int):
+        """places a robot under the mouse, at rest"""
+
+        body = self.match.robots[idx].sprite.body
+        body.position = pymunk.Vec2d(*self.mousePos)
+        body.velocity = (0, 0)
+        print(body.position)
+
+    def move_to_goal(self, idx: int):
+        """places a robot in front of the goal its team defends, at rest"""
+
+        body = self.match.robots[idx].sprite.body
+        body.position = (
+            SCREEN_WIDTH / 2,
+            30 if self.match.robotTeams[idx] == 0 else SCREEN_HEIGHT - 30,
+        )
+        body.velocity = (0, 0)
+        body.angle = math.pi / 2
+
+    def advance(self, delta_time: float):
+        """steps the match by the simulated time elapsed since the last frame, in fixed physics steps
+
+        Every physics step is as long as in a headless Match, so the match plays out the same at any speed.
+        Only the number of steps per frame changes (so at high speeds, most steps are never drawn).
+        If the steps take longer than maxStepTime, the remaining steps stay in the accumulator (see backlog)
+        for the next frames, so frames are skipped rather than steps: every step of the simulated time is run,
+        and the match falls behind the requested speed (lower it with DOWN to catch up) instead of changing.
+        """
+
+        start_time = timeit.default_timer()
+        timeStep = self.match.timeStep
+        self.accumulator += delta_time * self.turbo
+        self.stepsPerFrame = 0
+        while self.accumulator >= timeStep:
+            self.match.step()
+            self.accumulator -= timeStep
+            self.stepsPerFrame += 1
+            if timeit.default_timer() - start_time > self.maxStepTime:
+                break
+        self.backlog = self.accumulator - self.accumulator % timeStep
+
+    def on_mouse_motion(self, x, y, dx, dy):
+        self.mousePos = (x, y)
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        if button == arcade.MOUSE_BUTTON_LEFT:
+            if self.arrowState == 0:
+                self.arrowStart = (x, y)
+            elif self.arrowState == 1:
+                self.arrowEnd = (x, y)
+            self.arrowState += 1
+        else:
+            self.key = button
+
+    def on_key_press(self, key, modifiers):
+        self.key = key
+        if key == arcade.key.P:
+            self.pause = not self.pause
+        elif key == arcade.key.ESCAPE:
+            self.arrowState = 3
+        elif key == arcade.key.UP:
+            self.turbo *= 2
+        elif key == arcade.key.DOWN:
+            self.turbo /= 2
+        elif key == arcade.key.TAB:
+            # select the next robot (the previous one with shift), for M and G
+            step = -1 if modifiers & arcade.key.MOD_SHIFT else 1
+            self.selected = (self.selected + step) % len(self.match.robots)
+        elif key == arcade.key.T:
+            # timing only starts once it is first shown
+            self.showTimings = not self.showTimings
+            if self.timings is None:
+                self.timings = self.match.timings = Timings()
+        else:
+            self.key = key
+
+
+def main(
+    config: Dict[str, bool],
+    attack: ProgramType,
+    defend: ProgramType,
+    o_attack: ProgramType,
+    o_defend: ProgramType,
+    substeps: int = 1,
+    turbo: float = 1,
+    timings_file: Optional[str] = None,
+    scenario: Optional[str] = None,
+):
+    """Opens the simulation window and runs a match in it.
+
+    Args:
+        substeps: Number of physics steps per frame at normal speed, see Match.
+        turbo: Simulated seconds per real second, e.g. 4 to watch a match at 4x speed.
+        timings_file: If given, every phase is timed from the start and the timings are written to this file
+            (JSON if it ends in .json, else CSV) when the window is closed. Press T to show them.
+        scenario: Scenario to play (see scenario.py), the default one if not given. Its field must be the size
+            of the window (SCREEN_WIDTH by SCREEN_HEIGHT), scaled fields can only be played headless.
+    """
+
+    template = resolve_scenario(scenario)
+    if (template.width, template.height) != (SCREEN_WIDTH, SCREEN_HEIGHT):
+        raise ValueError(
+            f"{template.name}: the window only draws fields of {SCREEN_WIDTH}x{SCREEN_HEIGHT}, "
+            "play it headless instead"
+        )
+    window = SimWin(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
+    timings = Timings() if timings_file else None
+    window.setup(
+        config, attack, defend, o_attack, o_defend, substeps, turbo, timings, scenario
+    )
+    arcade.run()
+    if timings is not None:
+        timings.dump(timings_file)
@@ -0,0 +1,407 @@
+"""Runs programs in worker processes, so that a slow or stuck program cannot stall a match,
+and so that several programs can run at once.
+
+A worker keeps its program (and any state the program keeps in its module) alive for the whole match,
+along with stand-ins for the robots it controls. The module is the worker's own copy: programs in other
+workers or in the main process never see that state. Every step in which programs run, the match writes a single
+observation of everything the programs can read into shared memory (see ObservationBuffer) and tells every
+due worker to run; the workers copy the observation, run their program against the stand-ins and answer with
+the commands the program gave, in order (see apply_commands). The match applies the commands of every
+program in the order of Match.programList, so the outcome does not depend on which worker finishes first,
+and the physics never leaves the main process.
+
+Programs are called exactly like in the main process: robots have the same attributes (positions and angles
+are read from robot.sprite.body), and detectLine, dribble and kick are given the same way. detectLine and the
+TOF readings are measured before the run, and dribble updates dribbleState straight away using the same
+catchment areas as Match.dribble (see dribble_zone), so programs reading it right after dribbling still work.
+Observation.neighbours is computed from the positions in the observation (see nearest_robots).
+Unlike in the main process, every program sees the state at the start of the step, not the commands given
+by the programs before it.
+"""
+
+import multiprocessing
+import os
+import sys
+import timeit
+import traceback
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+import pymunk
+
+from observation import Observation, ObservationState, legacy_adapter, nearest_robots
+from simulation import Match, ScheduledProgram, dribble_zone
+from tools import *
+
+__all__ = ["ObservationBuffer", "ProgramWorker", "ProgramError", "apply_commands"]
+
+Command = Tuple[Any, ...]
+
+# layout of an observation: the step, the ball position and velocity, then a row of ROBOT_FIELDS per robot,
+# then the sequence number of the slot
+HEADER_FIELDS = 5
+ROBOT_FIELDS = 18  # body (x, y, vx, vy, angle, angular velocity), 6 Robot attributes, 4 TOF, line (x, y)
+# observations are written to alternate slots, so that a worker still copying the previous one is rarely
+# overwritten (see ObservationBuffer)
+SLOTS = 2
+
+
+class _BodyProxy:
+    """Stand-in for the pymunk.Body of a robot, with the values read by programs."""
+
+    __slots__ = ("position", "velocity", "angle", "angular_velocity")
+
+    def __init__(self):
+        self.position = pymunk.Vec2d(0, 0)
+        self.velocity = pymunk.Vec2d(0, 0)
+        self.angle = 0.0
+        self.angular_velocity = 0.0
+
+
+class _SpriteProxy:
+    __slots__ = ("body",)
+
+    def __init__(self):
+        self.body = _BodyProxy()
+
+
+class _RobotProxy:
+    """Stand-in for a Robot in a worker process, recording the commands given to it."""
+
+    __slots__ = (
+        "index",
+        "commands",
+        "sprite",
+        "direction",
+        "speed",
+        "angle",
+        "orientation",
+        "dribbleState",
+        "chaseState",
+        "TOFReadings",
+        "lineDirection",
+    )
+
+    def __init__(self, index: int, commands: List[Command]):
+        self.index = index
+        self.commands = commands
+        self.sprite = _SpriteProxy()
+        self.TOFReadings: List[float] = []
+        self.lineDirection = pymunk.Vec2d(0, 0)
+
+    def flick(self, direction: int) -> None:
+        self.commands.append(("flick", self.index, direction))
+
+    def move(self, speed: float = 0, direction: float = 0) -> None:
+        self.commands.append(("move", self.index, speed, direction))
+
+    def turn(self, angle: float) -> None:
+        self.commands.append(("turn", self.index, angle))
+
+
+class ObservationBuffer:
+    """Shared memory holding the latest observation of a match, written by the match and read by workers.
+
+    The last value of every slot is a sequence number, odd while the slot is being written and increased
+    again once it is complete. A worker that is late enough for the match to write to its slot again sees the
+    number change while copying the slot, and copies it again (getting the newer observation, see read).
+
+    Attributes:
+        array: (SLOTS, HEADER_FIELDS + robots * ROBOT_FIELDS + 1) array of observations.
+        slot: Slot of the latest observation.
+    """
+
+    def __init__(self, robotCount: int):
+        """
+        Args:
+            robotCount: Number of robots in the match.
+        """
+
+        self.robotCount = robotCount
+        self.shape = (SLOTS, HEADER_FIELDS + robotCount * ROBOT_FIELDS + 1)
+        self.shared = multiprocessing.get_context().RawArray(
+            "d", self.shape[0] * self.shape[1]
+        )
+        self.array = np.frombuffer(self.shared).reshape(self.shape)
+        self.slot = 0
+
+    def write(self, match: Match) -> int:
+        """Writes what every program can read in the current step into the next slot.
+
+        Args:
+            match: The Match to observe.
+
+        Returns: The slot written to.
+        """
+
+        values = [match.steps, *match.ball.body.position, *match.ball.body.velocity]
+        readings = match.sensors.tof()
+        for idx, robot in enumerate(match.robots):
+            body = robot.sprite.body
+            values += (
+                *body.position,
+                *body.velocity,
+                body.angle,
+                body.angular_velocity,
+                robot.direction,
+                robot.speed,
+                robot.angle,
+                robot.orientation,
+                robot.dribbleState,
+                robot.chaseState,
+                *readings[idx].tolist(),
+                *match.line(robot),
+            )
+        self.slot = (self.slot + 1) % SLOTS
+        row = self.array[self.slot]
+        row[-1] += 1
+        row[:-1] = values
+        row[-1] += 1
+        return self.slot
+
+    @staticmethod
+    def read(array: np.ndarray, slot: int) -> List[float]:
+        """Copies a complete observation out of a slot, waiting for the match if it is writing to it.
+
+        Args:
+            array: The array of an ObservationBuffer (shared with the worker).
+            slot: The slot to read.
+
+        Returns: The values of the observation, without the sequence number.
+        """
+
+        while True:
+            sequence = array[slot, -1]
+            observation = array[slot].tolist()
+            if sequence % 2 == 0 and array[slot, -1] == sequence:
+                return observation[:-1]
+
+
+def apply_commands(
+    match: Match, scheduled: ScheduledProgram, commands: List[Command]
+) -> None:
+    """Applies the commands given by a program in its worker, in the order they were given.
+
+    Args:
+        match: The Match the program plays in.
+        scheduled: The ScheduledProgram that gave the commands.
+        commands: Commands from the worker, each a tuple of (name, robot index, *arguments).
+    """
+
+    for name, idx, *args in commands:
+        robot = match.robots[idx]
+        if name == "state":
+            (
+                robot.direction,
+                robot.speed,
+                robot.angle,
+                robot.orientation,
+                robot.chaseState,
+            ) = args
+        elif name == "move":
+            robot.move(*args)
+        elif name == "turn":
+            robot.turn(*args)
+        elif name == "flick":
+            robot.flick(*args)
+        elif name == "dribble":
+            match.dribble(robot)
+        elif name == "kick":
+            match.kick(robot)
+        else:
+            raise ValueError(f"unknown command {name!r} from {scheduled.name}")
+
+
+class ProgramError(RuntimeError):
+    """An exception raised by a program in its worker process.
+
+    Attributes:
+        details: The traceback of the exception, as formatted in the worker.
+    """
+
+    def __init__(self, details: str):
+        super().__init__(f"program failed in its worker:\n{details}")
+        self.details = details
+
+
+def _serve(
+    program: ProgramType,
+    indices: List[int],
+    shared,
+    shape: Tuple[int, int],
+    connection,
+    quiet: bool,
+) -> None:
+    """Main loop of a worker process: runs the program every time it is sent the slot of an observation."""
+
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    observations = np.frombuffer(shared).reshape(shape)
+    robotCount = (shape[1] - HEADER_FIELDS - 1) // ROBOT_FIELDS
+    commands: List[Command] = []
+    robots = [_RobotProxy(idx, commands) for idx in indices]
+    ballPosition = pymunk.Vec2d(0, 0)
+    call = legacy_adapter(
+        program,
+        lambda: (ballPosition, [pymunk.Vec2d(*body[:2]) for body in bodies[1:]]),
+    )
+
+    def detect_line(robot: _RobotProxy) -> pymunk.Vec2d:
+        return robot.lineDirection
+
+    def dribble(robot: _RobotProxy) -> None:
+        robot_to_ball = ballPosition - robot.sprite.body.position
+        robot.dribbleState = dribble_zone(
+            vec_to_world(robot_to_ball), robot_to_ball.length
+        )
+        commands.append(("dribble", robot.index))
+
+    def kick(robot: _RobotProxy) -> None:
+        commands.append(("kick", robot.index))
+
+    state = ObservationState(robotCount)
+
+    def neighbours(robot: _RobotProxy, radius: float) -> List[Tuple[int, float]]:
+        return nearest_robots(state.bodies[1:, :2], robot.index, radius)
+
+    programObservation = Observation(
+        state, robots, list(indices), detect_line, dribble, kick, neighbours
+    )
+
+    while True:
+        slot = connection.recv()
+        if slot is None:
+            break
+        observation = ObservationBuffer.read(observations, slot)
+
+        step = int(observation[0])
+        ballPosition = pymunk.Vec2d(observation[1], observation[2])
+        bodies = [observation[1:5] + [0, 0]]
+        for idx in range(robotCount):
+            start = HEADER_FIELDS + idx * ROBOT_FIELDS
+            bodies.append(observation[start : start + 6])
+        state.update(step, bodies)
+        for robot in robots:
+            start = HEADER_FIELDS + robot.index * ROBOT_FIELDS
+            (
+                x,
+                y,
+                vx,
+                vy,
+                robot.sprite.body.angle,
+                robot.sprite.body.angular_velocity,
+                robot.direction,
+                robot.speed,
+                robot.angle,
+                robot.orientation,
+                dribbleState,
+                chaseState,
+            ) = observation[start : start + 12]
+            robot.sprite.body.position = pymunk.Vec2d(x, y)
+            robot.sprite.body.velocity = pymunk.Vec2d(vx, vy)
+            robot.dribbleState = int(dribbleState)
+            robot.chaseState = int(chaseState)
+            robot.TOFReadings = observation[start + 12 : start + 16]
+            robot.lineDirection = pymunk.Vec2d(*observation[start + 16 : start + 18])
+
+        commands.clear()
+        start_time = timeit.default_timer()
+        try:
+            call(programObservation)
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+            continue
+        seconds = timeit.default_timer() - start_time
+        for robot in robots:
+            commands.append(
+                (
+                    "state",
+                    robot.index,
+                    robot.direction,
+                    robot.speed,
+                    robot.angle,
+                    robot.orientation,
+                    robot.chaseState,
+                )
+            )
+        connection.send(("result", list(commands), seconds, step))
+
+
+class ProgramWorker:
+    """A worker process running a single program, see the module docstring.
+
+    Attributes:
+        busy: Whether the worker is running the program and has not been asked for the result yet.
+    """
+
+    def __init__(
+        self,
+        program: ProgramType,
+        indices: List[int],
+        buffer: ObservationBuffer,
+        quiet: bool = False,
+    ):
+        """Starts the worker process.
+
+        Args:
+            program: The program to run, it must be picklable (a module-level function) unless processes
+                are forked.
+            indices: Indices (in Match.robots) of the robots passed to the program.
+            buffer: The ObservationBuffer the match writes observations to.
+            quiet: Whether the program prints to os.devnull instead of the standard output.
+        """
+
+        context = multiprocessing.get_context()
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve,
+            args=(program, indices, buffer.shared, buffer.shape, child, quiet),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.busy = False
+
+    def submit(self, slot: int) -> None:
+        """Starts a run of the program.
+
+        Args:
+            slot: Slot of the ObservationBuffer to run the program on.
+        """
+
+        self.connection.send(slot)
+        self.busy = True
+
+    def result(self, timeout: Optional[float] = None) -> Optional[Tuple]:
+        """Waits for the result of the current run.
+
+        Args:
+            timeout: Time to wait (in seconds), None to wait as long as it takes.
+
+        Returns: A tuple of (commands, time taken by the program, step of the observation),
+            or None if the program did not finish in time (it keeps running, ask again later).
+
+        Raises:
+            ProgramError: The program raised an exception, the worker is ready for the next run.
+        """
+
+        if not self.connection.poll(timeout):
+            return None
+        message = self.connection.recv()
+        self.busy = False
+        if message[0] == "error":
+            raise ProgramError(message[1])
+        return message[1:]
+
+    def close(self) -> None:
+        """Stops the worker process, killing it if the program is still running."""
+
+        if self.process.is_alive():
+            if self.busy:
+                self.process.terminate()
+            else:
+                self.connection.send(None)
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+        self.connection.close()